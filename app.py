@@ -12,7 +12,10 @@ import random
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
+from event_log import EventLog
+from interaction_store import InteractionStore
 from kappa_processor_mongodb import KappaProcessorMongoDB
+from local_storage import LocalStorage
 
 st.set_page_config(
     page_title="Recomendador Kappa - MongoDB",
@@ -40,17 +43,35 @@ def get_mongodb_uri():
 def load_processor():
     mongodb_uri = get_mongodb_uri()
     
-    if not mongodb_uri:
+    # Sin MongoDB: almacenamiento local SQLite (scripts/create_local_storage.py)
+    local_db = os.getenv('KAPPA_LOCAL_DB')
+    storage = LocalStorage(local_db) if local_db else None
+    
+    if not mongodb_uri and storage is None:
         st.error("No se encontró la configuración de MongoDB. Ver documentación.")
         st.stop()
     
-    processor = KappaProcessorMongoDB(mongodb_uri)
+    # Log local de eventos: los encolados sobreviven a un reinicio
+    event_log_dir = os.getenv('KAPPA_EVENT_LOG_DIR')
+    
+    # Snapshot memmap compartido entre procesos: arranque en segundos
+    processor = KappaProcessorMongoDB(
+        mongodb_uri,
+        snapshot_dir=os.getenv('KAPPA_SNAPSHOT_DIR', '.snapshots'),
+        interactions=InteractionStore(os.getenv('KAPPA_INTERACTION_LAYOUT', 'raw')),
+        storage=storage,
+        event_log=EventLog(event_log_dir) if event_log_dir else None
+    )
     
     if not processor.load_data_from_mongodb():
         st.error("Error cargando datos desde MongoDB. Verifica la conexión.")
         st.stop()
     
     processor.start_processing()
+    # Altas/bajas de canciones sin reiniciar la app
+    processor.start_catalog_watcher(
+        poll_interval=float(os.getenv('KAPPA_CATALOG_POLL_INTERVAL', '5'))
+    )
     return processor
 
 # Estado de sesión
@@ -300,9 +321,21 @@ track_popularity:
 with tab3:
     st.header("Canciones Trending en Tiempo Real")
     
-    st.markdown("Popularidad calculada desde interacciones guardadas en MongoDB")
+    st.markdown("Interacciones recientes con decaimiento exponencial (las más nuevas pesan más)")
+    
+    windows = {'Última hora': 'hour', 'Último día': 'day', 'Total': 'all'}
+    col1, col2 = st.columns(2)
+    with col1:
+        window_label = st.radio("Ventana", list(windows), index=1, horizontal=True)
+    with col2:
+        genre_options = ['Todos'] + sorted(processor.catalog.genre_lookup)
+        genre_label = st.selectbox("Género", genre_options)
     
-    trending = processor.get_trending_tracks(top_n=20)
+    trending = processor.get_trending_tracks(
+        top_n=20,
+        window=windows[window_label],
+        genre=None if genre_label == 'Todos' else genre_label
+    )
     
     if trending:
         for idx, track in enumerate(trending, 1):
@@ -320,7 +353,7 @@ with tab3:
                     st.caption(f"Género: {track['track_genre']}")
                 
                 with col4:
-                    st.metric("🔥", track['popularity'])
+                    st.metric("🔥", f"{track['trend_score']:.1f}")
                 
                 st.divider()
     else:
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Reporte de recall@10 de los backends ANN contra el coseno exacto.
+Usa el CSV original (sin muestreo) para elegir n_probe / n_tables con datos.
+"""
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from neighbor_index import NeighborIndex
+
+AUDIO_FEATURES = [
+    'danceability', 'energy', 'key', 'loudness', 'mode',
+    'speechiness', 'acousticness', 'instrumentalness',
+    'liveness', 'valence', 'tempo'
+]
+
+SETTINGS = [
+    ('ivf', {'n_probe': 4}),
+    ('ivf', {'n_probe': 8}),
+    ('ivf', {'n_probe': 16}),
+    ('ivf', {'n_probe': 32}),
+    ('lsh', {'n_tables': 4}),
+    ('lsh', {'n_tables': 8}),
+    ('lsh', {'n_tables': 16}),
+]
+
+
+def run_report(csv_path, n_neighbors, sample_size, limit=None):
+    print("\n=== Reporte de recall ANN ===\n")
+    print("Leyendo CSV...")
+    df = pd.read_csv(csv_path).drop_duplicates('track_id')
+    if limit:
+        df = df.head(limit)
+    print(f"Canciones: {len(df):,}\n")
+
+    features = StandardScaler().fit_transform(df[AUDIO_FEATURES].fillna(0))
+
+    results = []
+    for backend, options in SETTINGS:
+        index = NeighborIndex(n_neighbors=n_neighbors, backend=backend, ann_options=options)
+        index.build(features)
+        report = index.recall_report(k=10, sample_size=sample_size)
+        results.append(report)
+        print(f"{backend:4} {json.dumps(options):20} "
+              f"recall@10={report['recall@10']:.3f}  "
+              f"consulta={report['query_ms']:.3f} ms  "
+              f"exacto={report['exact_query_ms']:.3f} ms  "
+              f"build={report['build_seconds']:.1f}s")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--csv', default='data/dataset.csv')
+    parser.add_argument('--neighbors', type=int, default=50)
+    parser.add_argument('--sample', type=int, default=1000, help="consultas evaluadas")
+    parser.add_argument('--limit', type=int, default=None, help="usar solo las primeras N filas")
+    parser.add_argument('--json', default=None, help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    results = run_report(args.csv, args.neighbors, args.sample, args.limit)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
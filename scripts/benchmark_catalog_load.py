@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tiempo y memoria de la carga del catálogo desde MongoDB.
+Compara la lectura completa (find({}) + list + DataFrame) con la lectura con
+proyección por lotes de read_catalog. Cada modo corre en un proceso nuevo
+porque el pico de RSS de un proceso no baja.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from pymongo import MongoClient
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from catalog_loader import peak_rss_mb, read_catalog
+from content_model import AUDIO_FEATURES
+
+
+def load_full(tracks):
+    """Carga anterior: todos los campos, lista de documentos y luego DataFrame"""
+    started = time.perf_counter()
+    tracks_df = pd.DataFrame(list(tracks.find({})))
+    tracks_df = tracks_df.drop('_id', axis=1)
+    return tracks_df, {
+        'documents': len(tracks_df),
+        'load_seconds': time.perf_counter() - started,
+        'dataframe_mb': float(tracks_df.memory_usage(deep=True).sum()) / 1e6,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_mode(uri, database, mode, batch_size):
+    client = MongoClient(uri, serverSelectionTimeoutMS=10000)
+    tracks = client[database]['tracks']
+    baseline_mb = peak_rss_mb()
+    if mode == 'full':
+        _, stats = load_full(tracks)
+    else:
+        _, stats = read_catalog(tracks, AUDIO_FEATURES, batch_size=batch_size)
+    client.close()
+
+    stats['mode'] = mode
+    stats['baseline_rss_mb'] = baseline_mb
+    return stats
+
+
+def run_isolated(uri, database, mode, batch_size):
+    """Ejecuta un modo en un subproceso y devuelve sus resultados"""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    try:
+        subprocess.run(
+            [sys.executable, __file__, uri, '--database', database, '--mode', mode,
+             '--batch-size', str(batch_size), '--json', output],
+            check=True
+        )
+        with open(output) as f:
+            return json.load(f)[0]
+    finally:
+        os.remove(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('uri', help="URI de MongoDB")
+    parser.add_argument('--database', default='spotify_kappa')
+    parser.add_argument('--mode', choices=['lean', 'full', 'both'], default='both')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--json', default=None, help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    if args.mode == 'both':
+        results = [run_isolated(args.uri, args.database, mode, args.batch_size)
+                   for mode in ['full', 'lean']]
+    else:
+        results = [run_mode(args.uri, args.database, args.mode, args.batch_size)]
+
+    if args.mode == 'both' or not args.json:
+        print(f"\n{'modo':6} {'docs':>9} {'tiempo':>8} {'DataFrame':>10} {'pico RSS':>9}")
+        for stats in results:
+            print(f"{stats['mode']:6} {stats['documents']:>9,} {stats['load_seconds']:>7.1f}s "
+                  f"{stats['dataframe_mb']:>8.1f}MB {stats['peak_rss_mb'] or 0:>7.0f}MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
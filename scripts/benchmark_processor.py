@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga del procesador (sin interfaz).
+Genera usuarios, canciones y eventos sintéticos, mide el throughput de
+ingesta con varios productores concurrentes, la latencia (p50/p95/p99) de
+get_recommendations, get_trending_tracks, get_user_profile y get_stats, y la
+memoria. Corre contra un mongod local (--uri), contra mongomock en memoria
+(--in-memory) o sin red con el almacenamiento SQLite (--local). Con --baseline compara con un resultado anterior y termina
+con código 1 si hay regresiones.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmark_recommendations import percentiles, synthetic_catalog
+from catalog_loader import peak_rss_mb
+from event_log import EventLog
+from interaction_stats import InteractionStats
+from kappa_processor_mongodb import KappaProcessorMongoDB
+from local_storage import LocalStorage
+from neighbor_index import NeighborIndex
+
+DEFAULT_MIX = {'play': 0.7, 'like': 0.2, 'skip': 0.1}
+DEFAULT_QUERY_MIX = {'recommendations': 0.6, 'trending': 0.2, 'profile': 0.15, 'stats': 0.05}
+
+
+def parse_mix(text):
+    """'play=0.7,like=0.2,skip=0.1' → dict normalizado"""
+    mix = {}
+    for item in text.split(','):
+        name, value = item.split('=')
+        mix[name.strip()] = float(value)
+    total = sum(mix.values())
+    return {name: value / total for name, value in mix.items()}
+
+
+def connect(uri, in_memory, database):
+    """(client, db) limpios para el benchmark"""
+    if in_memory:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("--in-memory necesita mongomock (pip install mongomock)")
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(uri, serverSelectionTimeoutMS=10000)
+    # Base de datos propia del benchmark: se vacía en cada ejecución
+    client.drop_database(database)
+    return client, client[database]
+
+
+def open_local(path):
+    """LocalStorage limpio (un archivo del benchmark se borra en cada ejecución)"""
+    if path != ':memory:':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return LocalStorage(path)
+
+
+def seed_catalog(db, n_tracks):
+    tracks_df = synthetic_catalog(n_tracks)
+    records = tracks_df.to_dict('records')
+    for start in range(0, len(records), 5000):
+        db['tracks'].insert_many(records[start:start + 5000], ordered=False)
+    db['tracks'].create_index('track_id', unique=True)
+    return tracks_df['track_id'].tolist()
+
+
+def seed_local_catalog(storage, n_tracks):
+    tracks_df = synthetic_catalog(n_tracks)
+    storage.upsert_tracks(tracks_df.to_dict('records'))
+    return tracks_df['track_id'].tolist()
+
+
+class LoadGenerator:
+    """Usuarios con actividad sesgada (Zipf) y canciones con popularidad sesgada"""
+
+    def __init__(self, track_ids, n_users, mix, seed=0):
+        self.track_ids = np.asarray(track_ids)
+        self.user_ids = np.array([f"bench_user_{i}" for i in range(n_users)])
+        self.types = np.array(list(mix))
+        self.type_probs = np.array(list(mix.values()))
+        self.seed = seed
+
+    def _zipf_index(self, rng, n, size):
+        return (rng.zipf(1.3, size) - 1) % n
+
+    def events(self, count, worker):
+        rng = np.random.default_rng(self.seed + worker)
+        users = self.user_ids[self._zipf_index(rng, len(self.user_ids), count)]
+        tracks = self.track_ids[self._zipf_index(rng, len(self.track_ids), count)]
+        types = self.types[rng.choice(len(self.types), count, p=self.type_probs)]
+        return list(zip(users.tolist(), tracks.tolist(), types.tolist()))
+
+    def queries(self, count, worker, query_mix):
+        rng = np.random.default_rng(self.seed + 1000 + worker)
+        names = np.array(list(query_mix))
+        kinds = names[rng.choice(len(names), count, p=list(query_mix.values()))]
+        tracks = self.track_ids[self._zipf_index(rng, len(self.track_ids), count)]
+        users = self.user_ids[self._zipf_index(rng, len(self.user_ids), count)]
+        # La mitad de las recomendaciones son personalizadas
+        with_user = rng.random(count) < 0.5
+        return list(zip(kinds.tolist(), tracks.tolist(), users.tolist(), with_user.tolist()))
+
+
+def split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def run_ingest(processor, generator, n_events, concurrency):
+    """Productores concurrentes de add_event; espera a que todo se procese y se escriba"""
+    def produce(worker, count):
+        latencies = []
+        for user_id, track_id, interaction_type in generator.events(count, worker):
+            started = time.perf_counter()
+            processor.add_event(user_id, track_id, interaction_type)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    processed_before = processor.pipeline_metrics.snapshot()['events_processed']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(produce, range(concurrency), split(n_events, concurrency)))
+    accepted_seconds = time.perf_counter() - started
+
+    # Fin a fin: procesado por los workers y escrito en MongoDB
+    while processor.pipeline_metrics.snapshot()['events_processed'] - processed_before < n_events:
+        time.sleep(0.01)
+    processed_seconds = time.perf_counter() - started
+    if processor.event_log is not None:
+        # Con el log, la escritura en MongoDB llega hasta el offset confirmado
+        processor.sync_to_storage()
+    processor.event_writer.flush()
+    written_seconds = time.perf_counter() - started
+
+    latencies = [latency for worker_latencies in results for latency in worker_latencies]
+    return {
+        'events': n_events,
+        'concurrency': concurrency,
+        'accepted_per_second': n_events / accepted_seconds,
+        'processed_per_second': n_events / processed_seconds,
+        'written_per_second': n_events / written_seconds,
+        'add_event': percentiles(latencies),
+    }
+
+
+def run_queries(processor, generator, n_queries, concurrency, query_mix, top_n):
+    operations = {
+        'recommendations': lambda track_id, user_id, with_user: processor.get_recommendations(
+            track_id, user_id if with_user else None, top_n
+        ),
+        'trending': lambda track_id, user_id, with_user: processor.get_trending_tracks(top_n),
+        'profile': lambda track_id, user_id, with_user: processor.get_user_profile(user_id),
+        'stats': lambda track_id, user_id, with_user: processor.get_stats(),
+    }
+
+    def query(worker, count):
+        latencies = {name: [] for name in query_mix}
+        for kind, track_id, user_id, with_user in generator.queries(count, worker, query_mix):
+            started = time.perf_counter()
+            operations[kind](track_id, user_id, with_user)
+            latencies[kind].append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(query, range(concurrency), split(n_queries, concurrency)))
+    seconds = time.perf_counter() - started
+
+    summary = {'queries': n_queries, 'concurrency': concurrency, 'queries_per_second': n_queries / seconds}
+    for name in query_mix:
+        samples = [latency for worker_latencies in results for latency in worker_latencies[name]]
+        if samples:
+            summary[name] = {'count': len(samples), **percentiles(samples)}
+    return summary
+
+
+def run_background_ingest(processor, generator, stop_event, rate):
+    """Eventos a ritmo constante mientras corren las consultas (--mixed)"""
+    events = generator.events(max(int(rate * 600), 1), worker=99)
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    for user_id, track_id, interaction_type in events:
+        if stop_event.is_set():
+            return
+        processor.add_event(user_id, track_id, interaction_type)
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_benchmark(args):
+    if args.local:
+        backend = 'sqlite'
+    else:
+        backend = 'mongomock' if args.in_memory else 'mongodb'
+    target = args.local if args.local else args.uri
+    print(f"\n=== Benchmark del procesador ({backend if backend == 'mongomock' else target}) ===\n")
+    client = storage = None
+    if args.local:
+        storage = open_local(args.local)
+        track_ids = seed_local_catalog(storage, args.tracks)
+    else:
+        client, db = connect(args.uri, args.in_memory, args.database)
+        track_ids = seed_catalog(db, args.tracks)
+    baseline_rss = peak_rss_mb()
+
+    processor = KappaProcessorMongoDB(
+        args.uri, database_name=args.database, storage=storage,
+        neighbor_index=NeighborIndex(backend=args.backend),
+        interaction_stats=InteractionStats(reconcile_interval=3600),
+        event_log=EventLog(args.event_log) if args.event_log else None,
+        collaborative_weight=args.collaborative_weight, n_workers=args.workers
+    )
+    if client is not None:
+        processor.client, processor.db = client, db
+
+    started = time.perf_counter()
+    processor.load_data_from_mongodb()
+    load_seconds = time.perf_counter() - started
+    processor.start_processing()
+    print(f"Modelo cargado en {load_seconds:.1f}s ({len(track_ids):,} canciones)")
+
+    generator = LoadGenerator(track_ids, args.users, args.mix)
+    results = {
+        'config': {
+            'backend': backend,
+            'tracks': args.tracks, 'users': args.users, 'mix': args.mix,
+            'query_mix': args.query_mix, 'workers': args.workers,
+            'concurrency': args.concurrency, 'top_n': args.top_n,
+            'event_log': bool(args.event_log),
+            'collaborative_weight': args.collaborative_weight,
+        },
+        'load_seconds': load_seconds,
+    }
+
+    results['ingest'] = run_ingest(processor, generator, args.events, args.concurrency)
+    print(f"Ingesta: {results['ingest']['processed_per_second']:,.0f} eventos/s procesados, "
+          f"add_event p99={results['ingest']['add_event']['p99_ms']:.2f} ms")
+
+    stop_event = threading.Event()
+    background = None
+    if args.mixed:
+        background = threading.Thread(
+            target=run_background_ingest, args=(processor, generator, stop_event, args.mixed_rate),
+            daemon=True
+        )
+        background.start()
+    results['queries'] = run_queries(
+        processor, generator, args.queries, args.concurrency, args.query_mix, args.top_n
+    )
+    results['queries']['mixed_events_per_second'] = args.mixed_rate if args.mixed else 0
+    stop_event.set()
+    if background is not None:
+        background.join()
+    for name in args.query_mix:
+        if name in results['queries']:
+            q = results['queries'][name]
+            print(f"{name:16} p50={q['p50_ms']:.3f} ms  p95={q['p95_ms']:.3f} ms  p99={q['p99_ms']:.3f} ms")
+
+    stats = processor.get_stats()
+    results['cache_hit_rate'] = stats['cache_hit_rate']
+    results['pipeline'] = processor.get_pipeline_metrics()
+    results['memory'] = {
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss_mb(),
+        'neighbor_index_mb': processor.neighbor_index.nbytes / 1e6,
+    }
+    print(f"Memoria: pico RSS {results['memory']['peak_rss_mb'] or 0:.0f} MB")
+
+    processor.close()
+    if client is not None:
+        client.drop_database(args.database)
+    return results
+
+
+# Métricas comparadas con --baseline: (ruta, mayor es mejor, cambio absoluto
+# mínimo para contar como regresión: evita falsos positivos en latencias de µs)
+REGRESSION_METRICS = [
+    (('ingest', 'processed_per_second'), True, 0),
+    (('ingest', 'add_event', 'p99_ms'), False, 1.0),
+    (('queries', 'recommendations', 'p95_ms'), False, 1.0),
+    (('queries', 'trending', 'p95_ms'), False, 1.0),
+    (('queries', 'profile', 'p95_ms'), False, 1.0),
+    (('queries', 'stats', 'p95_ms'), False, 1.0),
+    (('memory', 'peak_rss_mb'), False, 50),
+]
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for path, higher_is_better, min_change in REGRESSION_METRICS:
+        current, previous = results, baseline
+        for key in path:
+            current = current.get(key) if isinstance(current, dict) else None
+            previous = previous.get(key) if isinstance(previous, dict) else None
+        if not current or not previous or abs(current - previous) < min_change:
+            continue
+        change = (current - previous) / previous
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append({'metric': '.'.join(path), 'baseline': previous,
+                                'current': current, 'change': change})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017', help="URI de un mongod local")
+    parser.add_argument('--in-memory', action='store_true', help="usar mongomock en vez de MongoDB")
+    parser.add_argument('--local', nargs='?', const=':memory:', default=None, metavar='PATH',
+                        help="almacenamiento SQLite sin red (en memoria o en PATH)")
+    parser.add_argument('--database', default='spotify_kappa_benchmark',
+                        help="base de datos del benchmark (se borra al empezar y al terminar)")
+    parser.add_argument('--tracks', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="tipos de evento, p. ej. play=0.7,like=0.2,skip=0.1")
+    parser.add_argument('--query-mix', type=parse_mix, default=DEFAULT_QUERY_MIX,
+                        help="p. ej. recommendations=0.6,trending=0.2,profile=0.15,stats=0.05")
+    parser.add_argument('--concurrency', type=int, default=8, help="threads productores/consultores")
+    parser.add_argument('--workers', type=int, default=2, help="workers del procesador")
+    parser.add_argument('--event-log', default=None, metavar='DIR',
+                        help="usar el log local de eventos en este directorio (vacío)")
+    parser.add_argument('--collaborative-weight', type=float, default=0.3,
+                        help="peso del modelo colaborativo (0 = solo contenido)")
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--backend', default='auto')
+    parser.add_argument('--mixed', action='store_true', help="ingesta de fondo durante las consultas")
+    parser.add_argument('--mixed-rate', type=float, default=500.0, help="eventos/s de la ingesta de fondo")
+    parser.add_argument('--json', default=None, help="guardar resultados en este archivo")
+    parser.add_argument('--baseline', default=None, help="JSON de una ejecución anterior")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="cambio relativo permitido")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results['regressions'] = find_regressions(results, json.load(f), args.tolerance)
+        for regression in results['regressions']:
+            print(f"REGRESIÓN {regression['metric']}: {regression['baseline']:.3f} → "
+                  f"{regression['current']:.3f} ({regression['change']:+.0%})")
+        exit_code = 1 if results['regressions'] else 0
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"\nResultados guardados en {args.json}")
+    sys.exit(exit_code)
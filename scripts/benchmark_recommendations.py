@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark de latencia de get_recommendations sobre un catálogo sintético.
+No necesita MongoDB: construye el modelo directamente desde un DataFrame.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from content_model import AUDIO_FEATURES
+from kappa_processor_mongodb import KappaProcessorMongoDB
+from neighbor_index import NeighborIndex
+
+
+def synthetic_catalog(n_tracks, n_genres=114, seed=0):
+    """Catálogo sintético con las mismas columnas que la colección tracks"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.standard_normal((n_tracks, len(AUDIO_FEATURES))), columns=AUDIO_FEATURES)
+    df['track_id'] = [f"track_{i}" for i in range(n_tracks)]
+    df['track_name'] = [f"Canción {i}" for i in range(n_tracks)]
+    df['artists'] = [f"Artista {i % 5000}" for i in range(n_tracks)]
+    df['track_genre'] = [f"genero_{i % n_genres}" for i in range(n_tracks)]
+    return df
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'mean_ms': float(samples.mean()),
+    }
+
+
+def run_benchmark(n_tracks, n_queries, top_n, ann_backend):
+    print(f"\n=== Benchmark get_recommendations ({n_tracks:,} canciones) ===\n")
+    processor = KappaProcessorMongoDB(mongodb_uri=None, neighbor_index=NeighborIndex(backend=ann_backend))
+
+    started = time.perf_counter()
+    processor.build_from_dataframe(synthetic_catalog(n_tracks))
+    build_seconds = time.perf_counter() - started
+    print(f"Modelo construido en {build_seconds:.1f}s "
+          f"(índice {processor.neighbor_index.active_backend})")
+
+    rng = np.random.default_rng(1)
+    # Popularidad aleatoria para que el boost no sea trivial
+    processor.popularity.array[:] = rng.integers(0, 50, n_tracks)
+
+    seeds = rng.choice(processor.catalog.track_ids, n_queries)
+    liked_genres = {f"genero_{i}" for i in range(0, 114, 7)}
+
+    results = {
+        'n_tracks': n_tracks,
+        'n_queries': n_queries,
+        'top_n': top_n,
+        'backend': processor.neighbor_index.active_backend,
+        'build_seconds': build_seconds,
+    }
+    for name, liked in [('sin_usuario', set()), ('con_generos', liked_genres)]:
+        latencies = []
+        for track_id in seeds:
+            started = time.perf_counter()
+            processor.recommender.recommend(processor.catalog.row(track_id), top_n, liked)
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[name] = percentiles(latencies)
+        print(f"{name:12} p50={results[name]['p50_ms']:.3f} ms  "
+              f"p99={results[name]['p99_ms']:.3f} ms")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--backend', default='auto')
+    parser.add_argument('--json', default=None, help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.tracks, args.queries, args.top_n, args.backend)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
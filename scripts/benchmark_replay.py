@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Throughput del replay de interacciones.
+Sin URI mide la agregación vectorizada (ReplayAggregator) con eventos
+sintéticos en memoria; con URI ejecuta el replay completo contra MongoDB
+sin publicar la versión.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from derived_state import INTERACTION_WEIGHTS
+from event_replay import ReplayAggregator, replay_interactions
+from interaction_store import INTERACTION_LAYOUTS, InteractionStore
+
+
+def synthetic_batches(events, batch_size, users, tracks, seed=0):
+    rng = np.random.default_rng(seed)
+    types = np.array(['play', 'like', 'skip'])
+    start = datetime.now().timestamp() - events
+    for offset in range(0, events, batch_size):
+        n = min(batch_size, events - offset)
+        yield pd.DataFrame({
+            'user_id': pd.Series(rng.integers(0, users, n)).map('user_{}'.format),
+            'track_id': pd.Series(rng.integers(0, tracks, n)).map('track_{}'.format),
+            'interaction_type': types[rng.choice(3, n, p=[0.7, 0.2, 0.1])],
+            'timestamp': pd.to_datetime(start + offset + np.arange(n), unit='s'),
+        })
+
+
+def benchmark_memory(events, batch_size, users, tracks):
+    genres = {f'track_{i}': f'genre_{i % 100}' for i in range(tracks)}
+    aggregator = ReplayAggregator(INTERACTION_WEIGHTS, genres)
+
+    # La generación de datos no cuenta en el tiempo de agregación
+    aggregate_seconds = 0.0
+    for batch in synthetic_batches(events, batch_size, users, tracks):
+        started = time.perf_counter()
+        aggregator.add_events(batch)
+        aggregate_seconds += time.perf_counter() - started
+
+    started = time.perf_counter()
+    popularity = sum(1 for _ in aggregator.popularity_docs())
+    profiles = sum(1 for _ in aggregator.profile_docs())
+    output_seconds = time.perf_counter() - started
+
+    return {
+        'mode': 'memory',
+        'events': events,
+        'batch_size': batch_size,
+        'users': profiles,
+        'tracks': popularity,
+        'aggregate_seconds': aggregate_seconds,
+        'events_per_second': events / aggregate_seconds,
+        'output_seconds': output_seconds,
+    }
+
+
+def benchmark_mongodb(uri, database, layout, batch_size):
+    from pymongo import MongoClient
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=10000)
+    stats = replay_interactions(
+        client[database], InteractionStore(layout), batch_size=batch_size,
+        publish=False, verbose=False
+    )
+    client.close()
+    stats['mode'] = 'mongodb'
+    stats['replayed_until'] = str(stats['replayed_until'])
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default=None, help="URI de MongoDB (replay real sin publicar)")
+    parser.add_argument('--database', default='spotify_kappa')
+    parser.add_argument('--layout', choices=INTERACTION_LAYOUTS, default='raw')
+    parser.add_argument('--events', type=int, default=5_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--tracks', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=200_000)
+    parser.add_argument('--json', default=None, help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    print("\n=== Benchmark de replay ===\n")
+    if args.uri:
+        results = benchmark_mongodb(args.uri, args.database, args.layout, args.batch_size)
+    else:
+        results = benchmark_memory(args.events, args.batch_size, args.users, args.tracks)
+
+    print(f"Eventos: {results['events']:,}")
+    print(f"Throughput: {results['events_per_second']:,.0f} eventos/s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Escalado del procesador por shards.
+Mide el throughput de procesamiento (eventos/s aplicados a popularidad y
+trending) del procesador con threads y del procesador por shards con 1, 2,
+4 y 8 procesos, sobre el almacenamiento local en memoria (sin red), y la
+latencia de get_trending_tracks combinando los shards.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmark_processor import DEFAULT_MIX, LoadGenerator, seed_local_catalog, split
+from benchmark_recommendations import percentiles, synthetic_catalog
+from interaction_stats import InteractionStats
+from kappa_processor_mongodb import KappaProcessorMongoDB
+from local_storage import LocalStorage
+from sharded_processor import ShardedKappaProcessor
+
+
+def quiet_options():
+    """Sin sincronizaciones ni reconciliaciones durante la medición"""
+    return {
+        'popularity_sync_interval': 3600,
+        'interaction_stats': InteractionStats(reconcile_interval=3600),
+    }
+
+
+def produce_events(processor, generator, n_events, concurrency):
+    def produce(worker, count):
+        for user_id, track_id, interaction_type in generator.events(count, worker):
+            processor.add_event(user_id, track_id, interaction_type)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(produce, range(concurrency), split(n_events, concurrency)))
+
+
+def trending_latency(processor, n_queries=200):
+    latencies = []
+    for i in range(n_queries):
+        started = time.perf_counter()
+        processor.get_trending_tracks(10, ('hour', 'day', 'all')[i % 3])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return percentiles(latencies)
+
+
+def run_threaded(args, generator):
+    storage = LocalStorage()
+    seed_local_catalog(storage, args.tracks)
+    processor = KappaProcessorMongoDB(None, storage=storage, n_workers=args.threads, **quiet_options())
+    processor.load_data_from_mongodb()
+    processor.start_processing()
+
+    started = time.perf_counter()
+    produce_events(processor, generator, args.events, args.concurrency)
+    while processor.pipeline_metrics.snapshot()['events_processed'] < args.events:
+        time.sleep(0.005)
+    seconds = time.perf_counter() - started
+
+    result = {
+        'mode': 'threads', 'workers': args.threads, 'seconds': seconds,
+        'events_per_second': args.events / seconds,
+        'trending': trending_latency(processor),
+    }
+    processor.close()
+    return result
+
+
+def run_sharded(args, n_shards, generator):
+    storage = LocalStorage()
+    seed_local_catalog(storage, args.tracks)
+    processor = ShardedKappaProcessor(
+        None, storage=storage, n_shards=n_shards, route_batch_size=args.route_batch_size,
+        **quiet_options()
+    )
+    processor.load_data_from_mongodb()
+    processor.start_processing()
+
+    started = time.perf_counter()
+    produce_events(processor, generator, args.events, args.concurrency)
+    # Todo enrutado y aplicado por los shards
+    while processor.routed < args.events:
+        time.sleep(0.005)
+    processor.wait_until_processed()
+    seconds = time.perf_counter() - started
+
+    result = {
+        'mode': 'sharded', 'workers': n_shards, 'seconds': seconds,
+        'events_per_second': args.events / seconds,
+        'events_per_shard': processor.processed.tolist(),
+        'trending': trending_latency(processor),
+    }
+    processor.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--shards', default='1,2,4,8', help="números de shards a medir")
+    parser.add_argument('--threads', type=int, default=2, help="workers del procesador con threads")
+    parser.add_argument('--concurrency', type=int, default=4, help="threads productores")
+    parser.add_argument('--route-batch-size', type=int, default=2000)
+    parser.add_argument('--json', default=None, help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    print(f"\n=== Escalado por shards ({args.events:,} eventos, {args.tracks:,} canciones, "
+          f"{os.cpu_count()} CPUs) ===\n")
+    # Catálogo sintético determinista: mismos track_id en todas las ejecuciones
+    track_ids = synthetic_catalog(args.tracks)['track_id'].tolist()
+    generator = LoadGenerator(track_ids, args.users, DEFAULT_MIX)
+
+    results = [run_threaded(args, generator)]
+    for n_shards in [int(n) for n in args.shards.split(',')]:
+        results.append(run_sharded(args, n_shards, generator))
+
+    base = results[0]['events_per_second']
+    print(f"\n{'modo':10} {'workers':>7} {'eventos/s':>12} {'×threads':>9} {'trending p95':>13}")
+    for result in results:
+        print(f"{result['mode']:10} {result['workers']:>7} {result['events_per_second']:>12,.0f} "
+              f"{result['events_per_second'] / base:>8.2f}x {result['trending']['p95_ms']:>10.2f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cpus': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Reconstruye la colección user_profiles a partir de user_interactions.
+Migración inicial (y recuperación): ejecutar con la app detenida, porque el
+procesador suma sus deltas sobre estos documentos.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from itertools import groupby
+
+from pymongo import MongoClient, ReplaceOne
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from derived_state import read_derived_state
+from interaction_store import INTERACTION_LAYOUTS, InteractionStore
+from user_profiles import RECENT_SIZE, deltas_from_events
+
+
+def build_user_profiles(uri, database='spotify_kappa', batch_size=1000, layout='raw'):
+    print("\n=== Reconstrucción de user_profiles ===\n")
+    client = MongoClient(uri, serverSelectionTimeoutMS=10000)
+    db = client[database]
+    interactions = InteractionStore(layout)
+    # Colección de la versión publicada del estado derivado
+    profiles = db[read_derived_state(db)['profiles_collection']]
+
+    # Lectura ordenada por usuario: necesita el índice compuesto
+    interactions.ensure_indexes(db)
+
+    genres = {
+        doc['track_id']: doc.get('track_genre')
+        for doc in db['tracks'].find({}, {'_id': 0, 'track_id': 1, 'track_genre': 1})
+    }
+
+    # Solo eventos sin archivar (los agregados diarios no tienen recientes)
+    cursor = interactions.events_by_user(db)
+
+    started = time.perf_counter()
+    now = datetime.now()
+    operations = []
+    users = 0
+    for user_id, events in groupby(cursor, key=lambda e: e['user_id']):
+        profile = deltas_from_events(events, genres.get, RECENT_SIZE)[user_id]
+        operations.append(ReplaceOne({'_id': user_id}, {**profile, 'updated_at': now}, upsert=True))
+        users += 1
+        if len(operations) >= batch_size:
+            profiles.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        profiles.bulk_write(operations, ordered=False)
+
+    print(f"Perfiles escritos: {users:,} en {time.perf_counter() - started:.1f}s")
+    client.close()
+    return users
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('uri', help="URI de MongoDB")
+    parser.add_argument('--database', default='spotify_kappa')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--layout', choices=INTERACTION_LAYOUTS, default='raw')
+    args = parser.parse_args()
+
+    build_user_profiles(args.uri, args.database, args.batch_size, args.layout)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Crea el almacenamiento local (SQLite) desde el CSV del catálogo.
+Para nodos edge o pruebas sin MongoDB: la app lo usa con KAPPA_LOCAL_DB.
+En re-ejecuciones solo escribe las filas que cambiaron (hash por fila).
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from local_storage import LocalStorage
+from mongodb_migrate_script import in_sample, row_hashes
+
+
+def create_local_storage(path, csv_path='data/dataset.csv', chunk_size=20000, sample=None):
+    print(f"\n=== Catálogo local en {path} ===\n")
+    storage = LocalStorage(path)
+    existing = dict(storage.conn.execute('SELECT track_id, row_hash FROM tracks').fetchall())
+    print(f"Canciones ya guardadas: {len(existing):,}")
+
+    seen = set()
+    read_rows = 0
+    written_rows = 0
+    started = time.perf_counter()
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        read_rows += len(chunk)
+        if sample:
+            chunk = chunk[in_sample(chunk['track_id'], sample)]
+
+        # Un track_id puede aparecer en varios géneros: se queda la primera fila
+        chunk = chunk.drop_duplicates('track_id')
+        chunk = chunk[~chunk['track_id'].isin(seen)]
+        seen.update(chunk['track_id'])
+
+        chunk = chunk.assign(_row_hash=row_hashes(chunk))
+        changed = [
+            existing.get(track_id) != str(row_hash)
+            for track_id, row_hash in zip(chunk['track_id'], chunk['_row_hash'])
+        ]
+        written_rows += storage.upsert_tracks(chunk[changed].to_dict('records'))
+
+        elapsed = time.perf_counter() - started
+        print(f"Leídas {read_rows:,} | escritas {written_rows:,} | {read_rows / elapsed:,.0f} filas/s")
+
+    storage.close()
+    print(f"\nFilas escritas: {written_rows:,} en {time.perf_counter() - started:.1f}s")
+    print("\n=== Completado ===\n")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--path', default='data/kappa.db', help="archivo SQLite")
+    parser.add_argument('--csv', default='data/dataset.csv')
+    parser.add_argument('--chunk-size', type=int, default=20000, help="filas leídas por chunk")
+    parser.add_argument('--sample', type=float, default=None,
+                        help="fracción por género (p. ej. 0.05); por defecto el catálogo completo")
+    args = parser.parse_args()
+
+    ok = create_local_storage(args.path, args.csv, args.chunk_size, args.sample)
+    sys.exit(0 if ok else 1)
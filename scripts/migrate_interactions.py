@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento del esquema de user_interactions.
+
+  indexes     crea los índices (user_id, tiempo) y de tiempo (con TTL opcional)
+  to-buckets  copia los eventos crudos al layout por buckets (usuario, hora)
+  archive     compacta los eventos anteriores a N días en user_interactions_daily
+
+Todas las operaciones se pueden repetir: los buckets añaden eventos con
+$addToSet y el archivado procesa días completos.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from interaction_store import INTERACTION_LAYOUTS, InteractionStore
+
+
+def create_indexes(db, layout, ttl_days):
+    store = InteractionStore(layout, ttl_days)
+    store.ensure_indexes(db)
+    for name, info in store.collection(db).index_information().items():
+        ttl = info.get('expireAfterSeconds')
+        print(f"  {name}" + (f" (TTL {ttl / 86400:g} días)" if ttl else ""))
+
+
+def migrate_to_buckets(db, batch_size=5000, drop_raw=False):
+    """Eventos crudos → user_interaction_buckets, en orden de (user_id, timestamp)"""
+    raw = InteractionStore('raw')
+    bucketed = InteractionStore('bucketed')
+    bucketed.ensure_indexes(db)
+    buckets = bucketed.collection(db)
+
+    # Se conserva el _id de cada evento: re-ejecutar no duplica
+    cursor = raw.collection(db).find(
+        {}, {'user_id': 1, 'track_id': 1, 'interaction_type': 1, 'timestamp': 1}
+    ).sort([('user_id', 1), ('timestamp', 1)])
+
+    started = time.perf_counter()
+    batch = []
+    events = 0
+    for event in cursor:
+        batch.append(event)
+        if len(batch) >= batch_size:
+            buckets.bulk_write(bucketed.write_operations(batch), ordered=False)
+            events += len(batch)
+            batch = []
+    if batch:
+        buckets.bulk_write(bucketed.write_operations(batch), ordered=False)
+        events += len(batch)
+
+    print(f"Eventos copiados: {events:,} en {time.perf_counter() - started:.1f}s "
+          f"({buckets.estimated_document_count():,} buckets)")
+    if drop_raw:
+        raw.collection(db).drop()
+        print(f"Colección {raw.collection_name} eliminada")
+    return events
+
+
+def archive(db, layout, days):
+    store = InteractionStore(layout)
+    cutoff = datetime.now() - timedelta(days=days)
+    started = time.perf_counter()
+    archived = store.archive_before(db, cutoff)
+    print(f"Eventos archivados: {archived:,} en {time.perf_counter() - started:.1f}s")
+    return archived
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('command', choices=['indexes', 'to-buckets', 'archive'])
+    parser.add_argument('uri', help="URI de MongoDB")
+    parser.add_argument('--database', default='spotify_kappa')
+    parser.add_argument('--layout', choices=INTERACTION_LAYOUTS, default='raw')
+    parser.add_argument('--ttl-days', type=float, default=None,
+                        help="Borrar eventos crudos tras N días (índice TTL)")
+    parser.add_argument('--days', type=int, default=30,
+                        help="archive: compactar los eventos de hace más de N días")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--drop-raw', action='store_true',
+                        help="to-buckets: eliminar user_interactions al terminar")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=10000)
+    db = client[args.database]
+    if args.command == 'indexes':
+        create_indexes(db, args.layout, args.ttl_days)
+    elif args.command == 'to-buckets':
+        migrate_to_buckets(db, args.batch_size, args.drop_raw)
+    else:
+        archive(db, args.layout, args.days)
+    client.close()
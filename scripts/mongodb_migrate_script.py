@@ -1,51 +1,142 @@
 #!/usr/bin/env python3
+"""
+Migración del CSV a MongoDB por streaming.
+Lee el CSV por chunks y hace upserts en lote por track_id con varios writers.
+En re-ejecuciones solo escribe las filas que cambiaron (hash por fila).
+"""
+import argparse
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne
 
-def migrate_to_mongodb(uri):
+def row_hashes(df):
+    """Hash estable por fila (int64) para detectar cambios"""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy().view(np.int64)
+
+def in_sample(track_ids, fraction):
+    """Muestreo determinista por track_id: la misma muestra en cada re-ejecución"""
+    hashes = pd.util.hash_pandas_object(track_ids, index=False).to_numpy()
+    return (hashes % 10000) < fraction * 10000
+
+def stamp_times(n_rows, last=None):
+    """
+    n_rows updated_at estrictamente crecientes, 1 ms entre filas (la precision
+    de MongoDB), desde ahora o desde el siguiente ms a last. El polling del
+    catalogo no tiene que arrastrar miles de track_id con el mismo updated_at
+    """
+    start = pd.Timestamp.now().floor('ms')
+    if last is not None and start <= last:
+        start = last + pd.Timedelta(milliseconds=1)
+    return start + pd.to_timedelta(np.arange(n_rows), unit='ms')
+
+def write_batch(collection, batch):
+    """Upsert desordenado de un lote; devuelve filas escritas"""
+    operations = [ReplaceOne({'track_id': doc['track_id']}, doc, upsert=True) for doc in batch]
+    result = collection.bulk_write(operations, ordered=False)
+    return result.upserted_count + result.modified_count
+
+def migrate_to_mongodb(uri, csv_path='data/dataset.csv', database='spotify_kappa',
+                       chunk_size=20000, batch_size=1000, workers=4, sample=None):
     print("\n=== Migracion de CSV a MongoDB ===\n")
     print("Conectando a MongoDB...")
     try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=10000)
+        client = MongoClient(uri, serverSelectionTimeoutMS=10000, maxPoolSize=max(workers, 1) + 2)
         client.server_info()
         print("Conexion exitosa\n")
     except Exception as e:
         print(f"Error: {e}")
         return False
     
-    db = client['spotify_kappa']
+    db = client[database]
     tracks = db['tracks']
     
-    print("Leyendo CSV...")
-    df = pd.read_csv('data/dataset.csv')
-    print(f"Total canciones: {len(df):,}\n")
-    
-    if len(df) > 10000:
-        print("Seleccionando muestra...")
-        df = df.groupby('track_genre', group_keys=False).apply(
-            lambda x: x.sample(min(len(x), max(1, int(len(x) * 0.05))))
-        )
-        print(f"Seleccionadas: {len(df):,}\n")
-    
-    print("Limpiando coleccion...")
-    tracks.delete_many({})
-    
-    print(f"Insertando {len(df):,} documentos...")
-    docs = df.to_dict('records')
-    result = tracks.insert_many(docs)
-    print(f"Insertados: {len(result.inserted_ids):,}\n")
-    
+    # Indices antes de cargar: el upsert por track_id los necesita
     print("Creando indices...")
     try:
         tracks.create_index("track_id", unique=True)
         tracks.create_index("track_genre")
         tracks.create_index("artists")
+        # Polling de cambios incrementales del catálogo
+        tracks.create_index([("updated_at", 1), ("track_id", 1)])
         print("Indices creados\n")
     except Exception as e:
         print(f"Advertencia: {e}\n")
     
-    count = tracks.count_documents({})
+    # Hashes existentes para la carga incremental
+    existing = {
+        doc['track_id']: doc.get('_row_hash')
+        for doc in tracks.find({}, {'_id': 0, 'track_id': 1, '_row_hash': 1})
+    }
+    print(f"Canciones ya en MongoDB: {len(existing):,}")
+    if sample:
+        print(f"Muestreo: {sample:.0%} del catalogo (por hash de track_id)")
+    print(f"Leyendo {csv_path} en chunks de {chunk_size:,}...\n")
+    
+    seen = set()
+    last_stamp = None
+    read_rows = 0
+    changed_rows = 0
+    written_rows = 0
+    started = time.perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            read_rows += len(chunk)
+            
+            if sample:
+                chunk = chunk[in_sample(chunk['track_id'], sample)]
+            
+            # Un track_id puede aparecer en varios generos: se queda la primera fila
+            chunk = chunk.drop_duplicates('track_id')
+            chunk = chunk[~chunk['track_id'].isin(seen)]
+            seen.update(chunk['track_id'])
+            
+            # Solo filas nuevas o modificadas
+            chunk = chunk.assign(_row_hash=row_hashes(chunk))
+            unchanged = np.array([
+                existing.get(track_id) == row_hash
+                for track_id, row_hash in zip(chunk['track_id'], chunk['_row_hash'])
+            ], dtype=bool)
+            chunk = chunk[~unchanged]
+            if chunk.empty:
+                continue
+            
+            chunk = chunk.assign(updated_at=stamp_times(len(chunk), last_stamp))
+            last_stamp = chunk['updated_at'].iloc[-1]
+            docs = chunk.to_dict('records')
+            changed_rows += len(docs)
+            
+            for start in range(0, len(docs), batch_size):
+                # Limitar lotes en vuelo para no acumular memoria
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    written_rows += sum(f.result() for f in done)
+                in_flight.add(executor.submit(write_batch, tracks, docs[start:start + batch_size]))
+            
+            elapsed = time.perf_counter() - started
+            print(f"Leidas {read_rows:,} | cambiadas {changed_rows:,} | "
+                  f"{read_rows / elapsed:,.0f} filas/s")
+        
+        written_rows += sum(f.result() for f in in_flight)
+    
+    # Los updated_at pueden ir por delante del reloj (1 ms por fila): las
+    # escrituras posteriores con datetime.now() tienen que quedar detras
+    ahead = (last_stamp - pd.Timestamp.now()).total_seconds() if last_stamp is not None else 0
+    if ahead > 0:
+        print(f"Esperando {ahead:.1f}s a que el reloj alcance el ultimo updated_at...")
+        time.sleep(ahead)
+    
+    elapsed = time.perf_counter() - started
+    print(f"\nFilas leidas: {read_rows:,}")
+    print(f"Filas escritas: {written_rows:,} ({changed_rows:,} nuevas o modificadas)")
+    print(f"Tiempo: {elapsed:.1f}s ({read_rows / max(elapsed, 1e-9):,.0f} filas/s)")
+    
+    count = tracks.estimated_document_count()
     print(f"Total en MongoDB: {count:,}")
     print("\n=== Completado ===\n")
     
@@ -53,7 +144,18 @@ def migrate_to_mongodb(uri):
     return True
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Uso: python3 migrate_to_mongodb.py <MONGODB_URI>")
-        sys.exit(1)
-    migrate_to_mongodb(sys.argv[1])
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('uri', help="URI de MongoDB")
+    parser.add_argument('--csv', default='data/dataset.csv')
+    parser.add_argument('--database', default='spotify_kappa')
+    parser.add_argument('--chunk-size', type=int, default=20000, help="filas leidas por chunk")
+    parser.add_argument('--batch-size', type=int, default=1000, help="upserts por bulk_write")
+    parser.add_argument('--workers', type=int, default=4, help="writers en paralelo")
+    parser.add_argument('--sample', type=float, default=None,
+                        help="fraccion del catalogo, muestreada por hash de track_id (p. ej. 0.05); "
+                             "por defecto el catalogo completo")
+    args = parser.parse_args()
+    
+    ok = migrate_to_mongodb(args.uri, args.csv, args.database, args.chunk_size,
+                            args.batch_size, args.workers, args.sample)
+    sys.exit(0 if ok else 1)
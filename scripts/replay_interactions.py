@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Replay del log de interacciones: recalcula track_popularity y user_profiles
+(p. ej. tras cambiar los pesos) en colecciones nuevas con versión y publica
+la versión en kappa_meta. Los procesadores la usan al volver a cargar
+(reiniciar la app). Para un resultado exacto, ejecutar con la app detenida:
+los eventos que lleguen durante el replay solo se recuperan en las pasadas
+finales.
+"""
+import argparse
+import os
+import sys
+
+from pymongo import MongoClient
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from derived_state import read_derived_state
+from event_replay import replay_interactions
+from interaction_store import INTERACTION_LAYOUTS, InteractionStore
+
+
+def parse_weights(text):
+    """'play=1,like=3,skip=-1' → dict"""
+    weights = {}
+    for item in text.split(','):
+        name, value = item.split('=')
+        weights[name.strip()] = int(value)
+    return weights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('uri', help="URI de MongoDB")
+    parser.add_argument('--database', default='spotify_kappa')
+    parser.add_argument('--layout', choices=INTERACTION_LAYOUTS, default='raw')
+    parser.add_argument('--weights', type=parse_weights, default=None,
+                        help="pesos por tipo, p. ej. play=1,like=5,skip=-2 (por defecto los publicados)")
+    parser.add_argument('--batch-size', type=int, default=100000)
+    parser.add_argument('--keep', type=int, default=2, help="versiones anteriores a conservar")
+    parser.add_argument('--no-publish', action='store_true',
+                        help="escribir la versión nueva sin activarla")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=10000)
+    db = client[args.database]
+    current = read_derived_state(db)
+    print("\n=== Replay de interacciones ===\n")
+    print(f"Versión actual: {current['version']} (pesos {current['weights']})")
+
+    stats = replay_interactions(
+        db, InteractionStore(args.layout), weights=args.weights,
+        batch_size=args.batch_size, keep=args.keep, publish=not args.no_publish
+    )
+
+    print(f"\nVersión {stats['version']}: {stats['events']:,} eventos "
+          f"({stats['archived_events']:,} archivados) → {stats['tracks']:,} canciones, "
+          f"{stats['users']:,} usuarios")
+    print(f"Lectura y agregación: {stats['read_seconds']:.1f}s "
+          f"({stats['events_per_second']:,.0f} eventos/s), total {stats['total_seconds']:.1f}s")
+    if args.no_publish:
+        print("No publicada: la app sigue usando la versión actual")
+    else:
+        print("Publicada: reinicia la app para usarla")
+        if stats['dropped']:
+            print(f"Eliminadas: {', '.join(stats['dropped'])}")
+    client.close()
@@ -0,0 +1,392 @@
+"""
+Búsqueda aproximada de vecinos (ANN) en NumPy puro
+Backends intercambiables para NeighborIndex: archivo invertido (IVF) y LSH
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+# Consultas por bloque de búsqueda y elementos por bloque del fallback exacto
+QUERY_BLOCK_SIZE = 256
+EXACT_BLOCK_ELEMENTS = 1 << 22
+
+
+def select_top_k(candidates, sims, k):
+    """
+    (ids, scores) de los k candidatos con mayor similitud de cada fila,
+    ordenados; candidates None = columnas de sims. Los huecos (similitud
+    -inf) quedan con id -1.
+    """
+    n_rows, width = sims.shape
+    ids = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+    k = min(k, width)
+    if k == 0:
+        return ids, scores
+
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    if candidates is not None:
+        top = np.take_along_axis(candidates, top, axis=1)
+    top[np.isneginf(top_scores)] = -1
+    ids[:, :k] = top
+    scores[:, :k] = top_scores
+    return ids, scores
+
+
+def padded_segments(rows, starts, stops):
+    """
+    Matriz (n_consultas, ancho) con la concatenación de rows[start:stop] de
+    los segmentos de cada consulta (starts/stops: (n_consultas, n_segmentos)),
+    rellena con -1
+    """
+    n_queries = len(starts)
+    lengths = (stops - starts).ravel()
+    per_query = lengths.reshape(n_queries, -1).sum(axis=1)
+    width = int(per_query.max()) if n_queries else 0
+    candidates = np.full((n_queries, width), -1, dtype=np.int64)
+
+    total = int(lengths.sum())
+    if total:
+        positions = np.arange(total)
+        within = positions - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        flat = rows[np.repeat(starts.ravel(), lengths) + within]
+        columns = positions - np.repeat(np.cumsum(per_query) - per_query, per_query)
+        candidates[np.repeat(np.arange(n_queries), per_query), columns] = flat
+    return candidates
+
+
+def recall_at_k(approx_ids, exact_ids):
+    """Recall@k medio: fracción de los vecinos exactos recuperados por el ANN"""
+    hits = 0
+    total = 0
+    for approx, exact in zip(approx_ids, exact_ids):
+        hits += len(np.intersect1d(approx, exact))
+        total += len(exact)
+    return hits / total if total else 1.0
+
+
+class _ANNBase(ABC):
+    """Lógica común: búsqueda por bloques de consultas con fallback exacto"""
+
+    def __init__(self):
+        self.vectors = None
+        self.active = None
+
+    @abstractmethod
+    def fit(self, vectors):
+        raise NotImplementedError
+
+    @abstractmethod
+    def reindex(self, vectors, active=None):
+        """Reparte de nuevo las filas con los parámetros ya entrenados (catálogo actualizado)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _candidates(self, queries):
+        """Matriz (len(queries), ancho) de filas candidatas, rellena con -1"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def to_arrays(self):
+        """Estado entrenado como arrays NumPy (para snapshots en disco)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def from_arrays(self, vectors, arrays, active=None):
+        """Restaura el estado entrenado sin volver a entrenar"""
+        raise NotImplementedError
+
+    def search(self, queries, k, exclude_rows=None):
+        """
+        Busca los k vecinos aproximados de cada consulta, por bloques de
+        consultas. Las que tienen menos de k candidatos se resuelven con
+        búsqueda exacta.
+        """
+        n_queries = len(queries)
+        ids = np.full((n_queries, k), -1, dtype=np.int32)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        n_candidates = np.zeros(n_queries, dtype=np.int64)
+        if exclude_rows is not None:
+            exclude_rows = np.asarray(exclude_rows, dtype=np.int64)
+
+        for start in range(0, n_queries, QUERY_BLOCK_SIZE):
+            block = slice(start, start + QUERY_BLOCK_SIZE)
+            candidates, sims, n_candidates[block] = self._scored_candidates(
+                queries[block], k, None if exclude_rows is None else exclude_rows[block]
+            )
+            ids[block], scores[block] = select_top_k(candidates, sims, k)
+
+        fallback = np.flatnonzero(n_candidates < k)
+        if len(fallback):
+            ids[fallback], scores[fallback] = self._exact_search(
+                queries[fallback], k, None if exclude_rows is None else exclude_rows[fallback]
+            )
+        return ids, scores
+
+    def _scored_candidates(self, queries, k, exclude_rows=None):
+        """
+        (candidatos, similitudes, número de candidatos) de un bloque de
+        consultas: matrices del mismo ancho con -1 / -inf en el relleno que
+        contienen al menos los k mejores candidatos de cada consulta
+        """
+        candidates = self._candidates(queries)
+        valid = candidates >= 0
+        if exclude_rows is not None:
+            valid &= candidates != exclude_rows[:, None]
+        # Solo los candidatos reales: el ancho lo marca la consulta con más
+        query_idx, columns = np.nonzero(valid)
+        sims = np.full(candidates.shape, -np.inf, dtype=np.float32)
+        sims[query_idx, columns] = np.einsum(
+            'ij,ij->i', self.vectors[candidates[query_idx, columns]], queries[query_idx]
+        )
+        return candidates, sims, valid.sum(axis=1)
+
+    def _exact_search(self, queries, k, exclude_rows=None):
+        """Top-k exacto sobre las filas activas, por bloques de consultas"""
+        ids = np.empty((len(queries), k), dtype=np.int32)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        step = max(1, EXACT_BLOCK_ELEMENTS // max(len(self.vectors), 1))
+        for start in range(0, len(queries), step):
+            block = slice(start, start + step)
+            sims = queries[block] @ self.vectors.T
+            if self.active is not None:
+                sims[:, ~self.active] = -np.inf
+            if exclude_rows is not None:
+                sims[np.arange(len(sims)), exclude_rows[block]] = -np.inf
+            ids[block], scores[block] = select_top_k(None, sims, k)
+        return ids, scores
+
+
+class IVFIndex(_ANNBase):
+    """
+    Archivo invertido: k-means esférico sobre los vectores y búsqueda
+    solo en las n_probe listas más cercanas a la consulta.
+    n_probe es el control recall/latencia.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, sample_size=50000, seed=0):
+        super().__init__()
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.seed = seed
+
+        self.centroids = None
+        self.list_rows = None
+        self.list_offsets = None
+        # Vectores en el orden de list_rows: cada lista es un bloque contiguo
+        self.list_vectors = None
+
+    def fit(self, vectors):
+        """Entrena los centroides y reparte las filas en listas"""
+        self.vectors = vectors
+        n_rows = len(vectors)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+        rng = np.random.default_rng(self.seed)
+
+        sample = vectors
+        if n_rows > self.sample_size:
+            sample = vectors[rng.choice(n_rows, self.sample_size, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+
+            # Re-sembrar clusters vacíos
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        self.centroids = centroids
+        return self.reindex(vectors)
+
+    def reindex(self, vectors, active=None):
+        self.vectors = vectors
+        self.active = active
+        rows = np.arange(len(vectors)) if active is None else np.flatnonzero(active)
+        assign = self._assign(vectors[rows], self.centroids)
+        order = np.argsort(assign, kind='stable')
+        self.list_rows = rows[order].astype(np.int32)
+        self.list_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(assign, minlength=len(self.centroids))))
+        )
+        self.list_vectors = vectors[self.list_rows]
+        return self
+
+    def to_arrays(self):
+        return {
+            'centroids': self.centroids,
+            'list_rows': self.list_rows,
+            'list_offsets': self.list_offsets,
+        }
+
+    def from_arrays(self, vectors, arrays, active=None):
+        self.vectors = vectors
+        self.active = active
+        self.centroids = arrays['centroids']
+        self.list_rows = arrays['list_rows']
+        self.list_offsets = arrays['list_offsets']
+        self.list_vectors = vectors[self.list_rows]
+        return self
+
+    @staticmethod
+    def _assign(vectors, centroids, block_size=8192):
+        """Centroide más cercano de cada vector, por bloques"""
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            assign[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def _probes(self, queries):
+        """Las n_probe listas más cercanas a cada consulta"""
+        n_probe = min(self.n_probe, len(self.centroids))
+        centroid_sims = queries @ self.centroids.T
+        return np.argpartition(-centroid_sims, n_probe - 1, axis=1)[:, :n_probe]
+
+    def _candidates(self, queries):
+        probes = self._probes(queries)
+        return padded_segments(self.list_rows, self.list_offsets[probes], self.list_offsets[probes + 1])
+
+    def _scored_candidates(self, queries, k, exclude_rows=None):
+        """
+        Agrupa las consultas por lista: un producto matricial por lista
+        sondeada contra su bloque contiguo de list_vectors, del que solo se
+        guardan los k mejores de cada consulta
+        """
+        probes = self._probes(queries)
+        n_queries, n_probe = probes.shape
+        candidates = np.full((n_queries, n_probe, k), -1, dtype=np.int64)
+        sims = np.full((n_queries, n_probe, k), -np.inf, dtype=np.float32)
+        n_candidates = np.zeros(n_queries, dtype=np.int64)
+
+        flat_probes = probes.ravel()
+        order = np.argsort(flat_probes, kind='stable')
+        lists, first = np.unique(flat_probes[order], return_index=True)
+        for list_id, group in zip(lists, np.split(order, first[1:])):
+            start, stop = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == stop:
+                continue
+            # Cada consulta sondea una lista como mucho una vez
+            query_idx, probe_idx = np.divmod(group, n_probe)
+            rows = self.list_rows[start:stop]
+            list_sims = queries[query_idx] @ self.list_vectors[start:stop].T
+            n_candidates[query_idx] += stop - start
+            if exclude_rows is not None:
+                excluded = rows[None, :] == exclude_rows[query_idx, None]
+                list_sims[excluded] = -np.inf
+                n_candidates[query_idx] -= excluded.sum(axis=1)
+
+            list_k = min(k, stop - start)
+            top = np.argpartition(-list_sims, list_k - 1, axis=1)[:, :list_k]
+            candidates[query_idx, probe_idx, :list_k] = rows[top]
+            sims[query_idx, probe_idx, :list_k] = np.take_along_axis(list_sims, top, axis=1)
+
+        return candidates.reshape(n_queries, -1), sims.reshape(n_queries, -1), n_candidates
+
+
+class LSHIndex(_ANNBase):
+    """
+    LSH por hiperplanos aleatorios: n_tables tablas de n_bits bits.
+    Más tablas = más recall y más latencia.
+    """
+
+    def __init__(self, n_tables=8, n_bits=None, seed=0):
+        super().__init__()
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+
+        self.planes = None
+        self.tables = []
+        # Filas de todas las tablas seguidas (para padded_segments)
+        self.table_rows = None
+        self.table_offsets = None
+
+    def fit(self, vectors):
+        """Calcula los hashes de cada fila y agrupa por bucket"""
+        self.vectors = vectors
+        n_rows, n_features = vectors.shape
+        # ~64 filas por bucket por defecto
+        n_bits = self.n_bits or int(np.clip(np.log2(max(n_rows, 2) / 64), 1, 30))
+        rng = np.random.default_rng(self.seed)
+
+        self.planes = rng.standard_normal((self.n_tables, n_features, n_bits)).astype(np.float32)
+        return self.reindex(vectors)
+
+    def reindex(self, vectors, active=None):
+        self.vectors = vectors
+        self.active = active
+        rows = np.arange(len(vectors)) if active is None else np.flatnonzero(active)
+        self.tables = []
+        for t in range(len(self.planes)):
+            codes = self._hash(vectors[rows], self.planes[t])
+            order = np.argsort(codes, kind='stable')
+            self.tables.append((codes[order], rows[order].astype(np.int32)))
+        self._concatenate_tables()
+        return self
+
+    def _concatenate_tables(self):
+        orders = [order for _, order in self.tables]
+        self.table_rows = np.concatenate(orders)
+        self.table_offsets = np.concatenate(([0], np.cumsum([len(order) for order in orders])))
+
+    def to_arrays(self):
+        arrays = {'planes': self.planes}
+        for t, (sorted_codes, order) in enumerate(self.tables):
+            arrays[f'codes_{t}'] = sorted_codes
+            arrays[f'order_{t}'] = order
+        return arrays
+
+    def from_arrays(self, vectors, arrays, active=None):
+        self.vectors = vectors
+        self.active = active
+        self.planes = arrays['planes']
+        self.tables = [
+            (arrays[f'codes_{t}'], arrays[f'order_{t}'])
+            for t in range(len(self.planes))
+        ]
+        self._concatenate_tables()
+        return self
+
+    @staticmethod
+    def _hash(vectors, planes):
+        bits = (vectors @ planes) > 0
+        weights = 1 << np.arange(planes.shape[1], dtype=np.int64)
+        return bits.astype(np.int64) @ weights
+
+    def _candidates(self, queries):
+        starts = np.empty((len(queries), len(self.tables)), dtype=np.int64)
+        stops = np.empty_like(starts)
+        for t, (sorted_codes, _) in enumerate(self.tables):
+            codes = self._hash(queries, self.planes[t])
+            offset = self.table_offsets[t]
+            starts[:, t] = offset + np.searchsorted(sorted_codes, codes, side='left')
+            stops[:, t] = offset + np.searchsorted(sorted_codes, codes, side='right')
+
+        # Una fila puede caer en el bucket de la consulta en varias tablas
+        candidates = padded_segments(self.table_rows, starts, stops)
+        candidates.sort(axis=1)
+        candidates[:, 1:][candidates[:, 1:] == candidates[:, :-1]] = -1
+        return candidates
+
+
+ANN_BACKENDS = {
+    'ivf': IVFIndex,
+    'lsh': LSHIndex,
+}
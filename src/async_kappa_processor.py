@@ -0,0 +1,561 @@
+"""
+Procesador Kappa asíncrono (asyncio)
+Misma interfaz pública que KappaProcessorMongoDB, con un cliente Mongo asíncrono
+"""
+
+import asyncio
+import itertools
+import time
+from datetime import datetime
+
+import pandas as pd
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from catalog_loader import ACTIVE_TRACKS_QUERY, CatalogColumns, catalog_projection
+from derived_state import DERIVED_STATE_ID, META_COLLECTION, derived_state_from_doc
+from interaction_stats import HyperLogLog
+from kappa_processor_mongodb import KappaProcessorMongoDB
+from mongo_resilience import CircuitOpenError, is_transient_error
+from pipeline_metrics import PipelineMetrics
+from storage import PAIR_COUNT_COLUMNS, PROFILE_READ_TIMEOUT, popularity_update_operations
+from user_profiles import profile_preferences, profile_summary, profile_update_operations
+
+try:
+    # PyMongo >= 4.9 trae su propia API asíncrona
+    from pymongo import AsyncMongoClient
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except ImportError:
+        AsyncMongoClient = None
+
+
+class ThreadedAsyncDatabase:
+    """
+    Adaptador asíncrono sobre una base de datos síncrona (pymongo, mongomock...).
+    Cada operación corre en un thread con asyncio.to_thread; sirve como
+    stand-in en memoria para pruebas sin un mongod.
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, name):
+        return _ThreadedAsyncCollection(self.database[name])
+
+
+class _ThreadedAsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return _ThreadedAsyncCursor(self.collection, args, kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        return _ThreadedAsyncCursor(self.collection, (pipeline,), kwargs, method='aggregate')
+
+    async def find_one(self, *args, **kwargs):
+        return await asyncio.to_thread(self.collection.find_one, *args, **kwargs)
+
+    async def insert_one(self, document):
+        return await asyncio.to_thread(self.collection.insert_one, document)
+
+    async def insert_many(self, documents, ordered=True):
+        return await asyncio.to_thread(self.collection.insert_many, documents, ordered=ordered)
+
+    async def create_indexes(self, indexes):
+        return await asyncio.to_thread(self.collection.create_indexes, indexes)
+
+    async def bulk_write(self, operations, ordered=True):
+        return await asyncio.to_thread(self.collection.bulk_write, operations, ordered=ordered)
+
+    async def count_documents(self, query):
+        return await asyncio.to_thread(self.collection.count_documents, query)
+
+    async def estimated_document_count(self):
+        return await asyncio.to_thread(self.collection.estimated_document_count)
+
+    async def distinct(self, key):
+        return await asyncio.to_thread(self.collection.distinct, key)
+
+
+class _ThreadedAsyncCursor:
+    def __init__(self, collection, args, kwargs, method='find'):
+        self.collection = collection
+        self.args = args
+        self.kwargs = kwargs
+        self.method = method
+        self.sort_spec = None
+        self.limit_count = 0
+
+    def sort(self, key, direction=1):
+        self.sort_spec = (key, direction)
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def _cursor(self):
+        cursor = getattr(self.collection, self.method)(*self.args, **self.kwargs)
+        if self.sort_spec:
+            cursor = cursor.sort(*self.sort_spec)
+        if self.limit_count:
+            cursor = cursor.limit(self.limit_count)
+        return cursor
+
+    def _fetch(self, length):
+        documents = list(self._cursor())
+        return documents if length is None else documents[:length]
+
+    async def to_list(self, length=None):
+        return await asyncio.to_thread(self._fetch, length)
+
+    async def __aiter__(self):
+        """Itera por lotes de batch_size documentos, cada lote leído en un thread"""
+        cursor = await asyncio.to_thread(self._cursor)
+        batch_size = self.kwargs.get('batch_size') or 1000
+        while True:
+            batch = await asyncio.to_thread(lambda: list(itertools.islice(cursor, batch_size)))
+            if not batch:
+                return
+            for document in batch:
+                yield document
+
+
+class AsyncKappaProcessor:
+    """
+    Procesador de eventos en tiempo real sobre asyncio.
+
+    El modelo en memoria (catálogo, índice de vecinos, popularidad y scoring)
+    es el de KappaProcessorMongoDB; aquí solo cambia la E/S con MongoDB, que
+    es asíncrona. Un único proceso atiende muchas peticiones concurrentes
+    sin un thread por petición.
+
+    Las llamadas a MongoDB pasan por el circuit breaker del modelo y las
+    idempotentes (escritura de eventos, con _id propio) se reintentan con su
+    RetryPolicy. Los eventos que no se pudieron escribir quedan pendientes y
+    se reintentan; con write_buffer_size pendientes el consumidor deja de
+    leer la cola (backpressure sobre add_event) en vez de descartarlos.
+    """
+
+    def __init__(self, mongodb_uri=None, database_name='spotify_kappa', database=None,
+                 event_batch_size=500, event_queue_size=10000,
+                 popularity_sync_interval=5.0, **model_options):
+        self.mongodb_uri = mongodb_uri
+        self.database_name = database_name
+        self.client = None
+        self.db = database
+
+        # Modelo en memoria compartido con la versión síncrona (sin conexión propia)
+        self.model = KappaProcessorMongoDB(mongodb_uri, database_name, **model_options)
+        self.profile_read_timeout = self.model.storage_options.get('profile_read_timeout', PROFILE_READ_TIMEOUT)
+
+        self.event_batch_size = event_batch_size
+        self.event_queue_size = event_queue_size
+        self.popularity_sync_interval = popularity_sync_interval
+        self.event_queue = None
+        self.pipeline_metrics = PipelineMetrics()
+
+        # Eventos cuya escritura falló, en orden, a la espera de reintento
+        self.unwritten = []
+        self.max_unwritten = self.model.event_writer.max_pending
+        self.failed_writes = 0
+
+        self.is_running = False
+        self.consumer_task = None
+        self.sync_task = None
+        self.stats_task = None
+
+    async def connect_mongodb(self):
+        """Conecta a MongoDB con el cliente asíncrono"""
+        if AsyncMongoClient is None:
+            print("Error: instala motor o pymongo>=4.9 para el procesador asíncrono")
+            return False
+        try:
+            self.client = AsyncMongoClient(self.mongodb_uri, **self.model.mongo_client_options)
+            await self.client.admin.command('ping')
+            self.db = self.client[self.database_name]
+            print("Conectado a MongoDB Atlas (asyncio)")
+            return True
+        except Exception as e:
+            print(f"Error conectando a MongoDB: {e}")
+            return False
+
+    async def load_data_from_mongodb(self):
+        """Carga catálogo y popularidad desde MongoDB"""
+        if self.db is None:
+            if not await self.connect_mongodb():
+                return False
+
+        print("Cargando datos desde MongoDB...")
+        try:
+            await self.db[self.interactions.collection_name].create_indexes(self.interactions.index_models())
+        except Exception as e:
+            print(f"Advertencia: no se pudieron crear los índices de interacciones: {e}")
+        # Versión publicada del estado derivado (colecciones y pesos)
+        self.model.set_derived_state(derived_state_from_doc(
+            await self.db[META_COLLECTION].find_one({'_id': DERIVED_STATE_ID})
+        ))
+
+        # Solo los campos del modelo, lote a lote a columnas preasignadas
+        columns = CatalogColumns(self.model.audio_features)
+        cursor = self.db['tracks'].find(
+            ACTIVE_TRACKS_QUERY, catalog_projection(self.model.audio_features),
+            batch_size=self.model.load_batch_size
+        )
+        async for doc in cursor:
+            columns.append(doc)
+        if not columns.size:
+            print("ERROR: No hay datos en MongoDB. Ejecuta migrate_to_mongodb.py primero.")
+            return False
+
+        # La construcción del índice es CPU: fuera del event loop
+        await asyncio.to_thread(self.model.build_from_dataframe, columns.to_dataframe())
+
+        popularity_docs = await self.db[self.model.popularity_collection_name].find({}).to_list(None)
+        self.model.load_popularity_docs(popularity_docs)
+
+        # Eventos recientes para las ventanas del trending
+        since = self.model.trending.warmup_since()
+        if since is not None:
+            cursor = await self._aggregate(
+                self.interactions.collection_name, self.interactions.events_pipeline(since=since)
+            )
+            recent_events = [event async for event in cursor]
+            self.model.warm_up_trending(recent_events)
+
+        # Co-ocurrencias del modelo colaborativo (agregadas en el servidor)
+        if self.model.collaborative is not None:
+            cursor = await self._aggregate(
+                self.interactions.collection_name, self.interactions.pair_counts_pipeline()
+            )
+            counts = pd.DataFrame.from_records([doc async for doc in cursor], columns=PAIR_COUNT_COLUMNS)
+            await asyncio.to_thread(self.model.build_collaborative, [counts])
+
+        # Totales de interacciones y usuarios (reconciliación periódica)
+        if self.stats_task is None:
+            self.stats_task = asyncio.create_task(self._reconcile_stats_loop())
+
+        print(f"Datos cargados: {len(self.model.catalog)} canciones")
+        return True
+
+    @property
+    def tracks_df(self):
+        return self.model.tracks_df
+
+    @property
+    def interactions(self):
+        return self.model.interactions
+
+    async def start_processing(self):
+        """Inicia el consumidor de eventos y la sincronización de popularidad"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self.event_queue = asyncio.Queue(maxsize=self.event_queue_size)
+        self.consumer_task = asyncio.create_task(self._consume_events())
+        self.sync_task = asyncio.create_task(self._sync_popularity_loop())
+        print("Procesador de eventos iniciado (asyncio)")
+
+    async def stop_processing(self):
+        """Detiene el procesamiento tras drenar la cola"""
+        if self.is_running:
+            self.is_running = False
+            await self.event_queue.put(None)
+            await self.consumer_task
+            self.sync_task.cancel()
+            try:
+                await self.sync_task
+            except asyncio.CancelledError:
+                pass
+            stopped = True
+        else:
+            stopped = False
+        if not await self._retry_unwritten():
+            print(f"Advertencia: {len(self.unwritten)} interacciones sin escribir en MongoDB")
+        await self._sync_popularity()
+        if stopped:
+            print("Procesador detenido")
+
+    async def add_event(self, user_id, track_id, interaction_type='play'):
+        """Agrega un evento; espera si la cola está llena (backpressure)"""
+        event = {
+            'user_id': user_id,
+            'track_id': track_id,
+            'interaction_type': interaction_type,
+            'timestamp': datetime.now()
+        }
+
+        if self.is_running:
+            await self.event_queue.put((time.monotonic(), event))
+        else:
+            await self._retry_unwritten()
+            await self._write_events([event.copy()])
+            self.model.apply_batch([event])
+
+        return event
+
+    async def _consume_events(self):
+        """Consume la cola en micro-lotes: insert_many + actualización del modelo"""
+        while True:
+            item = await self.event_queue.get()
+            batch = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+
+            while not stop and len(batch) < self.event_batch_size:
+                try:
+                    item = self.event_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                started = time.monotonic()
+                events = [event for _, event in batch]
+                await self._wait_for_unwritten()
+                await self._write_events([event.copy() for event in events])
+                self.model.apply_batch(events)
+                finished = time.monotonic()
+                self.pipeline_metrics.record_batch(
+                    [(finished - enqueued_at) * 1000 for enqueued_at, _ in batch],
+                    (finished - started) * 1000
+                )
+
+            if stop:
+                return
+
+    async def _call(self, fn, *args, **kwargs):
+        """await fn(*args, **kwargs) a través del circuit breaker del modelo"""
+        breaker = self.model.breaker
+        if not breaker.allow():
+            raise CircuitOpenError("MongoDB no disponible (circuit breaker abierto)")
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) or is_transient_error(e):
+                breaker.record_failure()
+            else:
+                # El servidor respondió: no está caído
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    async def _call_with_retry(self, fn, *args, **kwargs):
+        """_call con la RetryPolicy del modelo (solo operaciones idempotentes)"""
+        retry = self.model.retry_policy
+        for attempt in range(retry.attempts):
+            try:
+                return await self._call(fn, *args, **kwargs)
+            except Exception as e:
+                if attempt == retry.attempts - 1 or not is_transient_error(e):
+                    raise
+                retry.retries += 1
+                await asyncio.sleep(retry.delay(attempt))
+
+    async def _insert_events(self, events):
+        """insert_many desordenado (o $addToSet por buckets); devuelve cuántos se insertaron"""
+        collection = self.db[self.interactions.collection_name]
+        if self.interactions.layout == 'bucketed':
+            await collection.bulk_write(self.interactions.write_operations(events), ordered=False)
+            return len(events)
+        try:
+            return len((await collection.insert_many(events, ordered=False)).inserted_ids)
+        except BulkWriteError as e:
+            # En un reintento los eventos ya insertados tienen _id: clave duplicada
+            errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != 11000]
+            if errors or e.details.get('writeConcernErrors'):
+                raise
+            return e.details.get('nInserted', 0)
+
+    async def _try_write(self, events):
+        """Escribe interacciones con reintentos; False si MongoDB no las aceptó"""
+        for event in events:
+            # _id estable entre reintentos: un evento nunca se inserta dos veces
+            event.setdefault('_id', ObjectId())
+        try:
+            inserted = await self._call_with_retry(self._insert_events, events)
+        except Exception as e:
+            self.failed_writes += 1
+            print(f"Error guardando interacciones en MongoDB "
+                  f"({len(self.unwritten) + len(events)} pendientes): {e}")
+            return False
+        self.model.interaction_stats.record(events, inserted)
+        return True
+
+    async def _write_events(self, events):
+        """Escribe un lote nuevo; si falla queda pendiente detrás de los anteriores"""
+        if not await self._try_write(events):
+            self.unwritten.extend(events)
+            return False
+        return True
+
+    async def _retry_unwritten(self):
+        """Reintenta los eventos pendientes en lotes; False si alguno vuelve a fallar"""
+        while self.unwritten:
+            batch = self.unwritten[:self.event_batch_size]
+            del self.unwritten[:self.event_batch_size]
+            if not await self._try_write(batch):
+                self.unwritten[:0] = batch
+                return False
+        return True
+
+    async def _wait_for_unwritten(self):
+        """Con max_unwritten eventos pendientes no se consume más (backpressure)"""
+        attempt = 0
+        while not await self._retry_unwritten() and len(self.unwritten) >= self.max_unwritten:
+            await asyncio.sleep(self.model.retry_policy.delay(attempt))
+            attempt = min(attempt + 1, 10)
+
+    async def _reconcile_stats_loop(self):
+        stats = self.model.interaction_stats
+        while True:
+            try:
+                await self._reconcile_stats()
+            except Exception as e:
+                print(f"Error reconciliando estadísticas: {e}")
+            await asyncio.sleep(stats.reconcile_interval)
+
+    async def _reconcile_stats(self):
+        """estimated_document_count + usuarios únicos por agregación, sin bloquear el loop"""
+        stats = self.model.interaction_stats
+        name = self.interactions.collection_name
+        token = stats.begin_reconcile()
+        if self.interactions.layout == 'raw':
+            total = await self.db[name].estimated_document_count()
+        else:
+            result = [doc async for doc in await self._aggregate(name, self.interactions.count_pipeline())]
+            total = result[0]['events'] if result else 0
+        users = HyperLogLog(stats.precision)
+        async for doc in await self._aggregate(name, self.interactions.distinct_users_pipeline()):
+            users.add(doc['_id'])
+        stats.finish_reconcile(token, total, users)
+
+    async def _aggregate(self, collection_name, pipeline):
+        """Cursor de una agregación (Motor lo devuelve directamente, PyMongo async en una corrutina)"""
+        cursor = self.db[collection_name].aggregate(pipeline, allowDiskUse=True)
+        if asyncio.iscoroutine(cursor):
+            cursor = await cursor
+        return cursor
+
+    async def _sync_popularity_loop(self):
+        while True:
+            await asyncio.sleep(self.popularity_sync_interval)
+            await self._retry_unwritten()
+            await self._sync_popularity()
+
+    async def _sync_popularity(self):
+        """
+        Sincroniza los deltas de popularidad y de perfiles con bulk_write
+        asíncronos, a través del circuit breaker y sin reintentos propios
+        (los $inc no son idempotentes; el driver reintenta una vez)
+        """
+        popularity = self.model.popularity
+        track_ids, deltas = popularity.take_deltas()
+        if track_ids:
+            try:
+                await self._call(
+                    self.db[self.model.popularity_collection_name].bulk_write,
+                    popularity_update_operations(track_ids, deltas), ordered=False
+                )
+            except Exception as e:
+                popularity.restore_deltas(e, track_ids, deltas)
+
+        # Perfiles de usuario materializados
+        await self.model.user_profiles.flush_async(self._write_profile_updates)
+
+    async def _write_profile_updates(self, user_ids, updates, recent_size):
+        await self._call(
+            self.db[self.model.profiles_collection_name].bulk_write,
+            profile_update_operations(user_ids, updates, recent_size), ordered=False
+        )
+
+    async def _get_materialized_profile(self, user_id):
+        """Perfil desde la caché LRU del modelo o, si no está, un find_one por _id"""
+        return await self.model.user_profiles.get_async(user_id, self._find_profile_doc)
+
+    async def _find_profile_doc(self, user_id):
+        """find_one con el timeout de lectura de perfiles y el circuit breaker del modelo"""
+        collection = self.db[self.model.profiles_collection_name]
+        return await self._call(lambda: asyncio.wait_for(
+            collection.find_one({'_id': user_id}), timeout=self.profile_read_timeout
+        ))
+
+    async def get_recommendations(self, track_id, user_id=None, top_n=10):
+        """Genera recomendaciones en tiempo real"""
+        track_idx = self.model.catalog.row(track_id)
+        if track_idx is None or top_n <= 0:
+            return []
+
+        key = (track_id, user_id, top_n)
+        version = self.model.recommendation_version(user_id)
+        cached = self.model.recommender.cached(key, version)
+        if cached is not None:
+            return cached
+        popularity_seq = self.model.popularity.seq
+
+        liked_genres = set()
+        degraded = False
+        if user_id:
+            try:
+                preferences = profile_preferences(await self._get_materialized_profile(user_id))
+            except Exception as e:
+                # Solo por contenido mientras MongoDB no responda
+                self.model.record_degraded(e, expected=(CircuitOpenError, asyncio.TimeoutError))
+                preferences = None
+                degraded = True
+            if preferences:
+                liked_genres = preferences['liked_genres']
+
+        recommendations = self.model.recommender.recommend(track_idx, top_n, liked_genres)
+        if degraded:
+            return recommendations
+        return self.model.recommender.store(key, version, track_idx, popularity_seq, recommendations)
+
+    async def get_user_profile(self, user_id):
+        """Obtiene perfil de usuario (caché LRU o user_profiles)"""
+        try:
+            return profile_summary(await self._get_materialized_profile(user_id))
+        except Exception as e:
+            print(f"Error obteniendo perfil: {e}")
+            return None
+
+    async def get_trending_tracks(self, top_n=10, window='day', genre=None):
+        """Trending por ventana y género (lista top-K en memoria)"""
+        return self.model.get_trending_tracks(top_n, window, genre)
+
+    async def get_stats(self):
+        """Obtiene estadísticas del sistema"""
+        # Contadores en memoria del modelo, sin consultas a MongoDB; la cola y
+        # los pendientes de escritura son los de este procesador
+        stats = self.model.get_stats()
+        stats['events_in_queue'] = self.event_queue.qsize() if self.event_queue else 0
+        stats['events_pending_write'] = len(self.unwritten)
+        stats['queue_lag_ms'] = self.pipeline_metrics.avg_lag_ms
+        return stats
+
+    async def close(self):
+        """Drena la cola, sincroniza y cierra la conexión"""
+        await self.stop_processing()
+        if self.model.collaborative is not None:
+            self.model.collaborative.close()
+        if self.stats_task is not None:
+            self.stats_task.cancel()
+            try:
+                await self.stats_task
+            except asyncio.CancelledError:
+                pass
+            self.stats_task = None
+        if self.client:
+            close = self.client.close()
+            if asyncio.iscoroutine(close):
+                await close
+            print("Conexión a MongoDB cerrada")
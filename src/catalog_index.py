@@ -0,0 +1,245 @@
+"""
+Índice del catálogo de canciones
+Mapa track_id → fila en O(1) y columnas compactas para metadatos
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def encode_strings(values):
+    """Codifica strings como (blob uint8, offsets int64) para guardarlos con np.save"""
+    encoded = [str(v).encode('utf-8') if v is not None else b'' for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def decode_strings(blob, offsets):
+    """Inverso de encode_strings: array de objetos str"""
+    data = bytes(blob)
+    values = np.empty(len(offsets) - 1, dtype=object)
+    values[:] = [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+    return values
+
+
+class CatalogIndex:
+    """
+    Catálogo en memoria construido una vez al cargar.
+
+    - rows: dict track_id → posición de fila
+    - names: array de nombres
+    - artists / genres: categóricos (códigos int32 + categorías)
+    - active: máscara de filas vigentes (None = todas); las canciones
+      borradas conservan su fila para no renumerar el resto
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.track_ids = np.empty(0, dtype=object)
+        self.names = np.empty(0, dtype=object)
+        self.artist_codes = np.empty(0, dtype=np.int32)
+        self.artist_categories = np.empty(0, dtype=object)
+        self.genre_codes = np.empty(0, dtype=np.int32)
+        self.genre_categories = np.empty(0, dtype=object)
+        self.genre_lookup = {}
+        self.active = None
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __contains__(self, track_id):
+        return self.row(track_id) is not None
+
+    @property
+    def active_count(self):
+        """Número de canciones vigentes (sin contar las borradas)"""
+        return len(self) if self.active is None else int(self.active.sum())
+
+    def build(self, tracks_df):
+        """Construye el índice a partir del DataFrame de canciones"""
+        self.track_ids = tracks_df['track_id'].to_numpy(dtype=object)
+        self.rows = {track_id: row for row, track_id in enumerate(self.track_ids.tolist())}
+        self.names = tracks_df['track_name'].to_numpy(dtype=object)
+
+        artists = pd.Categorical(tracks_df['artists'])
+        self.artist_codes = artists.codes.astype(np.int32)
+        self.artist_categories = np.asarray(artists.categories, dtype=object)
+
+        genres = pd.Categorical(tracks_df['track_genre'])
+        self.genre_codes = genres.codes.astype(np.int32)
+        self.genre_categories = np.asarray(genres.categories, dtype=object)
+        self.genre_lookup = {genre: code for code, genre in enumerate(self.genre_categories.tolist())}
+        self.active = None
+        return self
+
+    def apply_changes(self, tracks_df, deleted_ids=()):
+        """
+        Aplica altas/modificaciones (tracks_df) y bajas sin reconstruir el índice.
+        Las canciones nuevas se añaden al final; las categorías nuevas de
+        artista/género se añaden a las existentes. Los arrays se copian y se
+        publican al final, así las lecturas concurrentes ven un estado coherente.
+        Devuelve (filas modificadas, filas borradas).
+        """
+        rows = dict(self.rows)
+        track_ids = tracks_df['track_id'].tolist()
+        new_ids = [t for t in dict.fromkeys(track_ids) if t not in rows]
+        for track_id in new_ids:
+            rows[track_id] = len(rows)
+        n_rows = len(rows)
+        grow = n_rows - len(self)
+
+        def grown(values, fill):
+            if not grow:
+                return values.copy()
+            extra = np.full(grow, fill, dtype=values.dtype)
+            return np.concatenate([values, extra])
+
+        all_ids = grown(self.track_ids, None)
+        all_ids[len(self):] = new_ids
+        names = grown(self.names, None)
+        artist_codes = grown(np.asarray(self.artist_codes), -1)
+        genre_codes = grown(np.asarray(self.genre_codes), -1)
+        artist_categories, artist_codes_new = self._extend_categories(
+            self.artist_categories, tracks_df['artists']
+        )
+        genre_categories, genre_codes_new = self._extend_categories(
+            self.genre_categories, tracks_df['track_genre']
+        )
+
+        changed = np.array([rows[t] for t in track_ids], dtype=np.int64)
+        names[changed] = tracks_df['track_name'].to_numpy(dtype=object)
+        artist_codes[changed] = artist_codes_new
+        genre_codes[changed] = genre_codes_new
+
+        deleted = np.array([rows[t] for t in deleted_ids if t in rows], dtype=np.int64)
+        active = np.ones(n_rows, dtype=bool)
+        if self.active is not None:
+            active[:len(self)] = self.active
+        active[changed] = True
+        active[deleted] = False
+
+        # Publicar: columnas antes que el dict de filas
+        self.names = names
+        self.artist_codes = artist_codes
+        self.artist_categories = artist_categories
+        self.genre_codes = genre_codes
+        self.genre_categories = genre_categories
+        self.genre_lookup = {genre: code for code, genre in enumerate(genre_categories.tolist())}
+        self.active = None if active.all() else active
+        self.track_ids = all_ids
+        self.rows = rows
+        return changed, deleted
+
+    @staticmethod
+    def _extend_categories(categories, values):
+        """Códigos de values sobre categories, añadiendo las categorías nuevas al final"""
+        lookup = {value: code for code, value in enumerate(categories.tolist())}
+        added = []
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values.tolist()):
+            if value is None or value != value:
+                codes[i] = -1
+                continue
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(lookup)
+                added.append(value)
+            codes[i] = code
+        if added:
+            categories = np.concatenate([categories, np.array(added, dtype=object)])
+        return categories, codes
+
+    def is_active(self, row):
+        """True si la fila corresponde a una canción vigente"""
+        return self.active is None or bool(self.active[row])
+
+    def to_arrays(self):
+        """Columnas del catálogo como arrays NumPy (para snapshots en disco)"""
+        arrays = {
+            'artist_codes': self.artist_codes,
+            'genre_codes': self.genre_codes,
+        }
+        for name, values in [('track_ids', self.track_ids), ('names', self.names),
+                             ('artist_categories', self.artist_categories),
+                             ('genre_categories', self.genre_categories)]:
+            arrays[f'{name}_blob'], arrays[f'{name}_offsets'] = encode_strings(values)
+        return arrays
+
+    def from_arrays(self, arrays):
+        """Reconstruye el catálogo desde to_arrays (los códigos pueden ser memmap)"""
+        self.track_ids = decode_strings(arrays['track_ids_blob'], arrays['track_ids_offsets'])
+        self.rows = {track_id: row for row, track_id in enumerate(self.track_ids.tolist())}
+        self.names = decode_strings(arrays['names_blob'], arrays['names_offsets'])
+        self.artist_codes = arrays['artist_codes']
+        self.artist_categories = decode_strings(
+            arrays['artist_categories_blob'], arrays['artist_categories_offsets']
+        )
+        self.genre_codes = arrays['genre_codes']
+        self.genre_categories = decode_strings(
+            arrays['genre_categories_blob'], arrays['genre_categories_offsets']
+        )
+        self.genre_lookup = {genre: code for code, genre in enumerate(self.genre_categories.tolist())}
+        self.active = None
+        return self
+
+    def to_dataframe(self):
+        """DataFrame con los metadatos de las canciones vigentes"""
+        rows = np.arange(len(self))
+        if self.active is not None:
+            rows = rows[self.active]
+        return pd.DataFrame({
+            name: self.column(name, rows)
+            for name in ['track_id', 'track_name', 'artists', 'track_genre']
+        })
+
+    def row(self, track_id):
+        """Fila de una canción o None si no existe (o fue borrada)"""
+        row = self.rows.get(track_id)
+        if row is None or not self.is_active(row):
+            return None
+        return row
+
+    def rows_for(self, track_ids):
+        """Filas de las canciones vigentes del catálogo (orden preservado)"""
+        rows = self.rows
+        found = np.array([rows[t] for t in track_ids if t in rows], dtype=np.int64)
+        if self.active is not None and len(found):
+            found = found[self.active[found]]
+        return found
+
+    def genre(self, track_id):
+        """Género de una canción o None si no existe"""
+        row = self.row(track_id)
+        if row is None or self.genre_codes[row] < 0:
+            return None
+        return self.genre_categories[self.genre_codes[row]]
+
+    def genre_codes_for(self, genres):
+        """Códigos de los géneros conocidos"""
+        return [self.genre_lookup[g] for g in genres if g in self.genre_lookup]
+
+    def column(self, name, rows):
+        """Extrae una columna de metadatos para varias filas a la vez"""
+        if name == 'track_id':
+            return self.track_ids[rows]
+        if name == 'track_name':
+            return self.names[rows]
+        if name == 'artists':
+            return self._decode(self.artist_codes[rows], self.artist_categories)
+        if name == 'track_genre':
+            return self._decode(self.genre_codes[rows], self.genre_categories)
+        raise KeyError(name)
+
+    @staticmethod
+    def _decode(codes, categories):
+        values = categories[np.maximum(codes, 0)] if len(categories) else np.full(len(codes), None)
+        return np.where(codes >= 0, values, None)
+
+    def records(self, rows):
+        """Metadatos (track_id, track_name, artists, track_genre) de varias filas"""
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = ['track_id', 'track_name', 'artists', 'track_genre']
+        values = [self.column(name, rows).tolist() for name in columns]
+        return [dict(zip(columns, record)) for record in zip(*values)]
@@ -0,0 +1,142 @@
+"""
+Lectura del catálogo desde MongoDB
+Solo los campos que usa el modelo (proyección), leídos por lotes del cursor
+directamente a columnas preasignadas: sin lista intermedia de documentos
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CATALOG_FIELDS = ['track_id', 'track_name', 'artists', 'track_genre']
+ACTIVE_TRACKS_QUERY = {'deleted': {'$ne': True}}
+
+
+def catalog_projection(feature_columns):
+    """Proyección de Mongo con los metadatos y las features de audio"""
+    projection = {'_id': 0}
+    projection.update({field: 1 for field in CATALOG_FIELDS + list(feature_columns)})
+    return projection
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devuelve KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class CatalogColumns:
+    """
+    Columnas del catálogo que se llenan documento a documento.
+    - features: float32 (n, n_features), NaN si falta el campo
+    - track_id / track_name: arrays de objetos
+    - artists / track_genre: códigos int32 + diccionario de categorías
+    Crece ×1.5 si llegan más documentos que la capacidad estimada.
+    """
+
+    def __init__(self, feature_columns, capacity=0):
+        self.feature_columns = list(feature_columns)
+        self.size = 0
+        self._allocate(max(capacity, 1))
+        self.artist_lookup = {}
+        self.genre_lookup = {}
+
+    def _allocate(self, capacity):
+        old_size = self.size
+        features = np.full((capacity, len(self.feature_columns)), np.nan, dtype=np.float32)
+        track_ids = np.empty(capacity, dtype=object)
+        names = np.empty(capacity, dtype=object)
+        artist_codes = np.full(capacity, -1, dtype=np.int32)
+        genre_codes = np.full(capacity, -1, dtype=np.int32)
+        if old_size:
+            features[:old_size] = self.features[:old_size]
+            track_ids[:old_size] = self.track_ids[:old_size]
+            names[:old_size] = self.names[:old_size]
+            artist_codes[:old_size] = self.artist_codes[:old_size]
+            genre_codes[:old_size] = self.genre_codes[:old_size]
+        self.features = features
+        self.track_ids = track_ids
+        self.names = names
+        self.artist_codes = artist_codes
+        self.genre_codes = genre_codes
+
+    @staticmethod
+    def _code(lookup, value):
+        if value is None or value != value:
+            return -1
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(lookup)
+        return code
+
+    def append(self, doc):
+        row = self.size
+        if row == len(self.track_ids):
+            self._allocate(int(row * 1.5) + 1)
+
+        self.track_ids[row] = doc['track_id']
+        self.names[row] = doc.get('track_name')
+        self.artist_codes[row] = self._code(self.artist_lookup, doc.get('artists'))
+        self.genre_codes[row] = self._code(self.genre_lookup, doc.get('track_genre'))
+        features = self.features[row]
+        for i, name in enumerate(self.feature_columns):
+            value = doc.get(name)
+            if value is not None:
+                features[i] = value
+        self.size = row + 1
+
+    def extend(self, docs):
+        for doc in docs:
+            self.append(doc)
+        return self
+
+    def to_dataframe(self):
+        """DataFrame con metadatos (artistas y géneros categóricos) y features"""
+        n = self.size
+        data = {
+            'track_id': self.track_ids[:n],
+            'track_name': self.names[:n],
+            'artists': pd.Categorical.from_codes(
+                self.artist_codes[:n], np.array(list(self.artist_lookup), dtype=object)
+            ),
+            'track_genre': pd.Categorical.from_codes(
+                self.genre_codes[:n], np.array(list(self.genre_lookup), dtype=object)
+            ),
+        }
+        for i, name in enumerate(self.feature_columns):
+            data[name] = self.features[:n, i]
+        return pd.DataFrame(data)
+
+
+def read_catalog(tracks_collection, feature_columns, batch_size=5000):
+    """
+    Lee las canciones vigentes con proyección y por lotes.
+    Devuelve (DataFrame, stats) con tiempo de carga, documentos y pico de RSS.
+    """
+    started = time.perf_counter()
+    capacity = tracks_collection.estimated_document_count()
+    columns = CatalogColumns(feature_columns, capacity)
+
+    cursor = tracks_collection.find(
+        ACTIVE_TRACKS_QUERY, catalog_projection(feature_columns), batch_size=batch_size
+    )
+    columns.extend(cursor)
+    tracks_df = columns.to_dataframe()
+
+    stats = {
+        'documents': len(tracks_df),
+        'load_seconds': time.perf_counter() - started,
+        'dataframe_mb': float(tracks_df.memory_usage(deep=True).sum()) / 1e6,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    return tracks_df, stats
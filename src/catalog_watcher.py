@@ -0,0 +1,243 @@
+"""
+Actualización incremental del catálogo
+Sigue los cambios de la colección tracks (change streams o polling por
+updated_at) y los aplica al modelo en memoria sin recargar el catálogo
+"""
+
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+
+class CatalogWatcher:
+    """
+    Thread que lee cambios de tracks y llama a apply_fn(upserts, deleted_ids)
+    en lotes de hasta batch_size cambios (o cada max_batch_delay segundos).
+
+    - Change streams (replica set / Atlas): inserciones, modificaciones y
+      borrados en cuanto ocurren. Para los borrados se usa la pre-imagen si
+      la colección la tiene activada (changeStreamPreAndPostImages) y si no
+      un mapa _id → track_id construido al arrancar.
+    - Polling (mongod standalone, mocks): documentos con updated_at mayor o
+      igual que el último visto, sin los track_id ya aplicados con ese mismo
+      updated_at (varias escrituras pueden compartir timestamp y llegar en
+      distinto orden). Los borrados tienen que ser lógicos: {'deleted': True}
+      con updated_at actualizado.
+
+    La posición (updated_at visto o resume token del change stream) solo
+    avanza cuando apply_fn termina sin error; si falla, el mismo lote se
+    vuelve a aplicar en el siguiente intento.
+    """
+
+    def __init__(self, tracks_collection, apply_fn, poll_interval=5.0, batch_size=500,
+                 max_batch_delay=1.0, mode='auto', position=None, start_at_operation_time=None):
+        self.tracks = tracks_collection
+        self.apply_fn = apply_fn
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_batch_delay = max_batch_delay
+        self.mode = mode
+
+        # Punto de partida (latest_position) capturado antes de cargar el catálogo:
+        # último updated_at y track_id ya aplicados con ese mismo updated_at
+        self.since, self.seen_at_since = position or (None, set())
+        self.position_known = position is not None
+        self.start_at_operation_time = start_at_operation_time
+        self.resume_token = None
+        self.track_ids_by_oid = {}
+
+        self.active_mode = None
+        self.changes_applied = 0
+        self.failed_applies = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='catalog-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        if self.mode in ('auto', 'change_stream'):
+            try:
+                self.active_mode = 'change_stream'
+                self._watch()
+                return
+            except (OperationFailure, NotImplementedError, TypeError) as e:
+                # Standalone o backend sin change streams
+                if self.mode == 'change_stream':
+                    print(f"Error en change stream del catálogo: {e}")
+                    return
+                print(f"Change streams no disponibles ({e}); usando polling por updated_at")
+
+        self.active_mode = 'polling'
+        self._poll()
+
+    # --- Change streams ---
+
+    def _watch(self):
+        options = {
+            'full_document': 'updateLookup',
+            'full_document_before_change': 'whenAvailable',
+            'max_await_time_ms': int(self.max_batch_delay * 1000),
+        }
+        if self.resume_token is not None:
+            # Stream reabierto: desde el último lote aplicado
+            options['resume_after'] = self.resume_token
+        elif self.start_at_operation_time is not None:
+            options['start_at_operation_time'] = self.start_at_operation_time
+
+        with self.tracks.watch(**options) as stream:
+            # El stream ya está abierto: los cambios desde aquí no se pierden
+            self.track_ids_by_oid = {
+                doc['_id']: doc['track_id']
+                for doc in self.tracks.find({}, {'_id': 1, 'track_id': 1})
+            }
+            upserts, deletes = {}, set()
+            batch_token = None
+            batch_started = time.monotonic()
+
+            while not self.stop_event.is_set():
+                try:
+                    change = stream.try_next()
+                except PyMongoError as e:
+                    print(f"Error leyendo change stream del catálogo: {e}")
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+
+                if change is not None:
+                    batch_token = stream.resume_token
+                    self._collect_change(change, upserts, deletes)
+
+                pending = len(upserts) + len(deletes)
+                if pending and (pending >= self.batch_size or change is None
+                                or time.monotonic() - batch_started >= self.max_batch_delay):
+                    if not self._apply(upserts, deletes):
+                        # El lote sigue pendiente (con lo que llegue mientras tanto)
+                        self.stop_event.wait(self.poll_interval)
+                        continue
+                    self.resume_token = batch_token
+                    upserts, deletes = {}, set()
+                    batch_started = time.monotonic()
+
+            if (upserts or deletes) and self._apply(upserts, deletes):
+                self.resume_token = batch_token
+
+    def _collect_change(self, change, upserts, deletes):
+        operation = change.get('operationType')
+        oid = change.get('documentKey', {}).get('_id')
+
+        if operation in ('insert', 'update', 'replace'):
+            doc = change.get('fullDocument')
+            if doc is None:
+                # El documento se borró antes de leerlo; llegará su delete
+                return
+            self.track_ids_by_oid[oid] = doc['track_id']
+            self._collect_document(doc, upserts, deletes)
+        elif operation == 'delete':
+            before = change.get('fullDocumentBeforeChange') or {}
+            track_id = before.get('track_id') or self.track_ids_by_oid.pop(oid, None)
+            if track_id is None:
+                print(f"Advertencia: borrado de {oid} sin track_id conocido")
+                return
+            upserts.pop(track_id, None)
+            deletes.add(track_id)
+
+    # --- Polling ---
+
+    def _poll(self):
+        if not self.position_known:
+            self.since, self.seen_at_since = self.latest_position(self.tracks)
+
+        while not self.stop_event.is_set():
+            try:
+                self._poll_once()
+            except PyMongoError as e:
+                print(f"Error consultando cambios del catálogo: {e}")
+            self.stop_event.wait(self.poll_interval)
+
+    @staticmethod
+    def latest_position(tracks):
+        """(último updated_at, track_id con ese updated_at) de la colección"""
+        latest = list(
+            tracks.find({'updated_at': {'$exists': True}}, {'_id': 0, 'updated_at': 1})
+            .sort('updated_at', -1).limit(1)
+        )
+        if not latest:
+            return None, set()
+        since = latest[0]['updated_at']
+        seen = {doc['track_id'] for doc in tracks.find({'updated_at': since}, {'_id': 0, 'track_id': 1})}
+        return since, seen
+
+    def _poll_once(self):
+        """Lee todos los cambios pendientes, batch_size documentos por consulta"""
+        while not self.stop_event.is_set():
+            if self.since is None:
+                query = {'updated_at': {'$exists': True}}
+            else:
+                query = {'$or': [
+                    {'updated_at': {'$gt': self.since}},
+                    {'updated_at': self.since, 'track_id': {'$nin': list(self.seen_at_since)}},
+                ]}
+
+            docs = list(
+                self.tracks.find(query, {'_id': 0})
+                .sort([('updated_at', 1), ('track_id', 1)]).limit(self.batch_size)
+            )
+            if not docs:
+                return
+
+            upserts, deletes = {}, set()
+            for doc in docs:
+                self._collect_document(doc, upserts, deletes)
+            if not self._apply(upserts, deletes):
+                # Sin avanzar: el siguiente poll vuelve a leer estos documentos
+                return
+
+            for doc in docs:
+                if doc['updated_at'] != self.since:
+                    self.since = doc['updated_at']
+                    self.seen_at_since = set()
+                self.seen_at_since.add(doc['track_id'])
+            if len(docs) < self.batch_size:
+                return
+
+    # --- Común ---
+
+    @staticmethod
+    def _collect_document(doc, upserts, deletes):
+        doc = {key: value for key, value in doc.items() if key != '_id'}
+        track_id = doc['track_id']
+        if doc.get('deleted'):
+            upserts.pop(track_id, None)
+            deletes.add(track_id)
+        else:
+            deletes.discard(track_id)
+            upserts[track_id] = doc
+
+    def _apply(self, upserts, deletes):
+        """True si apply_fn aplicó el lote"""
+        try:
+            self.changes_applied += self.apply_fn(list(upserts.values()), list(deletes))
+        except Exception as e:
+            self.failed_applies += 1
+            print(f"Error aplicando cambios del catálogo: {e}")
+            return False
+        return True
+
+    def get_stats(self):
+        return {
+            'mode': self.active_mode,
+            'changes_applied': self.changes_applied,
+            'failed_applies': self.failed_applies,
+            'since': self.since,
+        }
@@ -0,0 +1,360 @@
+"""
+Modelo colaborativo item–item
+Matriz usuario–canción dispersa (CSR, suma de pesos play/like/skip) y su
+co-ocurrencia canción–canción G = RᵀR; las consultas leen una vista podada a
+los vecinos más fuertes de cada canción. Se construye desde user_interactions y se actualiza por
+micro-lotes desde un thread propio; las consultas leen el último snapshot
+"""
+
+import threading
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def grown(matrix, shape):
+    """Misma matriz CSR con más filas/columnas (sin copiar los datos)"""
+    if matrix.shape == shape:
+        return matrix
+    indptr = np.concatenate([
+        matrix.indptr,
+        np.full(shape[0] - matrix.shape[0], matrix.indptr[-1], dtype=matrix.indptr.dtype),
+    ])
+    return sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+
+def top_k_per_row(matrix, k):
+    """Conserva en cada fila las k entradas de mayor valor absoluto"""
+    counts = np.diff(matrix.indptr)
+    over = counts > k
+    if not over.any():
+        return matrix
+
+    # Solo se ordenan las entradas de las filas que pasan de k
+    entries = np.flatnonzero(np.repeat(over, counts))
+    over_counts = counts[over]
+    group = np.repeat(np.arange(len(over_counts)), over_counts)
+    order = np.lexsort((-np.abs(matrix.data[entries]), group))
+    starts = np.concatenate([[0], np.cumsum(over_counts)[:-1]])
+    rank = np.arange(len(entries)) - np.repeat(starts, over_counts)
+
+    keep = np.ones(matrix.nnz, dtype=bool)
+    keep[entries[order[rank >= k]]] = False
+    indptr = np.concatenate([[0], np.cumsum(np.minimum(counts, k))])
+    return sp.csr_matrix(
+        (matrix.data[keep], matrix.indices[keep], indptr.astype(matrix.indptr.dtype)),
+        shape=matrix.shape
+    )
+
+
+def replace_rows(matrix, rows, replacement):
+    """Matriz CSR con las filas rows (ordenadas) tomadas de replacement (len(rows) filas)"""
+    mask = np.zeros(matrix.shape[0], dtype=bool)
+    mask[rows] = True
+    old_counts = np.diff(matrix.indptr)
+    counts = old_counts.copy()
+    counts[rows] = np.diff(replacement.indptr)
+    indptr = np.concatenate([[0], np.cumsum(counts)]).astype(matrix.indptr.dtype)
+
+    # Las filas conservan su orden: las entradas nuevas van donde estaban las viejas
+    new_entries = np.repeat(mask, counts)
+    data = np.empty(indptr[-1], dtype=matrix.dtype)
+    indices = np.empty(indptr[-1], dtype=matrix.indices.dtype)
+    kept = np.repeat(~mask, old_counts)
+    data[~new_entries] = matrix.data[kept]
+    indices[~new_entries] = matrix.indices[kept]
+    data[new_entries] = replacement.data
+    indices[new_entries] = replacement.indices
+    return sp.csr_matrix((data, indices, indptr), shape=matrix.shape)
+
+
+def without_diagonal(matrix):
+    matrix = matrix.tocoo()
+    off = matrix.row != matrix.col
+    return sp.csr_matrix(
+        (matrix.data[off], (matrix.row[off], matrix.col[off])), shape=matrix.shape, dtype=np.float32
+    )
+
+
+class CooccurrenceModel:
+    """
+    Co-ocurrencias canción–canción a partir de la matriz usuario–canción R.
+
+    - G[i, j] = Σ_u c_ui · c_uj (solo fuera de la diagonal), con c_u las
+      max_user_items canciones de más peso del usuario u y r_ui la suma de los
+      pesos de sus interacciones con la canción i; un skip (peso negativo)
+      resta afinidad
+    - norms[i] = Σ_u r_ui²: la similitud es el coseno G[i, j] / √(norms[i]·norms[j])
+    - G se guarda completo (acumulador); las consultas leen una vista con las
+      max_neighbors entradas más fuertes de cada fila. Memoria O(pares de
+      canciones que co-ocurren, ≤ usuarios·max_user_items²), no O(canciones²)
+    - add_events encola; el thread de actualización suma al acumulador
+      ΔG = C'ᵀC' - CᵀC (C y C' = filas recortadas de los usuarios del lote antes
+      y después del lote), vuelve a podar solo las filas que cambian y publica
+      el snapshot nuevo cada update_interval segundos. El resultado es el mismo
+      que el de build con todas las interacciones
+    """
+
+    def __init__(self, max_neighbors=50, max_user_items=200, update_interval=2.0,
+                 build_chunk_users=20000, max_pending=200000):
+        self.max_neighbors = max_neighbors
+        self.max_user_items = max_user_items
+        self.update_interval = update_interval
+        self.build_chunk_users = build_chunk_users
+        self.max_pending = max_pending
+
+        self.user_codes = {}
+        self.user_items = sp.csr_matrix((0, 0), dtype=np.float32)
+        # G sin podar: solo lo usa el thread de actualización
+        self.cooccurrence = sp.csr_matrix((0, 0), dtype=np.float32)
+        # Snapshot de lectura: se reemplaza entero (las consultas no toman lock)
+        self.state = (sp.csr_matrix((0, 0), dtype=np.float32), np.zeros(0))
+
+        self.condition = threading.Condition()
+        self.update_lock = threading.Lock()
+        self.pending = []
+        self.pending_events = 0
+        self.is_running = False
+        self.updater_thread = None
+
+        self.version = 0
+        self.events_applied = 0
+        self.build_seconds = 0.0
+        self.last_update_ms = 0.0
+
+    def __len__(self):
+        return self.state[0].shape[0]
+
+    def _user_code(self, user_id):
+        code = self.user_codes.get(user_id)
+        if code is None:
+            code = self.user_codes[user_id] = len(self.user_codes)
+        return code
+
+    def build(self, batches, n_items):
+        """
+        Construye R y G desde lotes (user_ids, filas, pesos) ya agregados por
+        (usuario, canción) o no: los duplicados se suman
+        """
+        started = time.perf_counter()
+        self.user_codes = {}
+        users, rows, weights = [], [], []
+        for user_ids, batch_rows, batch_weights in batches:
+            users.append(np.fromiter((self._user_code(u) for u in user_ids), np.int64, len(user_ids)))
+            rows.append(np.asarray(batch_rows, dtype=np.int64))
+            weights.append(np.asarray(batch_weights, dtype=np.float32))
+
+        n_users = len(self.user_codes)
+        if users:
+            users, rows, weights = np.concatenate(users), np.concatenate(rows), np.concatenate(weights)
+            n_items = max(n_items, int(rows.max()) + 1 if len(rows) else 0)
+        else:
+            users = rows = np.empty(0, dtype=np.int64)
+            weights = np.empty(0, dtype=np.float32)
+        user_items = sp.csr_matrix((weights, (users, rows)), shape=(n_users, n_items), dtype=np.float32)
+        user_items.eliminate_zeros()
+        user_items.sort_indices()
+
+        # G por bloques de usuarios: los productos intermedios no pasan de un bloque
+        capped = top_k_per_row(user_items, self.max_user_items)
+        cooccurrence = sp.csr_matrix((n_items, n_items), dtype=np.float32)
+        for start in range(0, n_users, self.build_chunk_users):
+            block = capped[start:start + self.build_chunk_users]
+            cooccurrence = cooccurrence + without_diagonal(block.T @ block)
+        cooccurrence.eliminate_zeros()
+        cooccurrence.sort_indices()
+        norms = np.asarray(user_items.multiply(user_items).sum(axis=0), dtype=np.float64).ravel()
+
+        served = top_k_per_row(cooccurrence, self.max_neighbors)
+        served.sort_indices()
+        self.user_items = user_items
+        self.cooccurrence = cooccurrence
+        self.state = (served, norms)
+        self.version += 1
+        self.build_seconds = time.perf_counter() - started
+        return self
+
+    # --- Actualización incremental ---
+
+    def add_events(self, user_ids, rows, weights):
+        """Encola interacciones (usuario, fila del catálogo, peso) para el próximo lote"""
+        if not len(rows):
+            return
+        with self.condition:
+            self.pending.append((list(user_ids), np.asarray(rows, dtype=np.int64),
+                                 np.asarray(weights, dtype=np.float32)))
+            self.pending_events += len(rows)
+            if not self.is_running:
+                inline = True
+            else:
+                inline = False
+                if self.pending_events >= self.max_pending:
+                    # Backpressure: esperar al thread de actualización
+                    self.condition.notify_all()
+                    self.condition.wait_for(lambda: not self.pending, timeout=self.update_interval * 5)
+        if inline:
+            self.update()
+
+    def start(self):
+        with self.condition:
+            if self.is_running:
+                return
+            self.is_running = True
+        self.updater_thread = threading.Thread(target=self._updater_loop, name='cooccurrence', daemon=True)
+        self.updater_thread.start()
+
+    def _updater_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait(self.update_interval)
+                running = self.is_running
+            self.update()
+            if not running:
+                return
+
+    def update(self):
+        """Aplica los eventos pendientes y publica el snapshot nuevo"""
+        with self.update_lock:
+            with self.condition:
+                batches = self.pending
+                self.pending = []
+                self.pending_events = 0
+                self.condition.notify_all()
+            if not batches:
+                return 0
+            return self._merge(batches)
+
+    def _merge(self, batches):
+        """Suma un lote a R, G y las normas (solo las filas de los usuarios del lote)"""
+        started = time.perf_counter()
+        user_ids = [u for batch in batches for u in batch[0]]
+        users = np.fromiter((self._user_code(u) for u in user_ids), np.int64, len(user_ids))
+        rows = np.concatenate([batch[1] for batch in batches])
+        weights = np.concatenate([batch[2] for batch in batches])
+
+        served, norms = self.state
+        n_items = max(self.cooccurrence.shape[0], int(rows.max()) + 1)
+        n_users = len(self.user_codes)
+        user_items = grown(self.user_items, (n_users, n_items))
+
+        delta = sp.csr_matrix((weights, (users, rows)), shape=(n_users, n_items), dtype=np.float32)
+        touched = np.unique(users)
+        current = user_items[touched]
+        changes = delta[touched]
+        updated = current + changes
+        updated.eliminate_zeros()
+        updated.sort_indices()
+
+        # ΔG: aporte de los usuarios del lote con sus canciones de más peso
+        # después del lote menos el de antes (el top de cada usuario puede cambiar)
+        before = top_k_per_row(current, self.max_user_items)
+        after = top_k_per_row(updated, self.max_user_items)
+        delta_g = without_diagonal(after.T @ after - before.T @ before)
+        delta_g.eliminate_zeros()
+        new_norms = np.zeros(n_items)
+        new_norms[:len(norms)] = norms
+        new_norms += np.asarray(
+            (current.multiply(changes) * 2 + changes.multiply(changes)).sum(axis=0), dtype=np.float64
+        ).ravel()
+
+        cooccurrence = grown(self.cooccurrence, (n_items, n_items)) + delta_g
+        cooccurrence.eliminate_zeros()
+        cooccurrence.sort_indices()
+
+        # Solo se vuelven a podar las filas de G que cambiaron
+        changed = np.unique(delta_g.indices)
+        pruned = top_k_per_row(cooccurrence[changed], self.max_neighbors)
+        pruned.sort_indices()
+        served = replace_rows(grown(served, (n_items, n_items)), changed, pruned)
+
+        user_items = user_items + delta
+        user_items.eliminate_zeros()
+        user_items.sort_indices()
+        self.user_items = user_items
+        self.cooccurrence = cooccurrence
+        self.state = (served, new_norms)
+        self.version += 1
+        self.events_applied += len(rows)
+        self.last_update_ms = (time.perf_counter() - started) * 1000
+        return len(rows)
+
+    def close(self, timeout=10):
+        """Detiene el thread aplicando lo pendiente"""
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        if self.updater_thread:
+            self.updater_thread.join(timeout=timeout)
+            self.updater_thread = None
+        self.update()
+
+    # --- Consultas ---
+
+    def similarities(self, row, candidates):
+        """Coseno colaborativo de row contra cada candidato (0 sin co-ocurrencias)"""
+        cooccurrence, norms = self.state
+        candidates = np.asarray(candidates, dtype=np.int64)
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        if row >= len(norms) or norms[row] <= 0 or not len(candidates):
+            return scores
+
+        start, end = cooccurrence.indptr[row], cooccurrence.indptr[row + 1]
+        cols = cooccurrence.indices[start:end]
+        if not len(cols):
+            return scores
+        known = candidates < len(norms)
+        pos = np.minimum(np.searchsorted(cols, candidates), len(cols) - 1)
+        hit = known & (cols[pos] == candidates)
+        hit_rows = candidates[hit]
+        scores[hit] = cooccurrence.data[start:end][pos[hit]] / np.sqrt(norms[row] * norms[hit_rows])
+        return np.clip(scores, -1.0, 1.0)
+
+    def neighbors(self, row, k):
+        """(filas, coseno) de las k canciones con más co-ocurrencia positiva"""
+        cooccurrence, norms = self.state
+        if row >= len(norms) or norms[row] <= 0 or k <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        start, end = cooccurrence.indptr[row], cooccurrence.indptr[row + 1]
+        cols = cooccurrence.indices[start:end]
+        scores = np.clip(
+            cooccurrence.data[start:end] / np.sqrt(norms[row] * norms[cols]), -1.0, 1.0
+        ).astype(np.float32)
+        positive = scores > 0
+        cols, scores = cols[positive], scores[positive]
+        if len(cols) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            cols, scores = cols[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return cols[order].astype(np.int32), scores[order]
+
+    def has_signal(self, row):
+        """True si la canción tiene co-ocurrencias (si no, el scoring es solo por contenido)"""
+        cooccurrence, norms = self.state
+        return row < len(norms) and cooccurrence.indptr[row + 1] > cooccurrence.indptr[row]
+
+    @property
+    def nbytes(self):
+        cooccurrence, norms = self.state
+        return sum(
+            m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+            for m in (cooccurrence, self.cooccurrence, self.user_items)
+        ) + norms.nbytes
+
+    def get_stats(self):
+        cooccurrence, _ = self.state
+        with self.condition:
+            pending = self.pending_events
+        return {
+            'users': len(self.user_codes),
+            'user_item_entries': int(self.user_items.nnz),
+            'cooccurrence_entries': int(cooccurrence.nnz),
+            'accumulated_entries': int(self.cooccurrence.nnz),
+            'memory_mb': self.nbytes / 1e6,
+            'pending_events': pending,
+            'events_applied': self.events_applied,
+            'last_update_ms': self.last_update_ms,
+            'build_seconds': self.build_seconds,
+            'version': self.version,
+        }
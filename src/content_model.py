@@ -0,0 +1,132 @@
+"""
+Modelo por contenido
+Features de audio normalizadas (StandardScaler), índice track_id → fila con
+los metadatos del catálogo e índice de vecinos top-K; se construye desde un
+DataFrame o desde un snapshot memmap
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from catalog_index import CatalogIndex
+from model_snapshot import load_snapshot, save_snapshot
+from neighbor_index import NeighborIndex
+
+AUDIO_FEATURES = [
+    'danceability', 'energy', 'key', 'loudness', 'mode',
+    'speechiness', 'acousticness', 'instrumentalness',
+    'liveness', 'valence', 'tempo'
+]
+
+CATALOG_COLUMNS = ['track_id', 'track_name', 'artists', 'track_genre']
+
+
+def catalog_changes(upserts):
+    """DataFrame de altas/modificaciones (la última por track_id) con las columnas del catálogo"""
+    changes = pd.DataFrame(list(upserts))
+    if changes.empty:
+        changes = pd.DataFrame(columns=CATALOG_COLUMNS)
+    changes = changes.drop(columns=['_id'], errors='ignore').drop_duplicates('track_id', keep='last')
+    return changes.reindex(columns=list(dict.fromkeys(CATALOG_COLUMNS + list(changes.columns))))
+
+
+class ContentModel:
+    """
+    Catálogo + scaler + índice de vecinos.
+
+    Los cambios incrementales del catálogo usan el scaler ya ajustado (sin
+    refit) y recalculan solo las listas de vecinos afectadas; self.lock los
+    aplica de uno en uno.
+    """
+
+    def __init__(self, neighbor_index=None, audio_features=AUDIO_FEATURES):
+        self.audio_features = list(audio_features)
+        self.neighbor_index = neighbor_index if neighbor_index is not None else NeighborIndex()
+        self.catalog = CatalogIndex()
+        self.scaler = StandardScaler()
+        self.tracks_df = None
+        self.lock = threading.Lock()
+
+    def build(self, tracks_df):
+        """Construye catálogo, scaler e índice de vecinos a partir de un DataFrame de canciones"""
+        self.tracks_df = tracks_df.reset_index(drop=True)
+
+        # Preparar features
+        features = self.tracks_df[self.audio_features].fillna(0)
+        features_scaled = self.scaler.fit_transform(features)
+
+        # Índice de vecinos top-K (sin matriz N×N)
+        self.neighbor_index.build(features_scaled)
+
+        # Índice track_id → fila y columnas de metadatos
+        self.catalog.build(self.tracks_df)
+
+    def scale(self, changes):
+        """Features normalizadas de un DataFrame de cambios con el scaler ya ajustado"""
+        features = changes.reindex(columns=self.audio_features).astype(float).fillna(0)
+        if not len(features):
+            return np.empty((0, len(self.audio_features)))
+        return self.scaler.transform(features)
+
+    def refresh_dataframe(self):
+        """tracks_df tras un cambio del catálogo"""
+        self.tracks_df = self.catalog.to_dataframe()
+
+    def snapshot_params(self):
+        """Parámetros del modelo que invalidan el snapshot si cambian"""
+        return {
+            'audio_features': self.audio_features,
+            'n_neighbors': self.neighbor_index.n_neighbors,
+            'backend': self.neighbor_index.backend,
+            'ann_options': self.neighbor_index.ann_options,
+            'exact_threshold': self.neighbor_index.exact_threshold,
+        }
+
+    def save_snapshot(self, directory, key):
+        """Guarda catálogo, scaler e índice de vecinos en disco"""
+        try:
+            groups = {
+                'catalog': self.catalog.to_arrays(),
+                'index': self.neighbor_index.to_arrays(),
+                'scaler': {
+                    'mean': self.scaler.mean_,
+                    'scale': self.scaler.scale_,
+                    'var': self.scaler.var_,
+                },
+            }
+            meta = {
+                'active_backend': self.neighbor_index.active_backend,
+                'n_samples_seen': int(self.scaler.n_samples_seen_),
+                'params': self.snapshot_params(),
+            }
+            path = save_snapshot(directory, key, groups, meta)
+            print(f"Snapshot guardado en {path}")
+        except Exception as e:
+            print(f"Error guardando snapshot: {e}")
+
+    def load_snapshot(self, directory, key):
+        """Carga el modelo desde un snapshot memmap (sin copias); False si no hay"""
+        try:
+            snapshot = load_snapshot(directory, key)
+        except Exception as e:
+            print(f"Error leyendo snapshot: {e}")
+            return False
+        if snapshot is None:
+            return False
+
+        groups, meta = snapshot
+
+        self.scaler.mean_ = np.asarray(groups['scaler']['mean'])
+        self.scaler.scale_ = np.asarray(groups['scaler']['scale'])
+        self.scaler.var_ = np.asarray(groups['scaler']['var'])
+        self.scaler.n_samples_seen_ = meta['n_samples_seen']
+        self.scaler.n_features_in_ = len(self.audio_features)
+        self.scaler.feature_names_in_ = np.asarray(self.audio_features, dtype=object)
+
+        self.neighbor_index.from_arrays(groups['index'], meta['active_backend'])
+        self.catalog.from_arrays(groups['catalog'])
+        self.refresh_dataframe()
+        return True
@@ -0,0 +1,67 @@
+"""
+Versión activa del estado derivado
+Un documento en kappa_meta indica qué colecciones de popularidad y perfiles
+usa el procesador y con qué pesos se calcularon. El replay escribe una
+versión nueva en colecciones propias y la publica reemplazando ese documento
+(una escritura atómica)
+"""
+
+from datetime import datetime
+
+META_COLLECTION = 'kappa_meta'
+DERIVED_STATE_ID = 'derived_state'
+
+INTERACTION_WEIGHTS = {'play': 1, 'like': 3, 'skip': -1}
+
+# Versión 0: las colecciones originales, sin replay
+DEFAULT_DERIVED_STATE = {
+    'version': 0,
+    'popularity_collection': 'track_popularity',
+    'profiles_collection': 'user_profiles',
+    'weights': INTERACTION_WEIGHTS,
+}
+
+
+def versioned_collections(version):
+    return {
+        'popularity_collection': f'track_popularity__v{version}',
+        'profiles_collection': f'user_profiles__v{version}',
+    }
+
+
+def derived_state_from_doc(doc):
+    """Estado publicado (o el de por defecto si nunca se hizo un replay)"""
+    doc = doc or {}
+    state = {**DEFAULT_DERIVED_STATE, **{k: v for k, v in doc.items() if k != '_id'}}
+    state['weights'] = dict(state['weights'])
+    return state
+
+
+def read_derived_state(db):
+    return derived_state_from_doc(db[META_COLLECTION].find_one({'_id': DERIVED_STATE_ID}))
+
+
+def publish_derived_state(db, version, weights, **info):
+    """Activa una versión: los procesadores la usan al volver a cargar"""
+    state = {
+        'version': version,
+        **versioned_collections(version),
+        'weights': dict(weights),
+        'published_at': datetime.now(),
+        **info,
+    }
+    db[META_COLLECTION].replace_one({'_id': DERIVED_STATE_ID}, state, upsert=True)
+    return state
+
+
+def drop_old_versions(db, current_version, keep=2):
+    """Elimina las colecciones de versiones anteriores salvo las keep más recientes"""
+    dropped = []
+    for name in db.list_collection_names():
+        prefix, sep, suffix = name.rpartition('__v')
+        if not sep or prefix not in ('track_popularity', 'user_profiles') or not suffix.isdigit():
+            continue
+        if int(suffix) <= current_version - keep:
+            db[name].drop()
+            dropped.append(name)
+    return dropped
@@ -0,0 +1,136 @@
+"""
+Buffer de escritura de eventos (write-behind)
+Acepta eventos al instante y los escribe en lote desde un thread propio
+"""
+
+import threading
+import time
+
+
+class BufferFullError(Exception):
+    """El buffer sigue lleno después de esperar put_timeout segundos"""
+
+
+class EventWriteBuffer:
+    """
+    Buffer acotado con flush por tamaño o por tiempo.
+
+    - flush_fn(batch) escribe una lista de eventos (p. ej. insert_many)
+    - put() bloquea si el buffer está lleno (backpressure); si sigue lleno
+      tras put_timeout lanza BufferFullError y cuenta el evento como descartado
+    - si flush_fn falla, el lote vuelve al buffer y se reintenta
+    - close() hace el flush final
+    """
+
+    def __init__(self, flush_fn, batch_size=500, flush_interval=1.0,
+                 max_pending=10000, put_timeout=5.0):
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.is_running = False
+        self.writer_thread = None
+
+        self.flushed_events = 0
+        self.failed_flushes = 0
+        self.blocked_puts = 0
+        self.dropped_events = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def start(self):
+        """Inicia el thread de escritura"""
+        with self.condition:
+            if self.is_running:
+                return
+            self.is_running = True
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def put(self, event):
+        """Encola un evento; bloquea mientras el buffer esté lleno"""
+        if not self.is_running:
+            self.start()
+
+        with self.condition:
+            if len(self.pending) >= self.max_pending:
+                self.blocked_puts += 1
+                self.condition.notify_all()
+                if not self.condition.wait_for(
+                    lambda: len(self.pending) < self.max_pending, timeout=self.put_timeout
+                ):
+                    self.dropped_events += 1
+                    raise BufferFullError(
+                        f"Buffer de eventos lleno ({self.max_pending} pendientes)"
+                    )
+
+            self.pending.append(event)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+    def _writer_loop(self):
+        """Espera a tener un lote completo o a que pase flush_interval"""
+        while True:
+            with self.condition:
+                deadline = time.monotonic() + self.flush_interval
+                while self.is_running and len(self.pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                running = self.is_running
+
+            flushed = self.flush()
+
+            if not running:
+                return
+            if not flushed:
+                # Esperar antes de reintentar un lote fallido
+                with self.condition:
+                    self.condition.wait(self.flush_interval)
+
+    def flush(self):
+        """Escribe todo lo pendiente en lotes de batch_size"""
+        while True:
+            with self.condition:
+                if not self.pending:
+                    return True
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                self.condition.notify_all()
+
+            try:
+                self.flush_fn(batch)
+                self.flushed_events += len(batch)
+            except Exception as e:
+                print(f"Error escribiendo lote de eventos: {e}")
+                self.failed_flushes += 1
+                # Devolver el lote al frente para reintentarlo
+                with self.condition:
+                    self.pending[:0] = batch
+                return False
+
+    def close(self, timeout=10):
+        """Detiene el thread garantizando el flush final"""
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        if self.writer_thread:
+            self.writer_thread.join(timeout=timeout)
+            self.writer_thread = None
+        return self.flush()
+
+    def get_stats(self):
+        """Métricas del buffer"""
+        return {
+            'pending': len(self.pending),
+            'flushed': self.flushed_events,
+            'failed_flushes': self.failed_flushes,
+            'blocked_puts': self.blocked_puts,
+            'dropped': self.dropped_events,
+        }
@@ -0,0 +1,494 @@
+"""
+Log local de eventos (append-only, por segmentos)
+add_event escribe en el log y los consumidores (procesador, escritura en
+MongoDB) lo leen desde su último offset confirmado: tras una caída o un
+reinicio siguen exactamente donde quedaron
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+# Registro: longitud del payload + crc32 del payload (longitud 0 = fin de datos)
+RECORD_HEADER = struct.Struct('<II')
+# Payload: timestamp, longitudes de user_id, track_id e interaction_type
+EVENT_HEADER = struct.Struct('<dHHB')
+
+SEGMENT_SUFFIX = '.log'
+CHECKPOINTS_FILE = 'checkpoints.json'
+
+
+def encode_event(event):
+    user_id = str(event['user_id']).encode()
+    track_id = str(event['track_id']).encode()
+    interaction_type = str(event['interaction_type']).encode()
+    header = EVENT_HEADER.pack(
+        event['timestamp'].timestamp(), len(user_id), len(track_id), len(interaction_type)
+    )
+    return header + user_id + track_id + interaction_type
+
+
+def decode_event(payload):
+    timestamp, user_len, track_len, type_len = EVENT_HEADER.unpack_from(payload)
+    start = EVENT_HEADER.size
+    user_end = start + user_len
+    track_end = user_end + track_len
+    return {
+        'user_id': payload[start:user_end].decode(),
+        'track_id': payload[user_end:track_end].decode(),
+        'interaction_type': payload[track_end:track_end + type_len].decode(),
+        'timestamp': datetime.fromtimestamp(timestamp),
+    }
+
+
+class Segment:
+    """
+    Un archivo del log mapeado en memoria. El nombre es el offset global (en
+    bytes) de su primer registro; el activo se crea con el tamaño completo y
+    al cerrarse se recorta a los datos escritos
+    """
+
+    def __init__(self, path, base, size=None):
+        self.path = path
+        self.base = base
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        if size is not None and os.fstat(self.file.fileno()).st_size < size:
+            self.file.truncate(size)
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), self.size) if self.size else None
+        self.end = self.recover()
+        self.synced = self.end
+
+    def recover(self):
+        """Fin de los datos válidos; un registro a medio escribir (crc) se descarta"""
+        pos = 0
+        while pos + RECORD_HEADER.size <= self.size:
+            length, crc = RECORD_HEADER.unpack_from(self.mm, pos)
+            end = pos + RECORD_HEADER.size + length
+            if length == 0:
+                break
+            if end > self.size or zlib.crc32(self.mm[pos + RECORD_HEADER.size:end]) != crc:
+                print(f"Log de eventos: registro incompleto en {self.path}:{pos}, se descarta")
+                self.mm[pos:] = bytes(self.size - pos)
+                self.mm.flush()
+                break
+            pos = end
+        return pos
+
+    def free(self):
+        return self.size - self.end
+
+    def write(self, data):
+        self.mm[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def sync(self):
+        """msync de lo escrito desde el último sync (desde el inicio de página)"""
+        if self.synced == self.end:
+            return 0
+        start = self.synced - self.synced % mmap.PAGESIZE
+        self.mm.flush(start, self.end - start)
+        written = self.end - self.synced
+        self.synced = self.end
+        return written
+
+    def seal(self):
+        """Recorta el archivo a los datos escritos (segmento de solo lectura)"""
+        self.sync()
+        self.mm.close()
+        self.file.truncate(self.end)
+        os.fsync(self.file.fileno())
+        self.size = self.end
+        self.mm = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ) if self.size else None
+
+    def scan(self, pos, max_records, limit):
+        """Posición tras hasta max_records registros completos desde pos (sin pasar de limit)"""
+        count = 0
+        while count < max_records and pos + RECORD_HEADER.size <= limit:
+            length, _ = RECORD_HEADER.unpack_from(self.mm, pos)
+            if length == 0 or pos + RECORD_HEADER.size + length > limit:
+                break
+            pos += RECORD_HEADER.size + length
+            count += 1
+        return pos, count
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.file.close()
+
+
+def iter_records(data):
+    """(posición, payload) de cada registro de un bloque de registros completos"""
+    pos = 0
+    while pos < len(data):
+        length, _ = RECORD_HEADER.unpack_from(data, pos)
+        start = pos + RECORD_HEADER.size
+        yield pos, data[start:start + length]
+        pos = start + length
+
+
+class EventLog:
+    """
+    Log de eventos durable con offsets confirmados por consumidor.
+
+    - append() copia el registro al segmento activo (mmap): un crash del
+      proceso no pierde nada; el msync a disco se agrupa cada fsync_interval
+      segundos o cada fsync_bytes bytes (una caída del SO pierde como mucho
+      eso). sync() fuerza el msync
+    - read(offset) devuelve eventos y el offset siguiente; commit(name, offset)
+      guarda la posición de un consumidor (escritura atómica)
+    - prepare(name, offset) guarda antes de escribir hasta dónde llega una
+      escritura que aún no se confirmó: tras una caída, prepared(name) dice
+      qué rango hay que terminar de aplicar (con escrituras idempotentes)
+    - log_id identifica el log (aleatorio al crearlo): con el offset de un
+      registro da un id estable del evento
+    - los segmentos que todos los consumidores ya confirmaron se borran
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync_interval=0.05,
+                 fsync_bytes=1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.appended = threading.Condition(self.lock)
+        self.segments = []
+        self.bases = []
+        self.records_appended = 0
+        self.fsyncs = 0
+        self.deleted_segments = 0
+
+        bases = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        for base in bases[:-1]:
+            self._add_segment(Segment(self._segment_path(base), base))
+        # El último es el activo: vuelve a tener el tamaño completo
+        self._add_segment(Segment(
+            self._segment_path(bases[-1] if bases else 0), bases[-1] if bases else 0,
+            size=segment_bytes
+        ))
+
+        self.log_id, self.checkpoints, self.prepared_offsets = self._read_checkpoints()
+        if self.log_id is None:
+            self.log_id = os.urandom(8).hex()
+            with self.lock:
+                self._write_checkpoints()
+
+        self.is_running = True
+        self.sync_thread = threading.Thread(target=self._sync_loop, name='event-log-sync', daemon=True)
+        self.sync_thread.start()
+
+    def _segment_path(self, base):
+        return os.path.join(self.directory, f"{base:020d}{SEGMENT_SUFFIX}")
+
+    def _add_segment(self, segment):
+        self.segments.append(segment)
+        self.bases.append(segment.base)
+
+    @property
+    def active(self):
+        return self.segments[-1]
+
+    @property
+    def start_offset(self):
+        return self.segments[0].base
+
+    @property
+    def end_offset(self):
+        with self.lock:
+            return self.active.base + self.active.end
+
+    def append(self, event):
+        """Agrega un evento; devuelve el offset siguiente"""
+        payload = encode_event(event)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        if len(record) > self.segment_bytes:
+            raise ValueError(f"Evento de {len(record)} bytes mayor que el segmento")
+
+        with self.lock:
+            if self.active.free() < len(record):
+                self._roll()
+            self.active.write(record)
+            self.records_appended += 1
+            unsynced = self.active.end - self.active.synced
+            self.appended.notify_all()
+            offset = self.active.base + self.active.end
+        if unsynced >= self.fsync_bytes:
+            self.sync()
+        return offset
+
+    def _roll(self):
+        """Cierra el segmento activo y abre uno nuevo en el offset actual"""
+        self.active.seal()
+        self.fsyncs += 1
+        base = self.active.base + self.active.end
+        self._add_segment(Segment(self._segment_path(base), base, size=self.segment_bytes))
+
+    def sync(self):
+        """msync del segmento activo"""
+        with self.lock:
+            if self.active.sync():
+                self.fsyncs += 1
+
+    def _sync_loop(self):
+        while self.is_running:
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+    def read(self, offset, max_records=500, limit=None):
+        """
+        (eventos, offset siguiente) desde offset, hasta max_records eventos y
+        sin pasar de limit (offset global)
+        """
+        records, offset = self.read_records(offset, max_records, limit)
+        return [event for _, event in records], offset
+
+    def read_records(self, offset, max_records=500, limit=None):
+        """Como read, con el offset global de cada evento: ([(offset, evento)], offset siguiente)"""
+        blocks = []
+        count = 0
+        with self.lock:
+            offset = max(offset, self.start_offset)
+            i = bisect.bisect_right(self.bases, offset) - 1
+            while i < len(self.segments) and count < max_records:
+                segment = self.segments[i]
+                pos = offset - segment.base
+                segment_limit = segment.end if limit is None else min(segment.end, limit - segment.base)
+                end, n = segment.scan(pos, max_records - count, segment_limit)
+                if n:
+                    blocks.append((segment.base + pos, segment.mm[pos:end]))
+                    count += n
+                    offset = segment.base + end
+                if end < segment.end or i + 1 == len(self.segments):
+                    break
+                i += 1
+                offset = self.segments[i].base
+
+        # Decodificar fuera del lock
+        records = [
+            (base + pos, decode_event(payload))
+            for base, block in blocks for pos, payload in iter_records(block)
+        ]
+        return records, offset
+
+    def wait(self, offset, timeout):
+        """Espera hasta que haya datos después de offset (o timeout)"""
+        with self.appended:
+            return self.appended.wait_for(
+                lambda: self.active.base + self.active.end > offset, timeout=timeout
+            )
+
+    def count_records(self, offset, limit=None):
+        """Registros entre offset y limit (o el final del log)"""
+        total = 0
+        while True:
+            with self.lock:
+                i = bisect.bisect_right(self.bases, max(offset, self.start_offset)) - 1
+                segment = self.segments[i]
+                pos = max(offset, self.start_offset) - segment.base
+                segment_limit = segment.end if limit is None else min(segment.end, limit - segment.base)
+                end, n = segment.scan(pos, 100000, segment_limit)
+                last = i + 1 == len(self.segments)
+            total += n
+            if n:
+                offset = segment.base + end
+            elif last or end < segment.end:
+                return total
+            else:
+                offset = self.bases[i + 1]
+
+    def _read_checkpoints(self):
+        """(log_id, confirmados, preparados); también lee el formato antiguo {consumidor: offset}"""
+        path = os.path.join(self.directory, CHECKPOINTS_FILE)
+        if not os.path.exists(path):
+            return None, {}, {}
+        with open(path) as f:
+            data = json.load(f)
+        if 'committed' not in data:
+            return None, data, {}
+        return data.get('log_id'), data['committed'], data.get('prepared', {})
+
+    def _write_checkpoints(self):
+        """Reemplazo atómico: el archivo siempre tiene offsets completos"""
+        path = os.path.join(self.directory, CHECKPOINTS_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'log_id': self.log_id,
+                'committed': self.checkpoints,
+                'prepared': self.prepared_offsets,
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def register(self, name):
+        """Agrega un consumidor (desde el inicio del log si es nuevo); devuelve su offset"""
+        with self.lock:
+            if name not in self.checkpoints:
+                self.checkpoints[name] = self.start_offset
+                self._write_checkpoints()
+            return self.checkpoints[name]
+
+    def committed(self, name):
+        with self.lock:
+            return self.checkpoints.get(name, self.start_offset)
+
+    def prepare(self, name, offset):
+        """
+        Anota que name va a escribir el estado hasta offset (antes de escribirlo):
+        los registros hasta offset quedan en disco y el offset sobrevive a una caída
+        """
+        self.sync()
+        with self.lock:
+            self.prepared_offsets[name] = offset
+            self._write_checkpoints()
+
+    def prepared(self, name):
+        """Offset preparado y sin confirmar de name, o None"""
+        with self.lock:
+            return self.prepared_offsets.get(name)
+
+    def commit(self, name, offset):
+        """Confirma que name procesó todo hasta offset y borra los segmentos ya consumidos"""
+        with self.lock:
+            if self.checkpoints.get(name) == offset and name not in self.prepared_offsets:
+                return
+            self.checkpoints[name] = offset
+            self.prepared_offsets.pop(name, None)
+            self._write_checkpoints()
+            self._delete_consumed_segments()
+
+    def _delete_consumed_segments(self):
+        consumed = min(self.checkpoints.values())
+        while len(self.segments) > 1 and self.bases[1] <= consumed:
+            segment = self.segments.pop(0)
+            self.bases.pop(0)
+            segment.close()
+            os.remove(segment.path)
+            self.deleted_segments += 1
+
+    def get_stats(self):
+        with self.lock:
+            end = self.active.base + self.active.end
+            return {
+                'segments': len(self.segments),
+                'start_offset': self.start_offset,
+                'end_offset': end,
+                'unsynced_bytes': self.active.end - self.active.synced,
+                'records_appended': self.records_appended,
+                'fsyncs': self.fsyncs,
+                'deleted_segments': self.deleted_segments,
+                'lag_bytes': {name: end - offset for name, offset in self.checkpoints.items()},
+                'prepared': dict(self.prepared_offsets),
+            }
+
+    def close(self):
+        self.is_running = False
+        self.sync_thread.join(timeout=self.fsync_interval + 1)
+        with self.lock:
+            self.active.sync()
+            for segment in self.segments:
+                segment.close()
+
+
+class EventLogSink:
+    """
+    Consumidor que escribe el log en el almacenamiento (write_fn(batch)) y
+    confirma el offset tras cada lote escrito. Con limit_fn solo escribe
+    hasta ese offset (p. ej. lo que el procesador ya confirmó).
+
+    Una caída entre la escritura y el commit repite el lote: con id_fn cada
+    evento lleva _id = id_fn(offset, evento), el mismo en cada repetición,
+    y el almacenamiento no lo duplica
+    """
+
+    def __init__(self, log, name, write_fn, batch_size=500, flush_interval=1.0, limit_fn=None,
+                 id_fn=None):
+        self.log = log
+        self.name = name
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.limit_fn = limit_fn or (lambda: None)
+        self.id_fn = id_fn
+
+        self.offset = log.register(name)
+        # Pendientes al abrir; después se cuentan con los contadores
+        self.pending_at_start = log.count_records(self.offset)
+        self.stop_event = threading.Event()
+        self.is_running = False
+        self.writer_thread = None
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+
+        self.flushed_events = 0
+        self.failed_flushes = 0
+
+    def __len__(self):
+        """Eventos del log aún sin escribir"""
+        return self.pending_at_start + self.log.records_appended - self.flushed_events
+
+    def start(self):
+        with self.start_lock:
+            if self.is_running:
+                return
+            self.is_running = True
+        self.stop_event.clear()
+        self.writer_thread = threading.Thread(target=self._writer_loop, name=f'{self.name}-sink', daemon=True)
+        self.writer_thread.start()
+
+    def _writer_loop(self):
+        while not self.stop_event.is_set():
+            self.flush()
+            self.stop_event.wait(self.flush_interval)
+
+    def flush(self):
+        """Escribe todo lo disponible hasta el límite; False si un lote falló"""
+        with self.flush_lock:
+            while True:
+                records, next_offset = self.log.read_records(self.offset, self.batch_size, self.limit_fn())
+                if not records:
+                    return True
+                events = [event for _, event in records]
+                if self.id_fn is not None:
+                    for offset, event in records:
+                        event['_id'] = self.id_fn(offset, event)
+                try:
+                    self.write_fn(events)
+                except Exception as e:
+                    print(f"Error escribiendo lote de eventos: {e}")
+                    self.failed_flushes += 1
+                    return False
+                self.flushed_events += len(events)
+                self.offset = next_offset
+                self.log.commit(self.name, next_offset)
+
+    def close(self, timeout=10):
+        """Detiene el thread con un flush final"""
+        self.stop_event.set()
+        if self.writer_thread:
+            self.writer_thread.join(timeout=timeout)
+            self.writer_thread = None
+        self.is_running = False
+        return self.flush()
+
+    def get_stats(self):
+        return {
+            'pending': len(self),
+            'flushed': self.flushed_events,
+            'failed_flushes': self.failed_flushes,
+            'offset': self.offset,
+        }
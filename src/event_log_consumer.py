@@ -0,0 +1,167 @@
+"""
+Consumidor del log local de eventos
+El procesador lee micro-lotes del log desde su último offset y, al
+sincronizar el estado, escribe los deltas hasta ese offset con el offset
+como guarda y lo confirma; la escritura de interacciones (EventLogSink) es
+otro consumidor que va detrás del offset confirmado
+"""
+
+import hashlib
+import struct
+import threading
+from collections import defaultdict
+
+from bson import ObjectId
+
+from mongo_resilience import failed_keys
+from user_profiles import deltas_from_events, merge_profile
+
+# Consumidores del log de eventos
+PROCESSOR_CONSUMER = 'processor'
+INTERACTIONS_CONSUMER = 'interactions'
+
+
+class EventLogConsumer:
+    """
+    Offset del procesador en un EventLog.
+
+    Las escrituras del estado son idempotentes: una caída entre la escritura
+    y el commit no cuenta nada dos veces (el reinicio termina la
+    sincronización preparada, ver recover).
+    """
+
+    def __init__(self, event_log, batch_size=500):
+        self.log = event_log
+        self.batch_size = batch_size
+        self.offset = event_log.register(PROCESSOR_CONSUMER)
+        self.initial_backlog = event_log.count_records(self.offset)
+        self.events_processed = 0
+        # Sin procesar eventos mientras se toman los deltas de una sincronización
+        self.lock = threading.Lock()
+        # Sincronización preparada y aún sin confirmar: offset y lo que falta escribir
+        self.pending_sync = None
+
+    def committed(self):
+        return self.log.committed(PROCESSOR_CONSUMER)
+
+    def event_id(self, offset, event):
+        """
+        _id del evento en el offset del log: el mismo en cada reescritura.
+        Como un ObjectId, empieza por el timestamp del evento
+        """
+        digest = hashlib.blake2b(f"{self.log.log_id}:{offset}".encode(), digest_size=8).digest()
+        return ObjectId(struct.pack('>I', int(event['timestamp'].timestamp())) + digest)
+
+    def consume(self, apply_fn):
+        """Lee un micro-lote desde el último offset y lo aplica con apply_fn; devuelve los eventos"""
+        with self.lock:
+            events, next_offset = self.log.read(self.offset, self.batch_size)
+            if events:
+                apply_fn(events)
+                self.offset = next_offset
+                self.events_processed += len(events)
+        return events
+
+    def wait(self, timeout):
+        """Espera hasta timeout segundos a que haya eventos después del offset"""
+        self.log.wait(self.offset, timeout=timeout)
+
+    def backlog(self):
+        """Eventos del log aún sin procesar"""
+        return self.initial_backlog + self.log.records_appended - self.events_processed
+
+    def recover(self, storage, weights, genre_fn, recent_size):
+        """
+        Termina la sincronización que una caída dejó entre las escrituras y
+        el commit; False si no se pudo
+        """
+        offset = self.log.prepared(PROCESSOR_CONSUMER)
+        if offset is None:
+            return True
+        try:
+            self.apply_range(storage, self.offset, offset, weights, genre_fn, recent_size)
+        except Exception as e:
+            print(f"Error terminando la sincronización del log hasta {offset}: {e}")
+            return False
+        self.log.commit(PROCESSOR_CONSUMER, offset)
+        print(f"Log de eventos: sincronización hasta {offset} terminada tras el reinicio")
+        self.offset = offset
+        self.initial_backlog = self.log.count_records(offset)
+        return True
+
+    def apply_range(self, storage, start, end, weights, genre_fn, recent_size):
+        """
+        Escribe con la guarda end los deltas de popularidad y perfiles de los
+        eventos del log entre start y end: los documentos que ya los tenían no cambian
+        """
+        track_weights = defaultdict(int)
+        profile_updates = {}
+        while start < end:
+            events, start = self.log.read(start, self.batch_size, limit=end)
+            if not events:
+                break
+            for event in events:
+                track_weights[event['track_id']] += weights.get(event['interaction_type'], 1)
+            for user_id, delta in deltas_from_events(events, genre_fn, recent_size).items():
+                pending = profile_updates.get(user_id)
+                profile_updates[user_id] = (
+                    delta if pending is None else merge_profile(pending, delta, recent_size)
+                )
+
+        track_ids = [track_id for track_id, weight in track_weights.items() if weight != 0]
+        if track_ids:
+            storage.apply_popularity_deltas(track_ids, track_weights, log_offset=end)
+        if profile_updates:
+            storage.apply_profile_updates(
+                list(profile_updates), profile_updates, recent_size, log_offset=end
+            )
+
+    def sync(self, storage, popularity, user_profiles):
+        """
+        Escribe los deltas de popularidad (PopularityState) y perfiles
+        (UserProfileStore) hasta el offset consumido con ese offset como
+        guarda y, cuando todos llegaron, lo confirma: al reiniciar el
+        procesador sigue desde ahí sobre el estado guardado
+        """
+        with self.lock:
+            if self.pending_sync is None:
+                offset = self.offset
+                if offset == self.committed():
+                    popularity.mark_synced()
+                    return
+                track_ids, deltas = popularity.take_deltas()
+                user_ids, updates = user_profiles.take_updates()
+                # El offset queda anotado antes de escribir: tras una caída
+                # el reinicio termina esta misma sincronización
+                self.log.prepare(PROCESSOR_CONSUMER, offset)
+                self.pending_sync = {
+                    'offset': offset,
+                    'popularity': (track_ids, deltas),
+                    'profiles': (user_ids, updates),
+                }
+            else:
+                # Reintento: solo lo que falló, con el mismo offset (los deltas
+                # nuevos esperan a que este se confirme)
+                popularity.mark_synced()
+
+            sync = self.pending_sync
+            track_ids, deltas = sync['popularity']
+            if track_ids:
+                try:
+                    storage.apply_popularity_deltas(track_ids, deltas, log_offset=sync['offset'])
+                    track_ids = []
+                except Exception as e:
+                    track_ids = failed_keys(track_ids, e)
+                    print(f"Error sincronizando popularidad: {len(track_ids)} tracks pendientes ({e})")
+                sync['popularity'] = (track_ids, deltas)
+
+            user_ids, updates = sync['profiles']
+            if user_ids:
+                user_ids = user_profiles.write_updates(
+                    storage.apply_profile_updates, user_ids, updates, log_offset=sync['offset']
+                )
+                sync['profiles'] = (user_ids, updates)
+
+            if not track_ids and not user_ids:
+                self.log.commit(PROCESSOR_CONSUMER, sync['offset'])
+                self.pending_sync = None
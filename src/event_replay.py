@@ -0,0 +1,296 @@
+"""
+Replay del log de interacciones (reprocesamiento Kappa)
+Recalcula popularidad y perfiles de usuario desde user_interactions (y los
+agregados diarios del archivado) con otros pesos o lógica, en colecciones
+nuevas con versión, y publica la versión al terminar
+"""
+
+import itertools
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from derived_state import (
+    drop_old_versions, publish_derived_state, read_derived_state, versioned_collections
+)
+from interaction_store import DAILY_COLLECTION, EVENT_FIELDS
+from user_profiles import RECENT_SIZE
+
+EVENT_COLUMNS = ['user_id', *EVENT_FIELDS]
+
+
+class _GroupedSum:
+    """
+    Suma por clave acumulada en partes: cada lote agrega con groupby y las
+    partes se compactan (concat + groupby) cuando pasan de compact_rows filas
+    """
+
+    def __init__(self, compact_rows):
+        self.compact_rows = compact_rows
+        self.parts = []
+        self.rows = 0
+
+    def add(self, series):
+        if len(series):
+            self.parts.append(series)
+            self.rows += len(series)
+            if self.rows > self.compact_rows:
+                self.compact()
+
+    def compact(self):
+        if len(self.parts) > 1:
+            combined = pd.concat(self.parts)
+            self.parts = [combined.groupby(level=list(range(combined.index.nlevels)), sort=False).sum()]
+            self.rows = len(self.parts[0])
+
+    def result(self):
+        self.compact()
+        return self.parts[0] if self.parts else pd.Series(dtype=np.int64)
+
+
+class ReplayAggregator:
+    """
+    Estado derivado a partir de lotes de eventos (DataFrames), vectorizado:
+
+    - popularidad por canción: suma de pesos
+    - por usuario: contadores por tipo, likes por género y los recent_size
+      eventos más recientes
+    """
+
+    def __init__(self, weights, genres, recent_size=RECENT_SIZE, compact_rows=2_000_000):
+        self.weights = dict(weights)
+        self.genres = genres
+        self.recent_size = recent_size
+        self.compact_rows = compact_rows
+
+        self.popularity = _GroupedSum(compact_rows)
+        self.counts = _GroupedSum(compact_rows)
+        self.liked_genres = _GroupedSum(compact_rows)
+        self.recent_parts = []
+        self.recent_rows = 0
+        self.events = 0
+
+    def add_events(self, events):
+        """
+        Lote con columnas user_id, track_id, interaction_type, timestamp y
+        opcionalmente count (agregados diarios, sin timestamps de evento)
+        """
+        if events.empty:
+            return
+        if 'count' in events:
+            count = events['count'].to_numpy(dtype=np.int64)
+        else:
+            count = np.ones(len(events), dtype=np.int64)
+            self._add_recent(events)
+        self.events += int(count.sum())
+
+        # Tipos sin peso cuentan 1, como en el procesador
+        weight = events['interaction_type'].map(self.weights).fillna(1).to_numpy(dtype=np.int64)
+        self.popularity.add(
+            pd.Series(weight * count).groupby(events['track_id'].to_numpy(), sort=False).sum()
+        )
+        self.counts.add(
+            pd.Series(count).groupby(
+                [events['user_id'].to_numpy(), events['interaction_type'].to_numpy()], sort=False
+            ).sum()
+        )
+
+        likes = (events['interaction_type'] == 'like').to_numpy()
+        if likes.any():
+            liked = events.loc[likes, ['user_id', 'track_id']]
+            genre = liked['track_id'].map(self.genres)
+            known = genre.notna().to_numpy()
+            self.liked_genres.add(
+                pd.Series(count[likes][known]).groupby(
+                    [liked['user_id'].to_numpy()[known], genre.to_numpy()[known]], sort=False
+                ).sum()
+            )
+
+    def _add_recent(self, events):
+        tail = events[EVENT_COLUMNS].sort_values('timestamp', kind='stable')
+        tail = tail.groupby('user_id', sort=False).tail(self.recent_size)
+        self.recent_parts.append(tail)
+        self.recent_rows += len(tail)
+        if self.recent_rows > self.compact_rows:
+            self._compact_recent()
+
+    def _compact_recent(self):
+        if len(self.recent_parts) > 1:
+            recent = pd.concat(self.recent_parts, ignore_index=True)
+            recent = recent.sort_values('timestamp', kind='stable')
+            self.recent_parts = [recent.groupby('user_id', sort=False).tail(self.recent_size)]
+            self.recent_rows = len(self.recent_parts[0])
+
+    def popularity_docs(self, now=None):
+        now = now or datetime.now()
+        popularity = self.popularity.result()
+        for track_id, value in zip(popularity.index.tolist(), popularity.tolist()):
+            yield {'track_id': track_id, 'popularity': int(value), 'updated_at': now}
+
+    def profile_docs(self, now=None):
+        """Documentos de user_profiles (mismo formato que UserProfileStore)"""
+        now = now or datetime.now()
+        counts = self.counts.result().sort_index()
+        liked = self.liked_genres.result().sort_index()
+
+        self._compact_recent()
+        if self.recent_parts:
+            # Más recientes primero, como en user_profiles (invertir antes del
+            # sort estable deja primero el último de los empates)
+            recent = self.recent_parts[0].iloc[::-1].sort_values(
+                ['user_id', 'timestamp'], ascending=[True, False], kind='stable'
+            )
+        else:
+            recent = pd.DataFrame(columns=EVENT_COLUMNS)
+
+        liked_by_user = {
+            user_id: {genre: int(n) for _, genre, n in group}
+            for user_id, group in itertools.groupby(
+                zip(liked.index.get_level_values(0).tolist(),
+                    liked.index.get_level_values(1).tolist(), liked.tolist()),
+                key=lambda item: item[0]
+            )
+        } if len(liked) else {}
+        # datetime64 → datetime de Python en un solo paso (MongoDB guarda ms)
+        timestamps = pd.to_datetime(recent['timestamp']).to_numpy('datetime64[us]').astype(object)
+        recent_by_user = {
+            user_id: [
+                {'track_id': track_id, 'interaction_type': interaction_type, 'timestamp': timestamp}
+                for _, track_id, interaction_type, timestamp in group
+            ]
+            for user_id, group in itertools.groupby(
+                zip(recent['user_id'].tolist(), recent['track_id'].tolist(),
+                    recent['interaction_type'].tolist(), timestamps.tolist()),
+                key=lambda item: item[0]
+            )
+        }
+
+        if not len(counts):
+            return
+        for user_id, group in itertools.groupby(
+            zip(counts.index.get_level_values(0).tolist(),
+                counts.index.get_level_values(1).tolist(), counts.tolist()),
+            key=lambda item: item[0]
+        ):
+            user_counts = {interaction_type: int(n) for _, interaction_type, n in group}
+            yield {
+                '_id': user_id,
+                'user_id': user_id,
+                'total_interactions': sum(user_counts.values()),
+                'counts': user_counts,
+                'liked_genres': liked_by_user.get(user_id, {}),
+                'recent': recent_by_user.get(user_id, []),
+                'updated_at': now,
+            }
+
+
+def read_event_batches(db, store, batch_size=100000, since=None, until=None):
+    """Lotes de eventos (DataFrames) en orden de tiempo"""
+    cursor = store.collection(db).aggregate(
+        store.events_pipeline(since=since, until=until, sort_by_time=True),
+        allowDiskUse=True, batchSize=min(batch_size, 100000)
+    )
+    while True:
+        docs = list(itertools.islice(cursor, batch_size))
+        if not docs:
+            return
+        yield pd.DataFrame.from_records(docs, columns=EVENT_COLUMNS)
+
+
+def read_daily_aggregates(db, batch_size=100000):
+    """Agregados del archivado como lotes con columna count"""
+    cursor = db[DAILY_COLLECTION].find(
+        {}, {'_id': 0, 'user_id': 1, 'track_id': 1, 'counts': 1}, batch_size=batch_size
+    )
+    while True:
+        docs = list(itertools.islice(cursor, batch_size))
+        if not docs:
+            return
+        rows = [
+            (doc['user_id'], doc['track_id'], interaction_type, count)
+            for doc in docs for interaction_type, count in doc['counts'].items()
+        ]
+        yield pd.DataFrame(rows, columns=['user_id', 'track_id', 'interaction_type', 'count'])
+
+
+def write_documents(collection, docs, batch_size=5000):
+    written = 0
+    for batch in iter(lambda: list(itertools.islice(docs, batch_size)), []):
+        collection.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+def replay_interactions(db, store, weights=None, batch_size=100000, keep=2,
+                        max_catchup_passes=3, publish=True, verbose=True):
+    """
+    Reprocesa el log completo y publica una versión nueva del estado derivado.
+
+    1. Agregados diarios (eventos archivados) y eventos hasta el inicio del replay
+    2. Pasadas de recuperación con lo que llegó mientras tanto
+    3. Escritura en track_popularity__vN / user_profiles__vN
+    4. Publicación atómica en kappa_meta (los procesadores la usan al recargar)
+    """
+    current = read_derived_state(db)
+    weights = dict(current['weights'] if weights is None else weights)
+    version = current['version'] + 1
+    collections = versioned_collections(version)
+
+    genres = {
+        doc['track_id']: doc.get('track_genre')
+        for doc in db['tracks'].find({}, {'_id': 0, 'track_id': 1, 'track_genre': 1})
+    }
+    aggregator = ReplayAggregator(weights, genres)
+
+    started = time.perf_counter()
+    for batch in read_daily_aggregates(db, batch_size):
+        aggregator.add_events(batch)
+    archived = aggregator.events
+
+    since = None
+    until = datetime.now()
+    for replay_pass in range(max_catchup_passes + 1):
+        if replay_pass:
+            # Lo que llegó durante la pasada anterior (con la app en marcha)
+            since, until = until, datetime.now()
+        pass_events = 0
+        for batch in read_event_batches(db, store, batch_size, since=since, until=until):
+            aggregator.add_events(batch)
+            pass_events += len(batch)
+            if verbose and replay_pass == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  {aggregator.events:,} eventos ({aggregator.events / elapsed:,.0f} eventos/s)")
+        if replay_pass and pass_events < batch_size:
+            break
+    read_seconds = time.perf_counter() - started
+
+    popularity_collection = db[collections['popularity_collection']]
+    profiles_collection = db[collections['profiles_collection']]
+    popularity_collection.drop()
+    profiles_collection.drop()
+    now = datetime.now()
+    tracks = write_documents(popularity_collection, aggregator.popularity_docs(now))
+    popularity_collection.create_index('track_id', unique=True)
+    users = write_documents(profiles_collection, aggregator.profile_docs(now))
+
+    stats = {
+        'version': version,
+        'events': aggregator.events,
+        'archived_events': archived,
+        'tracks': tracks,
+        'users': users,
+        'replayed_until': until,
+        'read_seconds': read_seconds,
+        'total_seconds': time.perf_counter() - started,
+    }
+    stats['events_per_second'] = aggregator.events / read_seconds if read_seconds else 0.0
+
+    if publish:
+        publish_derived_state(
+            db, version, weights,
+            events=stats['events'], replayed_until=until
+        )
+        stats['dropped'] = drop_old_versions(db, version, keep)
+    return stats
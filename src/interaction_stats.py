@@ -0,0 +1,161 @@
+"""
+Estadísticas de interacciones mantenidas en memoria
+Total de interacciones exacto (base de MongoDB + escrituras propias) y
+usuarios únicos estimados con HyperLogLog, reconciliados con MongoDB en
+segundo plano en vez de count_documents/distinct en cada render
+"""
+
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+
+class HyperLogLog:
+    """
+    Estimador de cardinalidad con 2^precision registros de 1 byte
+    (precision=14: 16 KB, error típico ~0.8%)
+    """
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    @staticmethod
+    def _hash(value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    def add(self, value):
+        h = self._hash(value)
+        index = h >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = h & ((1 << rest_bits) - 1)
+        # Posición del primer 1 en los bits restantes
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Rango pequeño: conteo lineal
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class InteractionStats:
+    """
+    Contadores de user_interactions.
+
+    - total_interactions = número de eventos en MongoDB en la última
+      reconciliación + interacciones escritas desde entonces por este proceso
+    - total_users = HyperLogLog de los usuarios de MongoDB (reconciliación) y
+      de los que llegan en cada lote escrito
+    """
+
+    def __init__(self, precision=14, reconcile_interval=300.0):
+        self.precision = precision
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.Lock()
+
+        self.base_interactions = 0
+        self.written = 0
+        self.written_at_reconcile = 0
+        self.users = HyperLogLog(precision)
+        # Usuarios vistos mientras corre una reconciliación
+        self.users_during_reconcile = None
+
+        self.last_reconciled = None
+        self.reconcile_seconds = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def record(self, events, inserted=None):
+        """Registra un lote escrito en user_interactions"""
+        users = HyperLogLog(self.precision).update({event['user_id'] for event in events})
+        with self.lock:
+            self.written += len(events) if inserted is None else inserted
+            self.users.merge(users)
+            if self.users_during_reconcile is not None:
+                self.users_during_reconcile.merge(users)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'total_interactions': self.base_interactions + self.written - self.written_at_reconcile,
+                'total_users': self.users.count(),
+                'stats_reconciled_at': self.last_reconciled,
+            }
+
+    # --- Reconciliación con MongoDB ---
+
+    def begin_reconcile(self):
+        """Marca el inicio de una reconciliación; devuelve el token para finish_reconcile"""
+        with self.lock:
+            self.users_during_reconcile = HyperLogLog(self.precision)
+            return self.written, time.perf_counter()
+
+    def finish_reconcile(self, token, total_interactions, users):
+        """Sustituye la base por los valores leídos de MongoDB (users: HyperLogLog)"""
+        written_before, started = token
+        with self.lock:
+            self.base_interactions = total_interactions
+            self.written_at_reconcile = written_before
+            if self.users_during_reconcile is not None:
+                users.merge(self.users_during_reconcile)
+            self.users = users
+            self.users_during_reconcile = None
+            self.last_reconciled = time.time()
+            self.reconcile_seconds = time.perf_counter() - started
+
+    def reconcile(self, storage):
+        """Lee los totales del backend de almacenamiento (StorageBackend)"""
+        token = self.begin_reconcile()
+        try:
+            total = storage.count_interactions()
+            users = HyperLogLog(self.precision).update(storage.iter_interaction_users())
+        except Exception:
+            with self.lock:
+                self.users_during_reconcile = None
+            raise
+        self.finish_reconcile(token, total, users)
+
+    def start(self, storage):
+        """Reconciliación inmediata y luego cada reconcile_interval segundos"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self._reconcile_loop, args=(storage,),
+            name='stats-reconcile', daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _reconcile_loop(self, storage):
+        while not self.stop_event.is_set():
+            try:
+                self.reconcile(storage)
+            except Exception as e:
+                print(f"Error reconciliando estadísticas: {e}")
+            self.stop_event.wait(self.reconcile_interval)
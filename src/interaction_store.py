@@ -0,0 +1,321 @@
+"""
+Esquema de las interacciones de usuario
+Índices gestionados, layout crudo (un documento por evento) o por buckets
+(un documento por usuario y hora con un array de eventos), TTL y archivado
+de eventos antiguos en agregados diarios
+"""
+
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+INTERACTION_LAYOUTS = ('raw', 'bucketed')
+
+# Colecciones por layout y agregados diarios del archivado
+RAW_COLLECTION = 'user_interactions'
+BUCKET_COLLECTION = 'user_interaction_buckets'
+DAILY_COLLECTION = 'user_interactions_daily'
+ARCHIVE_LOG_COLLECTION = 'interaction_archive_log'
+
+EVENT_FIELDS = ('track_id', 'interaction_type', 'timestamp')
+
+
+def bucket_hour(timestamp):
+    """Inicio de la hora del evento (clave del bucket)"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_id(user_id, hour):
+    return f"{user_id}:{hour:%Y%m%d%H}"
+
+
+def day_start(timestamp):
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class InteractionStore:
+    """
+    Lectura y escritura de user_interactions según el layout.
+
+    - raw: un documento por evento en user_interactions (insert_many)
+    - bucketed: un documento por (usuario, hora) en user_interaction_buckets;
+      los eventos se añaden con $addToSet y un _id propio, así un reintento
+      del mismo lote no los duplica
+
+    ttl_days borra los eventos crudos con un índice TTL; debe ser mayor que
+    la antigüedad con que se archivan (archive_before) para no perder datos.
+    """
+
+    def __init__(self, layout='raw', ttl_days=None):
+        if layout not in INTERACTION_LAYOUTS:
+            raise ValueError(f"Layout de interacciones desconocido: {layout}")
+        self.layout = layout
+        self.ttl_days = ttl_days
+
+    @property
+    def collection_name(self):
+        return BUCKET_COLLECTION if self.layout == 'bucketed' else RAW_COLLECTION
+
+    @property
+    def time_field(self):
+        return 'hour' if self.layout == 'bucketed' else 'timestamp'
+
+    def collection(self, db, **options):
+        """Colección del layout; options: write_concern, read_preference..."""
+        if options:
+            return db.get_collection(self.collection_name, **options)
+        return db[self.collection_name]
+
+    # --- Índices ---
+
+    def index_models(self):
+        """Índices del layout: (user_id, tiempo) y tiempo (con TTL si ttl_days)"""
+        time_options = {'name': f'{self.time_field}_1'}
+        if self.ttl_days:
+            time_options['expireAfterSeconds'] = int(self.ttl_days * 86400)
+        return [
+            IndexModel([('user_id', ASCENDING), (self.time_field, DESCENDING)],
+                       name=f'user_id_1_{self.time_field}_-1'),
+            IndexModel([(self.time_field, ASCENDING)], **time_options),
+        ]
+
+    def ensure_indexes(self, db):
+        """Crea los índices; si cambió el TTL lo ajusta con collMod"""
+        collection = self.collection(db)
+        for model in self.index_models():
+            try:
+                collection.create_indexes([model])
+            except OperationFailure as e:
+                # IndexOptionsConflict: mismo índice con otro expireAfterSeconds
+                if e.code != 85:
+                    raise
+                document = model.document
+                if 'expireAfterSeconds' in document:
+                    db.command('collMod', self.collection_name, index={
+                        'keyPattern': dict(document['key']),
+                        'expireAfterSeconds': document['expireAfterSeconds'],
+                    })
+                else:
+                    # Sin TTL: collMod no puede quitarlo, se recrea el índice
+                    collection.drop_index(document['name'])
+                    collection.create_indexes([model])
+
+    # --- Escritura ---
+
+    def write_operations(self, events):
+        """UpdateOne por (usuario, hora) para el layout por buckets"""
+        buckets = {}
+        for event in events:
+            # _id estable entre reintentos: el evento se reescribe igual
+            event.setdefault('_id', ObjectId())
+            hour = bucket_hour(event['timestamp'])
+            key = (event['user_id'], hour)
+            buckets.setdefault(key, []).append(
+                {'_id': event['_id'], **{field: event[field] for field in EVENT_FIELDS}}
+            )
+
+        return [
+            UpdateOne(
+                {'_id': bucket_id(user_id, hour)},
+                {
+                    '$setOnInsert': {'user_id': user_id, 'hour': hour},
+                    '$addToSet': {'events': {'$each': bucket_events}},
+                },
+                upsert=True
+            )
+            for (user_id, hour), bucket_events in buckets.items()
+        ]
+
+    def write(self, db, events, **options):
+        """Escribe un lote; devuelve cuántos eventos se insertaron"""
+        collection = self.collection(db, **options)
+        if self.layout == 'bucketed':
+            collection.bulk_write(self.write_operations(events), ordered=False)
+            return len(events)
+
+        try:
+            result = collection.insert_many(events, ordered=False)
+        except BulkWriteError as e:
+            # En un reintento los eventos ya insertados tienen _id: clave duplicada
+            errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != 11000]
+            if errors or e.details.get('writeConcernErrors'):
+                raise
+            return e.details.get('nInserted', 0)
+        return len(result.inserted_ids)
+
+    # --- Lectura ---
+
+    def events_pipeline(self, since=None, until=None, sort_by_user=False, sort_by_time=False):
+        """
+        Agregación que devuelve eventos planos {user_id, track_id,
+        interaction_type, timestamp} en cualquier layout
+        """
+        time_range = {}
+        if since is not None:
+            time_range['$gte'] = bucket_hour(since) if self.layout == 'bucketed' else since
+        if until is not None:
+            time_range['$lt'] = until
+
+        pipeline = []
+        if time_range:
+            pipeline.append({'$match': {self.time_field: time_range}})
+        if sort_by_user:
+            pipeline.append({'$sort': {'user_id': 1, self.time_field: 1}})
+        elif sort_by_time:
+            # _id desempata eventos del mismo milisegundo (orden de inserción);
+            # por buckets el orden es por hora y dentro del bucket el del array
+            pipeline.append({'$sort': {self.time_field: 1, '_id': 1}})
+
+        if self.layout == 'bucketed':
+            pipeline.append({'$unwind': '$events'})
+            pipeline.append({'$project': {
+                '_id': 0, 'user_id': 1,
+                **{field: f'$events.{field}' for field in EVENT_FIELDS},
+            }})
+            event_range = {}
+            if since is not None:
+                event_range['$gte'] = since
+            if until is not None and until != bucket_hour(until):
+                event_range['$lt'] = until
+            if event_range:
+                # Los buckets de los extremos pueden tener eventos fuera del rango
+                pipeline.append({'$match': {'timestamp': event_range}})
+        else:
+            pipeline.append({'$project': {'_id': 0, 'user_id': 1, **{f: 1 for f in EVENT_FIELDS}}})
+        return pipeline
+
+    def pair_counts_pipeline(self):
+        """Número de eventos por (user_id, track_id, interaction_type)"""
+        return self.events_pipeline() + [
+            {'$group': {
+                '_id': {'user_id': '$user_id', 'track_id': '$track_id',
+                        'interaction_type': '$interaction_type'},
+                'count': {'$sum': 1},
+            }},
+            {'$project': {
+                '_id': 0, 'user_id': '$_id.user_id', 'track_id': '$_id.track_id',
+                'interaction_type': '$_id.interaction_type', 'count': 1,
+            }},
+        ]
+
+    def recent_events(self, db, since, **options):
+        return self.collection(db, **options).aggregate(self.events_pipeline(since=since), allowDiskUse=True)
+
+    def events_by_user(self, db):
+        """Eventos ordenados por (user_id, timestamp) (usa el índice compuesto)"""
+        return self.collection(db).aggregate(self.events_pipeline(sort_by_user=True), allowDiskUse=True)
+
+    def count_pipeline(self):
+        """Número de eventos del layout por buckets (sumando los arrays)"""
+        return [{'$group': {'_id': None, 'events': {'$sum': {'$size': '$events'}}}}]
+
+    @staticmethod
+    def distinct_users_pipeline():
+        # $sort + $group sobre user_id usa el índice (DISTINCT_SCAN) y el
+        # cursor no tiene el límite de 16 MB de distinct()
+        return [{'$sort': {'user_id': 1}}, {'$group': {'_id': '$user_id'}}]
+
+    def count_events(self, db, **options):
+        """Eventos en la colección del layout más los ya archivados"""
+        collection = self.collection(db, **options)
+        if self.layout == 'raw':
+            live = collection.estimated_document_count()
+        else:
+            result = list(collection.aggregate(self.count_pipeline(), allowDiskUse=True))
+            live = result[0]['events'] if result else 0
+        return live + self.count_archived(db, **options)
+
+    def count_archived(self, db, **options):
+        """
+        Eventos archivados según interaction_archive_log (si archive_before se
+        interrumpe entre la marca y el borrado, el día cuenta dos veces hasta
+        que se vuelve a ejecutar)
+        """
+        pipeline = [
+            {'$match': {'collection': self.collection_name}},
+            {'$group': {'_id': None, 'events': {'$sum': '$events'}}},
+        ]
+        archive_log = db.get_collection(ARCHIVE_LOG_COLLECTION, **options)
+        result = list(archive_log.aggregate(pipeline))
+        return result[0]['events'] if result else 0
+
+    def iter_user_ids(self, db, **options):
+        """user_id de la colección del layout y de los agregados diarios (puede repetir)"""
+        for collection in (self.collection(db, **options), db.get_collection(DAILY_COLLECTION, **options)):
+            for doc in collection.aggregate(self.distinct_users_pipeline(), allowDiskUse=True):
+                yield doc['_id']
+
+    # --- Archivado ---
+
+    def archive_before(self, db, cutoff, verbose=True):
+        """
+        Compacta los eventos anteriores al día de cutoff en
+        user_interactions_daily (un documento por día, usuario y canción con
+        contadores por tipo) y los borra de la colección cruda.
+
+        Cada día se procesa completo: agregados con ReplaceOne, marca en
+        interaction_archive_log y borrado. Si se interrumpe, volver a
+        ejecutarlo repite el día sin contar dos veces.
+        """
+        collection = self.collection(db)
+        daily = db[DAILY_COLLECTION]
+        archive_log = db[ARCHIVE_LOG_COLLECTION]
+        daily.create_index([('user_id', ASCENDING), ('day', DESCENDING)])
+
+        cutoff = day_start(cutoff)
+        oldest = collection.find_one({}, {self.time_field: 1}, sort=[(self.time_field, ASCENDING)])
+        if oldest is None:
+            return 0
+
+        archived = 0
+        day = day_start(oldest[self.time_field])
+        while day < cutoff:
+            next_day = day + timedelta(days=1)
+            day_range = {self.time_field: {'$gte': day, '$lt': next_day}}
+
+            log_id = f"{self.collection_name}:{day:%Y%m%d}"
+            if archive_log.find_one({'_id': log_id}) is None:
+                operations, events = self._daily_operations(db, day, next_day)
+                if operations:
+                    daily.bulk_write(operations, ordered=False)
+                archive_log.replace_one(
+                    {'_id': log_id},
+                    {'collection': self.collection_name, 'day': day, 'events': events,
+                     'archived_at': datetime.now()},
+                    upsert=True
+                )
+                archived += events
+                if verbose and events:
+                    print(f"{day:%Y-%m-%d}: {events:,} eventos → {len(operations):,} agregados")
+
+            collection.delete_many(day_range)
+            day = next_day
+        return archived
+
+    def _daily_operations(self, db, day, next_day):
+        pipeline = self.events_pipeline(since=day, until=next_day)
+        pipeline.append({'$group': {
+            '_id': {'user_id': '$user_id', 'track_id': '$track_id', 'type': '$interaction_type'},
+            'count': {'$sum': 1},
+        }})
+
+        aggregates = {}
+        events = 0
+        for doc in self.collection(db).aggregate(pipeline, allowDiskUse=True):
+            key = (doc['_id']['user_id'], doc['_id']['track_id'])
+            counts = aggregates.setdefault(key, {})
+            counts[doc['_id']['type']] = doc['count']
+            events += doc['count']
+
+        operations = [
+            ReplaceOne(
+                {'_id': f"{day:%Y%m%d}:{user_id}:{track_id}"},
+                {'user_id': user_id, 'track_id': track_id, 'day': day,
+                 'counts': counts, 'total': sum(counts.values())},
+                upsert=True
+            )
+            for (user_id, track_id), counts in aggregates.items()
+        ]
+        return operations, events
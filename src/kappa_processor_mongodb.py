@@ -3,47 +3,171 @@ Procesador Kappa con MongoDB
 Procesa eventos en tiempo real y guarda en MongoDB Atlas
 """
 
-import pandas as pd
 import numpy as np
 from datetime import datetime
-from collections import defaultdict, deque
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
+from collections import defaultdict
 from pymongo import MongoClient
+import queue
 import threading
 import time
 
+from collaborative import CooccurrenceModel
+from content_model import ContentModel, catalog_changes
+from derived_state import DEFAULT_DERIVED_STATE, INTERACTION_WEIGHTS
+from event_buffer import BufferFullError, EventWriteBuffer
+from event_log import EventLogSink
+from event_log_consumer import INTERACTIONS_CONSUMER, EventLogConsumer
+from interaction_stats import InteractionStats
+from interaction_store import InteractionStore
+from pipeline_metrics import PipelineMetrics
+from mongo_resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, client_options
+from popularity import PopularityState
+from recommender import Recommender
+from result_cache import ResultCache
+from storage import MongoStorage
+from trending import TrendingEngine
+from user_profiles import UserProfileStore, profile_preferences, profile_summary
+
 class KappaProcessorMongoDB:
     """
     Procesador de eventos en tiempo real - Arquitectura Kappa con MongoDB
+    
+    Coordina la cola (o el log) de eventos, la escritura de interacciones y
+    la sincronización con el almacenamiento; el estado vive en los
+    subsistemas: ContentModel (catálogo e índice de vecinos),
+    PopularityState, TrendingEngine, Recommender (scoring y caché),
+    CooccurrenceModel, UserProfileStore e InteractionStats.
     """
     
-    def __init__(self, mongodb_uri, database_name='spotify_kappa'):
+    def __init__(self, mongodb_uri, database_name='spotify_kappa', storage=None,
+                 neighbor_index=None, trending=None, recommendation_cache=None,
+                 collaborative=None, collaborative_weight=0.3, user_profiles=None,
+                 interactions=None, interaction_stats=None, event_log=None,
+                 mongo_options=None, storage_options=None, retry_policy=None, breaker=None,
+                 write_batch_size=500, write_flush_interval=1.0, write_buffer_size=10000,
+                 popularity_sync_interval=5.0, n_workers=2, event_batch_size=500,
+                 event_queue_size=10000, snapshot_dir=None, load_batch_size=5000):
+        """
+        Los subsistemas se pasan ya configurados (None = valores por defecto):
+        
+        - neighbor_index: NeighborIndex (vecinos, backend ANN)
+        - trending: TrendingEngine (ventanas y capacidad del top-K)
+        - recommendation_cache: ResultCache (tamaño y TTL)
+        - collaborative: CooccurrenceModel; con collaborative_weight > 0 y sin
+          modelo se crea uno por defecto, con 0 las recomendaciones son solo
+          por contenido
+        - user_profiles: UserProfileStore; interactions: InteractionStore
+          (layout y TTL); interaction_stats: InteractionStats
+        - event_log: EventLog local (None = solo la cola en memoria)
+        - storage: StorageBackend (None = MongoStorage sobre la conexión);
+          mongo_options son argumentos de client_options() (pool),
+          storage_options de MongoStorage (read preference, write concerns,
+          profile_read_timeout), y retry_policy / breaker los comparten
+          MongoStorage y el procesador asíncrono
+        """
         self.mongodb_uri = mongodb_uri
         self.database_name = database_name
         self.client = None
         self.db = None
+        # Backend de almacenamiento (None = MongoStorage sobre self.db al conectar)
+        self._storage = storage
+        
+        # Pool de conexiones, read preference / write concerns, reintentos con
+        # jitter y circuit breaker (sin MongoDB, recomendaciones solo por contenido)
+        self.mongo_client_options = client_options(**(mongo_options or {}))
+        self.storage_options = dict(storage_options or {})
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.degraded_recommendations = 0
+        self.degraded_lock = threading.Lock()
+        
+        # Catálogo, scaler e índice de vecinos
+        self.content = ContentModel(neighbor_index)
+        self.catalog = self.content.catalog
+        self.neighbor_index = self.content.neighbor_index
+        self.audio_features = self.content.audio_features
+        
+        # Directorio de snapshots memmap (None = siempre recalcular)
+        self.snapshot_dir = snapshot_dir
+        self.load_batch_size = load_batch_size
+        self.load_stats = {}
+        
+        # Popularidad por canción y por fila, con los deltas pendientes de sincronizar
+        self.popularity = PopularityState()
+        self.popularity_sync_interval = popularity_sync_interval
+        # Versión del estado derivado (colecciones y pesos); la publica el replay
+        self.derived_state = dict(DEFAULT_DERIVED_STATE)
+        self.interaction_weights = dict(INTERACTION_WEIGHTS)
+        
+        # Trending por ventanas con decaimiento (top-K incremental, global y por género)
+        self.trending = trending if trending is not None else TrendingEngine()
+        
+        # Co-ocurrencias canción–canción (0 = recomendaciones solo por contenido)
+        self.collaborative_weight = collaborative_weight
+        self.collaborative = None
+        if collaborative_weight > 0:
+            self.collaborative = collaborative if collaborative is not None else CooccurrenceModel()
+        
+        # Scoring y caché de recomendaciones: TTL + versión de catálogo, popularidad y perfil
+        self.recommendation_cache = recommendation_cache if recommendation_cache is not None else ResultCache()
+        self.recommender = Recommender(
+            self.catalog, self.neighbor_index, self.popularity, self.recommendation_cache,
+            self.collaborative, collaborative_weight
+        )
         
-        self.scaler = StandardScaler()
-        self.tracks_df = None
-        self.similarity_matrix = None
-        self.track_popularity = defaultdict(int)
-        self.event_queue = deque(maxlen=10000)
+        # Perfiles materializados (user_profiles) con caché LRU
+        self.user_profiles = user_profiles if user_profiles is not None else UserProfileStore()
         
-        self.audio_features = [
-            'danceability', 'energy', 'key', 'loudness', 'mode',
-            'speechiness', 'acousticness', 'instrumentalness',
-            'liveness', 'valence', 'tempo'
-        ]
+        # Esquema de las interacciones: layout crudo o por buckets, índices y TTL
+        self.interactions = interactions if interactions is not None else InteractionStore()
+        
+        # Contadores de get_stats: total exacto + usuarios únicos (HyperLogLog),
+        # reconciliados con MongoDB en segundo plano
+        self.interaction_stats = interaction_stats if interaction_stats is not None else InteractionStats()
+        
+        # Cola bloqueante: add_event espera si está llena en vez de descartar
+        self.event_queue = queue.Queue(maxsize=event_queue_size)
+        self.n_workers = n_workers
+        self.event_batch_size = event_batch_size
+        self.pipeline_metrics = PipelineMetrics()
+        
+        # Log local de eventos: add_event escribe en el log, el procesador lo
+        # consume y confirma el offset al sincronizar el estado, y la escritura
+        # de interacciones es otro consumidor que va detrás de ese offset
+        self.event_log = event_log
+        self.log_consumer = None
+        if event_log is not None:
+            self.log_consumer = EventLogConsumer(event_log, batch_size=event_batch_size)
+            self.event_writer = EventLogSink(
+                event_log,
+                INTERACTIONS_CONSUMER,
+                self._write_events_to_mongodb,
+                batch_size=write_batch_size,
+                flush_interval=write_flush_interval,
+                limit_fn=self.log_consumer.committed,
+                id_fn=self.log_consumer.event_id
+            )
+        else:
+            # Escritura de interacciones en lote (write-behind)
+            self.event_writer = EventWriteBuffer(
+                self._write_events_to_mongodb,
+                batch_size=write_batch_size,
+                flush_interval=write_flush_interval,
+                max_pending=write_buffer_size
+            )
         
-        self.lock = threading.Lock()
         self.is_running = False
-        self.processor_thread = None
+        self.worker_threads = []
         
+        # Cambios incrementales del catálogo
+        self.catalog_watcher = None
+        self.catalog_position = None
+        self.catalog_operation_time = None
+    
     def connect_mongodb(self):
         """Conecta a MongoDB Atlas"""
         try:
-            self.client = MongoClient(self.mongodb_uri, serverSelectionTimeoutMS=5000)
+            self.client = MongoClient(self.mongodb_uri, **self.mongo_client_options)
             self.client.server_info()
             self.db = self.client[self.database_name]
             print("Conectado a MongoDB Atlas")
@@ -51,78 +175,388 @@ class KappaProcessorMongoDB:
         except Exception as e:
             print(f"Error conectando a MongoDB: {e}")
             return False
-        
+    
+    @property
+    def storage(self):
+        """Backend de almacenamiento: el configurado o MongoStorage sobre self.db"""
+        if self._storage is None and self.db is not None:
+            self._storage = MongoStorage(
+                self.db, self.interactions,
+                retry=self.retry_policy,
+                breaker=self.breaker,
+                **self.storage_options
+            )
+        return self._storage
+    
+    @property
+    def tracks_df(self):
+        return self.content.tracks_df
+    
+    @property
+    def track_popularity(self):
+        """Popularidad por track_id"""
+        return self.popularity.by_track
+    
     def load_data_from_mongodb(self):
-        """Carga datos desde MongoDB"""
-        if not self.db:
+        """Carga datos desde el backend de almacenamiento (MongoDB por defecto)"""
+        if self.storage is None:
             if not self.connect_mongodb():
                 return False
+        storage = self.storage
         
-        print("Cargando datos desde MongoDB...")
+        print(f"Cargando datos desde {storage.name}...")
         
-        # Obtener todas las canciones
-        tracks_collection = self.db['tracks']
-        tracks_cursor = tracks_collection.find({})
-        tracks_list = list(tracks_cursor)
+        self._ensure_interaction_indexes()
+        self._load_derived_state()
+        if self.event_log is not None:
+            self._ensure_state_indexes()
         
-        if not tracks_list:
-            print("ERROR: No hay datos en MongoDB. Ejecuta migrate_to_mongodb.py primero.")
-            return False
+        # Posición de los cambios antes de leer: lo que cambie durante la carga
+        # lo vuelve a aplicar el watcher (los upserts son idempotentes)
+        self._capture_catalog_position()
+        
+        # Arranque rápido desde snapshot si el catálogo no cambió
+        snapshot_key = None
+        if self.snapshot_dir:
+            snapshot_key = storage.catalog_fingerprint(self.content.snapshot_params())
+            if self.content.load_snapshot(self.snapshot_dir, snapshot_key):
+                self._reset_derived_model()
+                if not self._recover_event_log():
+                    return False
+                self._load_popularity_from_mongodb()
+                self._load_collaborative_model()
+                self.interaction_stats.start(storage)
+                print(f"Datos cargados desde snapshot {snapshot_key}: {len(self.catalog)} canciones")
+                return True
         
-        # Convertir a DataFrame
-        self.tracks_df = pd.DataFrame(tracks_list)
+        # Solo los campos del modelo, por lotes y a columnas preasignadas
+        tracks_df, self.load_stats = storage.read_catalog(
+            self.audio_features, batch_size=self.load_batch_size
+        )
         
-        # Eliminar campo _id de MongoDB
-        if '_id' in self.tracks_df.columns:
-            self.tracks_df = self.tracks_df.drop('_id', axis=1)
+        if tracks_df.empty:
+            print("ERROR: No hay datos en MongoDB. Ejecuta migrate_to_mongodb.py primero.")
+            return False
         
-        # Preparar features
-        features = self.tracks_df[self.audio_features].fillna(0)
-        features_scaled = self.scaler.fit_transform(features)
+        self.build_from_dataframe(tracks_df)
         
-        # Calcular similitud
-        self.similarity_matrix = cosine_similarity(features_scaled)
+        if snapshot_key:
+            self.content.save_snapshot(self.snapshot_dir, snapshot_key)
         
-        # Cargar popularidad desde MongoDB
+        # Cargar popularidad guardada
+        if not self._recover_event_log():
+            return False
         self._load_popularity_from_mongodb()
+        self._load_collaborative_model()
+        
+        # Totales de interacciones y usuarios (primera reconciliación en segundo plano)
+        self.interaction_stats.start(storage)
         
-        print(f"Datos cargados: {len(self.tracks_df)} canciones")
+        print(f"Datos cargados: {len(self.tracks_df)} canciones en {self.load_stats['load_seconds']:.1f}s "
+              f"(DataFrame {self.load_stats['dataframe_mb']:.1f} MB, "
+              f"pico RSS {self.load_stats['peak_rss_mb'] or 0:.0f} MB)")
+        print(f"Índice de vecinos ({self.neighbor_index.active_backend}): "
+              f"{self.neighbor_index.nbytes / 1e6:.1f} MB en {self.neighbor_index.build_seconds:.1f}s")
+        return True
+    
+    def _load_derived_state(self):
+        """Colecciones de popularidad/perfiles y pesos de la versión publicada"""
+        self.set_derived_state(self.storage.read_derived_state())
+        if self.derived_state['version']:
+            print(f"Estado derivado: versión {self.derived_state['version']} "
+                  f"(pesos {self.interaction_weights})")
+    
+    def set_derived_state(self, state):
+        self.derived_state = state
+        self.interaction_weights = dict(state['weights'])
+    
+    @property
+    def popularity_collection_name(self):
+        return self.derived_state['popularity_collection']
+    
+    @property
+    def profiles_collection_name(self):
+        return self.derived_state['profiles_collection']
+    
+    def _ensure_interaction_indexes(self):
+        """Índices (user_id, tiempo) y de tiempo/TTL de las interacciones"""
+        try:
+            self.storage.ensure_interaction_indexes()
+        except Exception as e:
+            print(f"Advertencia: no se pudieron crear los índices de interacciones: {e}")
+    
+    def _ensure_state_indexes(self):
+        """Índice único de la popularidad (guarda de las escrituras con offset del log)"""
+        try:
+            self.storage.ensure_state_indexes()
+        except Exception as e:
+            print(f"Advertencia: no se pudieron crear los índices de popularidad: {e}")
+    
+    def _recover_event_log(self):
+        """
+        Antes de cargar el estado: termina la sincronización que una caída dejó
+        entre las escrituras y el commit, y escribe las interacciones ya
+        confirmadas (el trending y el modelo colaborativo las leen al cargar)
+        """
+        if self.log_consumer is None:
+            return True
+        if not self.log_consumer.recover(
+            self.storage, self.interaction_weights, self.catalog.genre, self.user_profiles.recent_size
+        ):
+            return False
+        self.event_writer.flush()
         return True
+    
+    def build_from_dataframe(self, tracks_df):
+        """Construye el modelo en memoria a partir de un DataFrame de canciones"""
+        self.content.build(tracks_df)
+        self._reset_derived_model()
+    
+    def _reset_derived_model(self):
+        """Popularidad y trending vacíos alineados con las filas del catálogo actual"""
+        self.popularity.reset_rows(len(self.catalog))
+        self.trending.reset()
+        self.trending.set_genres(self.catalog.genre_codes)
+        self.recommender.invalidate()
+    
+    def _capture_catalog_position(self):
+        """Guarda la posición de updated_at y el operationTime del servidor (si es replica set)"""
+        try:
+            self.catalog_position, self.catalog_operation_time = self.storage.catalog_position()
+        except Exception as e:
+            print(f"Advertencia: no se pudo leer la posición del catálogo: {e}")
+    
+    def apply_catalog_changes(self, upserts=(), deleted_ids=()):
+        """
+        Aplica altas/modificaciones y bajas de canciones sin recargar el catálogo.
+        Usa el scaler ya ajustado (sin refit) y recalcula solo las listas de
+        vecinos afectadas. Devuelve el número de canciones cambiadas.
+        """
+        changes = catalog_changes(upserts)
         
+        with self.content.lock:
+            deleted_ids = [t for t in deleted_ids if t in self.catalog]
+            if changes.empty and not deleted_ids:
+                return 0
+            
+            features_scaled = self.content.scale(changes)
+            with self.popularity.lock:
+                rows, deleted_rows = self.catalog.apply_changes(changes, deleted_ids)
+                # Canciones nuevas: popularidad ya conocida (si la hay)
+                self.popularity.grow(self.catalog.track_ids)
+            
+            affected = self.neighbor_index.update(rows, features_scaled, deleted_rows)
+            self.trending.set_genres(self.catalog.genre_codes)
+            self.recommender.invalidate()
+            self.content.refresh_dataframe()
+        
+        print(f"Catálogo actualizado: {len(rows)} altas/modificaciones, {len(deleted_rows)} bajas, "
+              f"{len(affected)} listas de vecinos recalculadas")
+        return len(rows) + len(deleted_rows)
+    
+    def start_catalog_watcher(self, poll_interval=5.0, mode='auto'):
+        """Sigue los cambios de la colección tracks en segundo plano"""
+        if self.storage is None or self.catalog_watcher is not None:
+            return
+        watcher = self.storage.catalog_watcher(
+            self.apply_catalog_changes,
+            poll_interval=poll_interval,
+            mode=mode,
+            position=self.catalog_position,
+            start_at_operation_time=self.catalog_operation_time
+        )
+        if watcher is None:
+            return
+        self.catalog_watcher = watcher
+        self.catalog_watcher.start()
+        print("Watcher del catálogo iniciado")
+    
+    def stop_catalog_watcher(self):
+        if self.catalog_watcher is not None:
+            self.catalog_watcher.stop()
+            self.catalog_watcher = None
+    
     def _load_popularity_from_mongodb(self):
-        """Carga popularidad de canciones desde MongoDB"""
-        popularity_collection = self.db['track_popularity']
+        """Carga popularidad de canciones y eventos recientes (trending) guardados"""
+        self.load_popularity_docs(self.storage.load_popularity())
+        
+        since = self.trending.warmup_since()
+        if since is not None:
+            try:
+                self.warm_up_trending(self.storage.recent_interactions(since))
+            except Exception as e:
+                print(f"Advertencia: no se pudo cargar el trending reciente: {e}")
+    
+    def _load_collaborative_model(self):
+        """Co-ocurrencias desde las interacciones guardadas"""
+        if self.collaborative is None:
+            return
+        try:
+            self.build_collaborative(self.storage.iter_interaction_counts())
+        except Exception as e:
+            print(f"Advertencia: no se pudo construir el modelo colaborativo: {e}")
+    
+    def build_collaborative(self, count_batches):
+        """
+        Construye el modelo con lotes (user_id, track_id, interaction_type,
+        count) y arranca su thread de actualización
+        """
+        def batches():
+            for counts in count_batches:
+                rows = counts['track_id'].map(self.catalog.rows)
+                known = rows.notna().to_numpy()
+                counts = counts[known]
+                weights = counts['interaction_type'].map(self.interaction_weights).fillna(1) * counts['count']
+                yield counts['user_id'].tolist(), rows[known].to_numpy(dtype=np.int64), weights.to_numpy()
         
-        for doc in popularity_collection.find({}):
-            self.track_popularity[doc['track_id']] = doc['popularity']
+        self.collaborative.build(batches(), len(self.catalog))
+        self.collaborative.start()
+        stats = self.collaborative.get_stats()
+        print(f"Modelo colaborativo: {stats['users']:,} usuarios, "
+              f"{stats['cooccurrence_entries']:,} co-ocurrencias, {stats['memory_mb']:.1f} MB "
+              f"en {stats['build_seconds']:.1f}s")
+    
+    def _add_collaborative_events(self, events):
+        """Encola (usuario, fila, peso) de los eventos para el modelo colaborativo"""
+        users, rows, weights = [], [], []
+        for event in events:
+            row = self.catalog.row(event['track_id'])
+            if row is not None:
+                users.append(event['user_id'])
+                rows.append(row)
+                weights.append(self.interaction_weights.get(event['interaction_type'], 1))
+        self.collaborative.add_events(users, rows, weights)
+    
+    def load_popularity_docs(self, docs):
+        """Carga documentos {track_id, popularity} en el estado en memoria"""
+        self.popularity.load_docs(docs, self.catalog.row)
         
+        # Ventana total del trending = popularidad acumulada
+        if 'all' in self.trending.windows:
+            popularity_array = self.popularity.array
+            rows = np.flatnonzero(popularity_array)
+            self.trending.seed('all', rows, popularity_array[rows])
+    
+    def warm_up_trending(self, events):
+        """Suma interacciones guardadas a las ventanas con decaimiento (no a la total)"""
+        rows, weights, timestamps = self.event_arrays(events)
+        self.trending.add(rows, weights, timestamps, windows=self.trending.decaying_windows())
+    
+    def event_arrays(self, events):
+        """(filas, pesos, timestamps) de los eventos de canciones del catálogo"""
+        rows, weights, timestamps = [], [], []
+        now = time.time()
+        for event in events:
+            row = self.catalog.row(event['track_id'])
+            if row is None:
+                continue
+            rows.append(row)
+            weights.append(self.interaction_weights.get(event['interaction_type'], 1))
+            timestamp = event.get('timestamp')
+            timestamps.append(timestamp.timestamp() if timestamp else now)
+        return rows, weights, timestamps
+    
     def start_processing(self):
-        """Inicia el procesamiento de eventos"""
+        """Inicia los workers de procesamiento de eventos"""
         if self.is_running:
             return
-            
-        self.is_running = True
-        self.processor_thread = threading.Thread(target=self._process_events_loop, daemon=True)
-        self.processor_thread.start()
-        print("Procesador de eventos iniciado")
         
+        self.is_running = True
+        if self.log_consumer is not None:
+            # Un solo consumidor del log: los offsets avanzan en orden
+            self.event_writer.start()
+            self.worker_threads = [threading.Thread(target=self._consume_log_loop, daemon=True)]
+        else:
+            self.worker_threads = [
+                threading.Thread(target=self._process_events_loop, daemon=True)
+                for _ in range(self.n_workers)
+            ]
+        for worker in self.worker_threads:
+            worker.start()
+        print(f"Procesador de eventos iniciado ({len(self.worker_threads)} workers)")
+    
     def stop_processing(self):
-        """Detiene el procesamiento"""
-        self.is_running = False
-        if self.processor_thread:
-            self.processor_thread.join(timeout=2)
-        print("Procesador detenido")
-        
+        """Detiene el procesamiento tras drenar la cola"""
+        if self.is_running:
+            self.is_running = False
+            # Un centinela por worker, detrás de los eventos pendientes
+            # (el consumidor del log termina solo al llegar al final)
+            if self.log_consumer is None:
+                for _ in self.worker_threads:
+                    self.event_queue.put(None)
+            for worker in self.worker_threads:
+                worker.join(timeout=2)
+            self.worker_threads = []
+            stopped = True
+        else:
+            stopped = False
+        self.sync_to_storage()
+        if stopped:
+            print("Procesador detenido")
+    
     def _process_events_loop(self):
-        """Loop de procesamiento de eventos"""
-        while self.is_running:
-            if self.event_queue:
-                with self.lock:
-                    event = self.event_queue.popleft()
-                    self._process_single_event(event)
-            else:
-                time.sleep(0.1)
-                
+        """Worker: espera eventos en la cola y los procesa en micro-lotes"""
+        while True:
+            try:
+                item = self.event_queue.get(timeout=0.5)
+            except queue.Empty:
+                self._maybe_sync_popularity()
+                continue
+            
+            batch = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            
+            # Drenar lo que ya esté en cola sin bloquear
+            while not stop and len(batch) < self.event_batch_size:
+                try:
+                    item = self.event_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            
+            if batch:
+                started = time.monotonic()
+                self.apply_batch([event for _, event in batch])
+                finished = time.monotonic()
+                self.pipeline_metrics.record_batch(
+                    [(finished - enqueued_at) * 1000 for enqueued_at, _ in batch],
+                    (finished - started) * 1000
+                )
+            
+            self._maybe_sync_popularity()
+            if stop:
+                return
+    
+    def _consume_log_loop(self):
+        """Consumidor del log: procesa micro-lotes hasta llegar al final tras stop"""
+        while True:
+            if not self._consume_event_log():
+                if not self.is_running:
+                    return
+                self.log_consumer.wait(timeout=0.5)
+            self._maybe_sync_popularity()
+    
+    def _consume_event_log(self):
+        """Procesa un micro-lote del log desde el último offset; devuelve cuántos eventos"""
+        started = time.monotonic()
+        events = self.log_consumer.consume(self.apply_batch)
+        if not events:
+            return 0
+        finished = time.monotonic()
+        
+        # Lag desde el timestamp del evento (puede venir de antes de un reinicio)
+        now = time.time()
+        self.pipeline_metrics.record_batch(
+            [(now - event['timestamp'].timestamp()) * 1000 for event in events],
+            (finished - started) * 1000
+        )
+        return len(events)
+    
     def add_event(self, user_id, track_id, interaction_type='play'):
         """Agrega un evento y lo guarda en MongoDB"""
         event = {
@@ -132,211 +566,273 @@ class KappaProcessorMongoDB:
             'timestamp': datetime.now()
         }
         
-        # Guardar en MongoDB
-        try:
-            interactions_collection = self.db['user_interactions']
-            interactions_collection.insert_one(event.copy())
-        except Exception as e:
-            print(f"Error guardando interacción en MongoDB: {e}")
+        if self.event_log is not None:
+            # Durable en el log: el procesador y la escritura en MongoDB lo consumen
+            self.event_log.append(event)
+            if not self.event_writer.is_running:
+                self.event_writer.start()
+            if not self.is_running:
+                while self._consume_event_log():
+                    pass
+                self._maybe_sync_popularity()
+            return event
         
-        # Agregar a cola de procesamiento
-        self.event_queue.append(event)
-        
-        # Procesar inmediatamente si no hay thread
-        if not self.is_running:
-            with self.lock:
-                self._process_single_event(event)
+        if self.is_running:
+            # Agregar a cola de procesamiento (bloquea si está llena)
+            self.event_queue.put((time.monotonic(), event))
+        else:
+            # Procesar inmediatamente si no hay workers
+            self.apply_batch([event])
+            self._maybe_sync_popularity()
         
+        # Guardar en MongoDB (en lote, desde el thread de escritura)
+        self.buffer_event(event)
         return event
+    
+    def buffer_event(self, event):
+        """Deja el evento en el buffer de escritura; si sigue lleno, se descarta"""
+        try:
+            self.event_writer.put(event.copy())
+        except BufferFullError as e:
+            print(f"Error guardando evento de {event['user_id']}: {e}")
+    
+    def _write_events_to_mongodb(self, events):
+        """Escribe un lote de interacciones en el backend de almacenamiento"""
+        inserted = self.storage.write_interactions(events)
+        self.interaction_stats.record(events, inserted)
+    
+    def apply_batch(self, events):
+        """
+        Aplica un micro-lote de eventos al modelo en memoria: popularidad,
+        trending, perfiles y co-ocurrencias (no escribe las interacciones)
+        """
+        # Agregar pesos fuera del lock
+        weights = defaultdict(int)
+        for event in events:
+            weights[event['track_id']] += self.interaction_weights.get(event['interaction_type'], 1)
         
-    def _process_single_event(self, event):
-        """Procesa un evento individual"""
-        track_id = event['track_id']
-        interaction_type = event['interaction_type']
-        
-        # Actualizar popularidad
-        weight = {'play': 1, 'like': 3, 'skip': -1}.get(interaction_type, 1)
-        self.track_popularity[track_id] += weight
+        rows = []
+        row_weights = []
+        for track_id, weight in weights.items():
+            row = self.catalog.row(track_id)
+            if row is not None:
+                rows.append(row)
+                row_weights.append(weight)
+        self.popularity.apply(weights, rows, row_weights)
         
-        # Actualizar en MongoDB (batch cada 10 eventos para eficiencia)
-        if len(self.event_queue) % 10 == 0:
-            self._sync_popularity_to_mongodb()
+        # Trending con los timestamps de cada evento
+        self.trending.add(*self.event_arrays(events))
+        self.apply_user_events(events)
+    
+    def apply_user_events(self, events):
+        """Perfiles y co-ocurrencias de un micro-lote (sin popularidad ni trending)"""
+        # Perfiles: contadores, géneros con like y recientes por usuario
+        self.user_profiles.apply_events(events, self.catalog.genre)
         
+        # Co-ocurrencias: las aplica el thread del modelo colaborativo
+        if self.collaborative is not None:
+            self._add_collaborative_events(events)
+    
+    def _maybe_sync_popularity(self):
+        """Sincroniza con MongoDB si pasó popularity_sync_interval desde la última vez"""
+        if self.popularity.sync_due(self.popularity_sync_interval):
+            self.sync_to_storage()
+    
+    def sync_to_storage(self):
+        """
+        Sincroniza popularidad y perfiles. Con el log de eventos, los deltas
+        hasta el offset consumido se escriben con ese offset como guarda y se
+        confirma el offset (EventLogConsumer.sync)
+        """
+        if self.storage is None:
+            return
+        if self.log_consumer is not None:
+            self.log_consumer.sync(self.storage, self.popularity, self.user_profiles)
+            return
+        self._sync_popularity_to_mongodb()
+        self.sync_user_profiles()
+    
+    def sync_user_profiles(self):
+        """Sincroniza los deltas de perfiles ($inc + $push, un bulk_write)"""
+        if self.storage is None:
+            return False
+        return self.user_profiles.flush(self.storage.apply_profile_updates)
+    
     def _sync_popularity_to_mongodb(self):
-        """Sincroniza popularidad con MongoDB"""
+        """Sincroniza solo los deltas de popularidad ($inc, un bulk_write en MongoDB)"""
+        track_ids, deltas = self.popularity.take_deltas()
+        if not track_ids:
+            return True
+        
         try:
-            popularity_collection = self.db['track_popularity']
-            
-            for track_id, popularity in self.track_popularity.items():
-                popularity_collection.update_one(
-                    {'track_id': track_id},
-                    {'$set': {'popularity': popularity, 'updated_at': datetime.now()}},
-                    upsert=True
-                )
+            self.storage.apply_popularity_deltas(track_ids, deltas)
         except Exception as e:
-            print(f"Error sincronizando popularidad: {e}")
-            
+            self.popularity.restore_deltas(e, track_ids, deltas)
+            return False
+        return True
+    
     def get_recommendations(self, track_id, user_id=None, top_n=10):
         """Genera recomendaciones en tiempo real"""
-        with self.lock:
-            track_idx = self.tracks_df[self.tracks_df['track_id'] == track_id].index
-            
-            if len(track_idx) == 0:
-                return []
-            
-            track_idx = track_idx[0]
-            
-            # Similitudes base
-            sim_scores = list(enumerate(self.similarity_matrix[track_idx]))
-            sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-            sim_scores = sim_scores[1:top_n*2]
-            
-            # Aplicar boost de popularidad
-            boosted_scores = []
-            for idx, score in sim_scores:
-                track = self.tracks_df.iloc[idx]
-                popularity_boost = self.track_popularity.get(track['track_id'], 0) * 0.01
-                final_score = score + popularity_boost
-                boosted_scores.append((idx, final_score, track))
-            
-            # Personalización por usuario
-            if user_id:
-                user_preferences = self._get_user_preferences_from_mongodb(user_id)
-                if user_preferences:
-                    liked_genres = user_preferences.get('liked_genres', set())
-                    
-                    for i, (idx, score, track) in enumerate(boosted_scores):
-                        if track['track_genre'] in liked_genres:
-                            boosted_scores[i] = (idx, score * 1.2, track)
-            
-            # Top N final
-            boosted_scores = sorted(boosted_scores, key=lambda x: x[1], reverse=True)
-            boosted_scores = boosted_scores[:top_n]
-            
-            recommendations = []
-            for idx, score, track in boosted_scores:
-                recommendations.append({
-                    'track_id': track['track_id'],
-                    'track_name': track['track_name'],
-                    'artists': track['artists'],
-                    'track_genre': track['track_genre'],
-                    'score': float(score),
-                    'popularity': self.track_popularity.get(track['track_id'], 0)
-                })
-            
+        track_idx = self.catalog.row(track_id)
+        
+        if track_idx is None or top_n <= 0:
+            return []
+        
+        # Resultado en caché si ni la popularidad de los candidatos ni el perfil cambiaron
+        key = (track_id, user_id, top_n)
+        version = self.recommendation_version(user_id)
+        cached = self.recommender.cached(key, version)
+        if cached is not None:
+            return cached
+        popularity_seq = self.popularity.seq
+        
+        # Personalización por usuario (consulta fuera del lock)
+        liked_genres = set()
+        degraded = False
+        if user_id:
+            preferences, degraded = self.user_preferences(user_id)
+            if preferences:
+                liked_genres = preferences.get('liked_genres', set())
+        
+        recommendations = self.recommender.recommend(track_idx, top_n, liked_genres)
+        if degraded:
+            # Solo por contenido: no se guarda para no servirlo cuando MongoDB vuelva
             return recommendations
+        return self.recommender.store(key, version, track_idx, popularity_seq, recommendations)
+    
+    def recommendation_version(self, user_id):
+        """Versión de los datos de los que depende una recomendación (salvo la popularidad)"""
+        return self.recommender.version(self.user_profiles.preference_version(user_id) if user_id else 0)
     
-    def _get_user_preferences_from_mongodb(self, user_id):
-        """Obtiene preferencias de usuario desde MongoDB"""
+    def get_recommendations_batch(self, track_ids=None, user_id=None, top_n=10, blend=False):
+        """
+        Recomendaciones para varias canciones semilla en una sola pasada.
+        
+        - blend=False: devuelve {track_id: [recomendaciones]} por cada semilla
+        - blend=True: recomienda desde el centroide de las semillas (playlist).
+          Sin track_ids usa las canciones recientes del usuario.
+        """
+        # Preferencias del usuario: una sola consulta para todo el lote
+        liked_genres = set()
+        recent_tracks = []
+        if user_id:
+            preferences, _ = self.user_preferences(user_id)
+            if preferences:
+                liked_genres = preferences.get('liked_genres', set())
+                recent_tracks = preferences.get('recent_tracks', [])
+        
+        if track_ids is None:
+            track_ids = recent_tracks if blend else []
+        
+        seeds = [(t, self.catalog.row(t)) for t in dict.fromkeys(track_ids) if t in self.catalog]
+        if top_n <= 0 or not seeds:
+            return [] if blend else {}
+        
+        seed_rows = np.array([row for _, row in seeds], dtype=np.int64)
+        
+        if blend:
+            return self.recommender.recommend_blend(seed_rows, top_n, liked_genres)
+        
+        recommendations = self.recommender.recommend_seeds(seed_rows, top_n, liked_genres)
+        return {track_id: recs for (track_id, _), recs in zip(seeds, recommendations)}
+    
+    def user_preferences(self, user_id):
+        """
+        (preferencias, degradado) desde el perfil materializado. Si MongoDB
+        no responde a tiempo o el circuit breaker está abierto, (None, True):
+        la recomendación sigue solo por contenido en vez de esperar
+        """
         try:
-            interactions_collection = self.db['user_interactions']
-            
-            # Obtener últimas 100 interacciones
-            user_interactions = list(interactions_collection.find(
-                {'user_id': user_id}
-            ).sort('timestamp', -1).limit(100))
-            
-            if not user_interactions:
-                return None
-            
-            # Extraer géneros de canciones con like
-            liked_tracks = [i['track_id'] for i in user_interactions if i['interaction_type'] == 'like']
-            
-            liked_genres = set()
-            for track_id in liked_tracks:
-                track_row = self.tracks_df[self.tracks_df['track_id'] == track_id]
-                if not track_row.empty:
-                    liked_genres.add(track_row.iloc[0]['track_genre'])
-            
-            return {
-                'liked_genres': liked_genres,
-                'total_interactions': len(user_interactions)
-            }
+            return profile_preferences(self._get_materialized_profile(user_id)), False
         except Exception as e:
-            print(f"Error obteniendo preferencias: {e}")
-            return None
+            self.record_degraded(e)
+            return None, True
+    
+    def record_degraded(self, error, expected=(CircuitOpenError,)):
+        """Cuenta una recomendación solo por contenido (no se pudo leer el perfil)"""
+        with self.degraded_lock:
+            self.degraded_recommendations += 1
+        if not isinstance(error, expected):
+            print(f"Error obteniendo preferencias: {error}")
+    
+    def _get_materialized_profile(self, user_id):
+        """Perfil desde la caché LRU o, si no está, una lectura por _id"""
+        return self.user_profiles.get(user_id, self._load_user_profile_doc)
+    
+    def _load_user_profile_doc(self, user_id):
+        return self.storage.load_profile(user_id)
     
     def get_user_profile(self, user_id):
-        """Obtiene perfil de usuario desde MongoDB"""
+        """Obtiene perfil de usuario (caché LRU o user_profiles)"""
         try:
-            interactions_collection = self.db['user_interactions']
-            
-            # Obtener todas las interacciones del usuario
-            user_interactions = list(interactions_collection.find(
-                {'user_id': user_id}
-            ).sort('timestamp', -1).limit(100))
-            
-            if not user_interactions:
-                return None
-            
-            liked = [i for i in user_interactions if i['interaction_type'] == 'like']
-            played = [i for i in user_interactions if i['interaction_type'] == 'play']
-            skipped = [i for i in user_interactions if i['interaction_type'] == 'skip']
-            
-            return {
-                'user_id': user_id,
-                'total_interactions': len(user_interactions),
-                'likes': len(liked),
-                'plays': len(played),
-                'skips': len(skipped),
-                'recent_tracks': user_interactions[:5]
-            }
+            return profile_summary(self._get_materialized_profile(user_id))
         except Exception as e:
             print(f"Error obteniendo perfil: {e}")
             return None
     
-    def get_trending_tracks(self, top_n=10):
-        """Obtiene trending tracks"""
-        with self.lock:
-            sorted_tracks = sorted(
-                self.track_popularity.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )[:top_n]
-            
-            trending = []
-            for track_id, popularity in sorted_tracks:
-                track_row = self.tracks_df[self.tracks_df['track_id'] == track_id]
-                if not track_row.empty:
-                    track = track_row.iloc[0]
-                    trending.append({
-                        'track_id': track_id,
-                        'track_name': track['track_name'],
-                        'artists': track['artists'],
-                        'track_genre': track['track_genre'],
-                        'popularity': popularity
-                    })
-            
-            return trending
+    def get_trending_tracks(self, top_n=10, window='day', genre=None):
+        """
+        Trending por ventana ('hour', 'day' o 'all') y opcionalmente por género.
+        Lee la lista top-K ya mantenida por el procesador: O(top_n).
+        """
+        genre_code = None
+        if genre is not None:
+            genre_code = self.catalog.genre_lookup.get(genre)
+            if genre_code is None:
+                return []
+        
+        # Margen por canciones borradas del catálogo
+        rows, scores = self.trending.top(window, top_n + 10, genre_code)
+        return self.recommender.trending_records(rows, scores, top_n)
     
     def get_stats(self):
         """Obtiene estadísticas del sistema"""
-        try:
-            interactions_collection = self.db['user_interactions']
-            
-            total_interactions = interactions_collection.count_documents({})
-            unique_users = len(interactions_collection.distinct('user_id'))
-            
-            return {
-                'total_tracks': len(self.tracks_df),
-                'total_users': unique_users,
-                'total_interactions': total_interactions,
-                'events_in_queue': len(self.event_queue),
-                'trending_count': len([p for p in self.track_popularity.values() if p > 0])
-            }
-        except Exception as e:
-            print(f"Error obteniendo stats: {e}")
-            return {
-                'total_tracks': len(self.tracks_df) if self.tracks_df is not None else 0,
-                'total_users': 0,
-                'total_interactions': 0,
-                'events_in_queue': len(self.event_queue),
-                'trending_count': 0
-            }
+        # Solo contadores en memoria: ninguna consulta a MongoDB por render
+        cache_stats = self.recommendation_cache.get_stats()
+        counters = self.interaction_stats.snapshot()
+        return {
+            'total_tracks': self.catalog.active_count,
+            'total_users': counters['total_users'],
+            'total_interactions': counters['total_interactions'],
+            'stats_reconciled_at': counters['stats_reconciled_at'],
+            'events_in_queue': self._queue_depth(),
+            'events_pending_write': len(self.event_writer),
+            'queue_lag_ms': self.pipeline_metrics.avg_lag_ms,
+            'trending_count': self.popularity.positive_count,
+            'cache_hits': cache_stats['hits'],
+            'cache_misses': cache_stats['misses'],
+            'cache_hit_rate': cache_stats['hit_rate'],
+            'cache_size': cache_stats['size'],
+            'storage_breaker': self.breaker.state,
+            'degraded_recommendations': self.degraded_recommendations,
+            'event_log': self.event_log.get_stats() if self.event_log is not None else None,
+            'collaborative': self.collaborative.get_stats() if self.collaborative is not None else None,
+        }
+    
+    def _queue_depth(self):
+        if self.log_consumer is not None:
+            return self.log_consumer.backlog()
+        return self.event_queue.qsize()
+    
+    def get_pipeline_metrics(self):
+        """Métricas de la cola de procesamiento (lag, micro-lotes, workers)"""
+        metrics = self.pipeline_metrics.snapshot()
+        metrics['queue_depth'] = self._queue_depth()
+        metrics['workers'] = len(self.worker_threads)
+        return metrics
     
     def close(self):
         """Cierra conexión a MongoDB"""
+        self.stop_catalog_watcher()
         self.stop_processing()
+        self.event_writer.close()
+        self.interaction_stats.stop()
+        if self.collaborative is not None:
+            self.collaborative.close()
+        if self.event_log is not None:
+            self.event_log.close()
+        if self._storage is not None:
+            self._storage.close()
         if self.client:
             self.client.close()
             print("Conexión a MongoDB cerrada")
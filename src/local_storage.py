@@ -0,0 +1,402 @@
+"""
+Almacenamiento local embebido (SQLite)
+Mismo contrato que MongoStorage sin servidor ni red: en memoria (':memory:')
+para benchmarks y pruebas offline, o en un archivo para nodos edge
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from catalog_loader import CatalogColumns, peak_rss_mb
+from derived_state import DERIVED_STATE_ID, derived_state_from_doc
+from model_snapshot import SNAPSHOT_FORMAT
+from storage import PAIR_COUNT_COLUMNS, StorageBackend
+from user_profiles import RECENT_SIZE, merge_profile, profile_from_doc
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL,
+    row_hash TEXT,
+    updated_at REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tracks_seq ON tracks (seq);
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT,
+    user_id TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    interaction_type TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS interactions_user_time ON interactions (user_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS interactions_time ON interactions (timestamp);
+CREATE TABLE IF NOT EXISTS popularity (
+    track_id TEXT PRIMARY KEY,
+    popularity INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    log_offset INTEGER
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Columnas agregadas después de la primera versión del esquema
+MIGRATIONS = [
+    ('interactions', 'event_id', 'TEXT'),
+    ('popularity', 'log_offset', 'INTEGER'),
+]
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS interactions_event ON interactions (event_id);
+"""
+
+# Filas por consulta IN (...), por página de user_id y por fetchmany
+CHUNK_SIZE = 500
+USER_PAGE_SIZE = 10000
+FETCH_SIZE = 10000
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'$date': value.timestamp()}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _json_object(doc):
+    if len(doc) == 1 and '$date' in doc:
+        return datetime.fromtimestamp(doc['$date'])
+    return doc
+
+
+def encode_doc(doc):
+    """Documento → JSON (datetimes como {'$date': epoch}, como en Extended JSON)"""
+    return json.dumps(doc, default=_json_default)
+
+
+def decode_doc(text):
+    return json.loads(text, object_hook=_json_object)
+
+
+class LocalCatalogFeed:
+    """
+    Cambios del catálogo local para apply_fn(upserts, deleted_ids): al
+    arrancar aplica lo escrito después de position y luego recibe cada
+    upsert_tracks / delete_tracks en el thread que escribe
+    """
+
+    def __init__(self, storage, apply_fn, position=None):
+        self.storage = storage
+        self.apply_fn = apply_fn
+        self.position = position or 0
+        self.active_mode = 'local'
+        self.changes_applied = 0
+
+    def start(self):
+        upserts, deleted_ids = self.storage._subscribe(self)
+        self._apply(upserts, deleted_ids)
+
+    def stop(self, timeout=None):
+        self.storage._unsubscribe(self)
+
+    def _apply(self, upserts, deleted_ids):
+        if upserts or deleted_ids:
+            self.apply_fn(upserts, deleted_ids)
+            self.changes_applied += len(upserts) + len(deleted_ids)
+
+    def get_stats(self):
+        return {'mode': self.active_mode, 'changes_applied': self.changes_applied}
+
+
+class LocalStorage(StorageBackend):
+    """
+    Catálogo, interacciones, popularidad y perfiles en SQLite.
+
+    - path=':memory:' (por defecto) no escribe en disco; un archivo usa WAL y
+      synchronous=NORMAL (durable ante caídas del proceso, no del sistema)
+    - una conexión compartida por los threads del procesador, serializada
+      con un lock; cada escritura por lotes es una transacción
+    - la popularidad se suma con un upsert (ON CONFLICT ... popularity + delta)
+      y los perfiles se combinan con merge_profile, igual que en memoria; con
+      log_offset, las filas que ya tienen ese offset no cambian
+    - las interacciones con _id no se duplican (índice único de event_id)
+    - el catálogo no tiene watcher: upsert_tracks / delete_tracks avisan a los
+      LocalCatalogFeed suscritos
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.subscribers = []
+
+    def _migrate(self):
+        """Columnas nuevas en bases creadas con un esquema anterior"""
+        with self.conn:
+            for table, column, kind in MIGRATIONS:
+                columns = {row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')}
+                if column not in columns:
+                    self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {kind}')
+        self.conn.executescript(INDEXES)
+
+    # --- Catálogo ---
+
+    def upsert_tracks(self, docs):
+        """Altas y modificaciones de canciones (documentos como los de tracks)"""
+        docs = [{k: v for k, v in doc.items() if k != '_id'} for doc in docs]
+        if not docs:
+            return 0
+        now = time.time()
+        with self.lock:
+            seq = self._next_seq()
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT INTO tracks (track_id, doc, row_hash, updated_at, seq, deleted) '
+                    'VALUES (?, ?, ?, ?, ?, 0) ON CONFLICT (track_id) DO UPDATE SET '
+                    'doc = excluded.doc, row_hash = excluded.row_hash, '
+                    'updated_at = excluded.updated_at, seq = excluded.seq, deleted = 0',
+                    [
+                        (doc['track_id'], encode_doc(doc), str(doc.get('_row_hash')), now, seq)
+                        for doc in docs
+                    ]
+                )
+            subscribers = list(self.subscribers)
+        for feed in subscribers:
+            feed._apply(docs, [])
+        return len(docs)
+
+    def delete_tracks(self, track_ids):
+        """Bajas lógicas (deleted = 1), como en la colección tracks"""
+        track_ids = list(track_ids)
+        if not track_ids:
+            return 0
+        now = time.time()
+        with self.lock:
+            seq = self._next_seq()
+            with self.conn:
+                self.conn.executemany(
+                    'UPDATE tracks SET deleted = 1, updated_at = ?, seq = ? WHERE track_id = ?',
+                    [(now, seq, track_id) for track_id in track_ids]
+                )
+            subscribers = list(self.subscribers)
+        for feed in subscribers:
+            feed._apply([], track_ids)
+        return len(track_ids)
+
+    def _next_seq(self):
+        return self.conn.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM tracks').fetchone()[0]
+
+    def read_catalog(self, feature_columns, batch_size=5000):
+        started = time.perf_counter()
+        with self.lock:
+            capacity = self.conn.execute('SELECT COUNT(*) FROM tracks WHERE deleted = 0').fetchone()[0]
+            columns = CatalogColumns(feature_columns, capacity)
+            cursor = self.conn.execute('SELECT doc FROM tracks WHERE deleted = 0 ORDER BY rowid')
+            for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+                columns.extend(json.loads(doc) for doc, in rows)
+        tracks_df = columns.to_dataframe()
+
+        stats = {
+            'documents': len(tracks_df),
+            'load_seconds': time.perf_counter() - started,
+            'dataframe_mb': float(tracks_df.memory_usage(deep=True).sum()) / 1e6,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        return tracks_df, stats
+
+    def catalog_fingerprint(self, model_params):
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'format': SNAPSHOT_FORMAT, **model_params},
+                                 sort_keys=True, default=str).encode('utf-8'))
+        for rows in self._fetch_batches(
+            'SELECT track_id, row_hash, updated_at, deleted FROM tracks ORDER BY track_id'
+        ):
+            for track_id, row_hash, updated_at, deleted in rows:
+                digest.update(f"{track_id}|{row_hash}|{updated_at}|{deleted}\n".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def catalog_position(self):
+        with self.lock:
+            return self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM tracks').fetchone()[0], None
+
+    def catalog_watcher(self, apply_fn, poll_interval=5.0, mode='auto', position=None,
+                        start_at_operation_time=None):
+        return LocalCatalogFeed(self, apply_fn, position)
+
+    def _subscribe(self, feed):
+        """Suscribe el feed y devuelve los cambios posteriores a su posición"""
+        upserts, deleted_ids = [], []
+        with self.lock:
+            # Con el lock todo el tiempo: ningún cambio entre la lectura y la suscripción
+            cursor = self.conn.execute(
+                'SELECT track_id, doc, deleted FROM tracks WHERE seq > ? ORDER BY seq',
+                (feed.position,)
+            )
+            for rows in iter(lambda: cursor.fetchmany(FETCH_SIZE), []):
+                for track_id, doc, deleted in rows:
+                    if deleted:
+                        deleted_ids.append(track_id)
+                    else:
+                        upserts.append(decode_doc(doc))
+            if feed not in self.subscribers:
+                self.subscribers.append(feed)
+        return upserts, deleted_ids
+
+    def _unsubscribe(self, feed):
+        with self.lock:
+            if feed in self.subscribers:
+                self.subscribers.remove(feed)
+
+    # --- Interacciones ---
+
+    def write_interactions(self, events):
+        rows = [
+            (str(event['_id']) if '_id' in event else None, event['user_id'], event['track_id'],
+             event['interaction_type'], event['timestamp'].timestamp())
+            for event in events
+        ]
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO interactions (event_id, user_id, track_id, interaction_type, timestamp) '
+                'VALUES (?, ?, ?, ?, ?)', rows
+            )
+            return self.conn.total_changes - before
+
+    def _fetch_batches(self, sql, params=(), batch_size=FETCH_SIZE):
+        """
+        Lotes de filas de una consulta (fetchmany), como los cursores de
+        MongoDB: el lock se toma por lote y nunca se materializa el resultado
+        """
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+        try:
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    def recent_interactions(self, since):
+        for rows in self._fetch_batches(
+            'SELECT track_id, interaction_type, timestamp FROM interactions '
+            'WHERE timestamp >= ? ORDER BY timestamp', (since.timestamp(),)
+        ):
+            for track_id, interaction_type, timestamp in rows:
+                yield {'track_id': track_id, 'interaction_type': interaction_type,
+                       'timestamp': datetime.fromtimestamp(timestamp)}
+
+    def iter_interaction_counts(self, batch_size=100000):
+        for rows in self._fetch_batches(
+            'SELECT user_id, track_id, interaction_type, COUNT(*) FROM interactions '
+            'GROUP BY user_id, track_id, interaction_type', batch_size=batch_size
+        ):
+            yield pd.DataFrame(rows, columns=PAIR_COUNT_COLUMNS)
+
+    def count_interactions(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM interactions').fetchone()[0]
+
+    def iter_interaction_users(self):
+        # Por páginas sobre el índice (user_id, timestamp): el lock se libera entre páginas
+        last = ''
+        while True:
+            with self.lock:
+                page = self.conn.execute(
+                    'SELECT DISTINCT user_id FROM interactions WHERE user_id > ? '
+                    'ORDER BY user_id LIMIT ?', (last, USER_PAGE_SIZE)
+                ).fetchall()
+            if not page:
+                return
+            for user_id, in page:
+                yield user_id
+            last = page[-1][0]
+
+    # --- Estado derivado ---
+
+    def read_derived_state(self):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (DERIVED_STATE_ID,)).fetchone()
+        return derived_state_from_doc(decode_doc(row[0]) if row else None)
+
+    def load_popularity(self):
+        for rows in self._fetch_batches('SELECT track_id, popularity FROM popularity'):
+            for track_id, popularity in rows:
+                yield {'track_id': track_id, 'popularity': popularity}
+
+    def apply_popularity_deltas(self, track_ids, deltas, log_offset=None):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO popularity (track_id, popularity, updated_at, log_offset) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (track_id) DO UPDATE SET '
+                'popularity = popularity + excluded.popularity, updated_at = excluded.updated_at, '
+                'log_offset = COALESCE(excluded.log_offset, popularity.log_offset) '
+                'WHERE excluded.log_offset IS NULL OR popularity.log_offset IS NULL '
+                'OR popularity.log_offset < excluded.log_offset',
+                [(track_id, int(deltas[track_id]), now, log_offset) for track_id in track_ids]
+            )
+
+    def load_profile(self, user_id):
+        with self.lock:
+            row = self.conn.execute('SELECT doc FROM profiles WHERE user_id = ?', (user_id,)).fetchone()
+        return decode_doc(row[0]) if row else None
+
+    def apply_profile_updates(self, user_ids, updates, recent_size=RECENT_SIZE, log_offset=None):
+        """Lectura + merge_profile + escritura en una transacción"""
+        now = datetime.now()
+        with self.lock, self.conn:
+            for start in range(0, len(user_ids), CHUNK_SIZE):
+                chunk = user_ids[start:start + CHUNK_SIZE]
+                stored = dict(self.conn.execute(
+                    f"SELECT user_id, doc FROM profiles WHERE user_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall())
+                rows = []
+                for user_id in chunk:
+                    doc = decode_doc(stored[user_id]) if user_id in stored else {}
+                    applied = doc.get('log_offset')
+                    if log_offset is not None and applied is not None and applied >= log_offset:
+                        continue
+                    profile = merge_profile(profile_from_doc(user_id, doc), updates[user_id], recent_size)
+                    fields = {'updated_at': now}
+                    if log_offset is not None or applied is not None:
+                        fields['log_offset'] = log_offset if log_offset is not None else applied
+                    rows.append((user_id, encode_doc({'_id': user_id, **profile, **fields}),
+                                 now.timestamp()))
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO profiles (user_id, doc, updated_at) VALUES (?, ?, ?)', rows
+                )
+
+    def close(self):
+        with self.lock:
+            for feed in list(self.subscribers):
+                self.subscribers.remove(feed)
+            self.conn.close()
@@ -0,0 +1,104 @@
+"""
+Snapshots del modelo en disco
+Catálogo, features normalizadas, scaler e índice de vecinos en archivos .npy
+que se abren con np.memmap: arranque en segundos y páginas compartidas entre
+procesos (cada worker de Streamlit mapea los mismos archivos)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 1
+
+
+def catalog_fingerprint(tracks_collection, model_params):
+    """
+    Hash del catálogo + parámetros del modelo.
+    Solo lee track_id, _row_hash y updated_at (proyección), no los documentos completos.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'format': SNAPSHOT_FORMAT, **model_params},
+                             sort_keys=True, default=str).encode('utf-8'))
+
+    cursor = tracks_collection.find(
+        {}, {'_id': 0, 'track_id': 1, '_row_hash': 1, 'updated_at': 1}
+    ).sort('track_id', 1)
+    for doc in cursor:
+        digest.update(f"{doc['track_id']}|{doc.get('_row_hash')}|{doc.get('updated_at')}\n".encode('utf-8'))
+
+    return digest.hexdigest()[:16]
+
+
+def save_snapshot(directory, key, groups, meta, keep_last=2):
+    """
+    Guarda {grupo: {nombre: array}} como .npy + meta.json en directory/key.
+    Escribe en un directorio temporal y lo renombra (atómico).
+    """
+    final_path = os.path.join(directory, key)
+    if os.path.isdir(final_path):
+        return final_path
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{key}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for group, arrays in groups.items():
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_path, f"{group}__{name}.npy"), np.ascontiguousarray(values))
+
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'format': SNAPSHOT_FORMAT, 'key': key, **meta}, f, default=str)
+
+    try:
+        os.rename(tmp_path, final_path)
+    except OSError:
+        # Otro proceso escribió el mismo snapshot primero
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    _remove_old_snapshots(directory, keep_last)
+    return final_path
+
+
+def load_snapshot(directory, key):
+    """Abre un snapshot con memmap; devuelve (groups, meta) o None si no existe"""
+    path = os.path.join(directory, key)
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.isfile(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format') != SNAPSHOT_FORMAT:
+        return None
+
+    groups = {}
+    for filename in os.listdir(path):
+        if not filename.endswith('.npy'):
+            continue
+        group, name = filename[:-len('.npy')].split('__', 1)
+        groups.setdefault(group, {})[name] = _open_array(os.path.join(path, filename))
+
+    return groups, meta
+
+
+def _open_array(path):
+    """np.load con mmap (sin copias); los arrays vacíos no se pueden mapear"""
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path)
+
+
+def _remove_old_snapshots(directory, keep_last):
+    snapshots = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if not name.startswith('.') and os.path.isdir(os.path.join(directory, name))
+    ]
+    snapshots.sort(key=os.path.getmtime, reverse=True)
+    for path in snapshots[keep_last:]:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,172 @@
+"""
+Cliente MongoDB bajo carga
+Opciones del pool de conexiones, reintentos acotados con jitter y un
+circuit breaker que corta las llamadas mientras MongoDB no responde
+"""
+
+import random
+import threading
+import time
+
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout, PyMongoError, WTimeoutError
+
+# Estados del circuit breaker
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(PyMongoError):
+    """MongoDB marcado como caído: la llamada no se intenta"""
+
+
+def client_options(max_pool_size=100, min_pool_size=0, max_idle_time_ms=60000,
+                   wait_queue_timeout_ms=1000, server_selection_timeout_ms=5000,
+                   connect_timeout_ms=5000, socket_timeout_ms=None):
+    """
+    Argumentos de MongoClient: pool acotado, espera acotada por una conexión
+    libre y reintentos del driver (retryWrites/retryReads) de una vez
+    """
+    options = {
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': min_pool_size,
+        'maxIdleTimeMS': max_idle_time_ms,
+        'waitQueueTimeoutMS': wait_queue_timeout_ms,
+        'serverSelectionTimeoutMS': server_selection_timeout_ms,
+        'connectTimeoutMS': connect_timeout_ms,
+        'retryWrites': True,
+        'retryReads': True,
+    }
+    if socket_timeout_ms:
+        options['socketTimeoutMS'] = socket_timeout_ms
+    return options
+
+
+def is_transient_error(error):
+    """Red, elección de primario o timeout: el servidor puede responder si se reintenta"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout, WTimeoutError)):
+        return True
+    # Timeouts de pymongo.timeout() (CSOT)
+    return isinstance(error, PyMongoError) and getattr(error, 'timeout', False)
+
+
+def failed_keys(keys, error):
+    """
+    Claves (en el orden de las operaciones de un bulk_write) que no se
+    escribieron: con BulkWriteError las de writeErrors, con otro error todas
+    """
+    if isinstance(error, BulkWriteError):
+        return [keys[err['index']] for err in error.details.get('writeErrors', [])]
+    return list(keys)
+
+
+class CircuitBreaker:
+    """
+    Cuenta fallos transitorios consecutivos de MongoDB.
+
+    - closed: las llamadas pasan; failure_threshold fallos seguidos → open
+    - open: las llamadas fallan al instante (CircuitOpenError) durante
+      reset_timeout segundos
+    - half_open: pasa una llamada de prueba; si funciona → closed, si no → open
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self):
+        """True si la llamada puede intentarse ahora"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        with self.lock:
+            return self.state == OPEN
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) si el circuito lo permite; cuenta solo errores transitorios"""
+        if not self.allow():
+            raise CircuitOpenError("MongoDB no disponible (circuit breaker abierto)")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_transient_error(e):
+                self.record_failure()
+            else:
+                # El servidor respondió (p. ej. error de escritura): no está caído
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected,
+            }
+
+
+class RetryPolicy:
+    """
+    Reintentos acotados para operaciones idempotentes: hasta attempts intentos
+    con backoff exponencial y full jitter (espera aleatoria entre 0 y
+    min(max_delay, base_delay · 2^intento)) para no sincronizar los reintentos
+    de varios procesos
+    """
+
+    def __init__(self, attempts=3, base_delay=0.05, max_delay=1.0):
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.attempts - 1 or not is_transient_error(e):
+                    raise
+                self.retries += 1
+                time.sleep(self.delay(attempt))
@@ -0,0 +1,300 @@
+"""
+Índice de vecinos top-K
+Guarda solo vectores normalizados float32 y una tabla de vecinos precalculada,
+en lugar de la matriz de similitud densa N×N
+"""
+
+import copy
+import time
+
+import numpy as np
+
+from ann_index import ANN_BACKENDS, recall_at_k
+
+
+class NeighborIndex:
+    """
+    Índice de vecinos más cercanos por similitud coseno
+
+    Memoria O(N·K): vectores (N×F float32) + tabla de vecinos (N×K ids y scores).
+    La tabla se calcula por bloques de filas para no materializar nunca N×N.
+
+    backend: 'exact', 'ivf', 'lsh' o 'auto' (exacto hasta exact_threshold filas,
+    IVF por encima). ann_options se pasan al backend ANN (n_probe, n_tables...).
+    """
+
+    def __init__(self, n_neighbors=50, block_size=256, backend='auto',
+                 ann_options=None, exact_threshold=20000):
+        if backend not in ('auto', 'exact') and backend not in ANN_BACKENDS:
+            raise ValueError(f"Backend ANN desconocido: {backend}")
+
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.backend = backend
+        self.ann_options = ann_options or {}
+        self.exact_threshold = exact_threshold
+
+        self.ann = None
+        self.active_backend = 'exact'
+        self.build_seconds = 0.0
+        self.vectors = None
+        self.active = None
+        self.neighbor_ids = None
+        self.neighbor_scores = None
+
+    def __len__(self):
+        return 0 if self.vectors is None else len(self.vectors)
+
+    @staticmethod
+    def normalize(features):
+        """Normaliza filas a norma 1 en float32 (coseno = producto punto)"""
+        vectors = np.asarray(features, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def build(self, features):
+        """Construye el índice a partir de la matriz de features escaladas"""
+        started = time.perf_counter()
+        self.vectors = self.normalize(features)
+        self.active = None
+        n_rows = len(self.vectors)
+        k = min(self.n_neighbors, max(n_rows - 1, 0))
+
+        backend = self.backend
+        if backend == 'auto':
+            backend = 'exact' if n_rows <= self.exact_threshold else 'ivf'
+        self.ann = None
+        self.active_backend = 'exact'
+        if backend != 'exact' and k > 0:
+            self.ann = ANN_BACKENDS[backend](**self.ann_options).fit(self.vectors)
+            self.active_backend = backend
+
+        self.neighbor_ids = np.empty((n_rows, k), dtype=np.int32)
+        self.neighbor_scores = np.empty((n_rows, k), dtype=np.float32)
+
+        if k == 0:
+            return self
+
+        for start in range(0, n_rows, self.block_size):
+            stop = min(start + self.block_size, n_rows)
+            ids, scores = self._search(self.vectors[start:stop], k, np.arange(start, stop))
+            self.neighbor_ids[start:stop] = ids
+            self.neighbor_scores[start:stop] = scores
+
+        self.build_seconds = time.perf_counter() - started
+        return self
+
+    def _search(self, queries, k, exclude_rows=None):
+        """Búsqueda top-K con el backend ANN, o exacta si no hay ANN"""
+        if self.ann is not None:
+            return self.ann.search(queries, k, exclude_rows)
+        return self._top_k(queries, k, exclude_rows)
+
+    def _top_k(self, queries, k, exclude_rows=None, vectors=None, active=None):
+        """
+        Top-K exacto por bloque, ordenado de mayor a menor similitud.
+        Las filas inactivas (borradas) se excluyen; si no hay k candidatos
+        los huecos quedan con id -1.
+        """
+        if vectors is None:
+            vectors, active = self.vectors, self.active
+
+        sims = queries @ vectors.T
+        if exclude_rows is not None:
+            sims[np.arange(len(queries)), exclude_rows] = -np.inf
+        if active is not None:
+            sims[:, ~active] = -np.inf
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+
+        ids = np.take_along_axis(top, order, axis=1).astype(np.int32)
+        scores = np.take_along_axis(top_scores, order, axis=1)
+        ids[np.isneginf(scores)] = -1
+        return ids, scores
+
+    def update(self, rows, features, deleted_rows=()):
+        """
+        Actualización incremental: inserta/modifica filas y marca borradas.
+        Solo se recalculan las listas de vecinos afectadas:
+        - las filas modificadas
+        - las filas cuya lista contiene una fila modificada o borrada
+        - las filas donde una fila modificada entra en su top-K
+        Los arrays nuevos se construyen aparte y se publican al final
+        (las consultas concurrentes siguen usando los anteriores).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        deleted_rows = np.asarray(deleted_rows, dtype=np.int64)
+        old_n = len(self)
+        n_rows = max([old_n] + [int(rows.max()) + 1 if len(rows) else 0])
+        k = self.neighbor_ids.shape[1] if self.neighbor_ids is not None else 0
+        k = max(k, min(self.n_neighbors, n_rows - 1))
+
+        vectors = np.zeros((n_rows, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:old_n] = self.vectors
+        if len(rows):
+            vectors[rows] = self.normalize(features)
+
+        active = np.ones(n_rows, dtype=bool)
+        if self.active is not None:
+            active[:old_n] = self.active
+        active[rows] = True
+        active[deleted_rows] = False
+
+        neighbor_ids = np.full((n_rows, k), -1, dtype=np.int32)
+        neighbor_scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+        old_k = self.neighbor_ids.shape[1]
+        neighbor_ids[:old_n, :old_k] = self.neighbor_ids
+        neighbor_scores[:old_n, :old_k] = self.neighbor_scores
+
+        # Filas afectadas
+        changed = np.union1d(rows, deleted_rows)
+        affected = set(rows.tolist())
+        affected.update(np.flatnonzero(np.isin(neighbor_ids, changed).any(axis=1)).tolist())
+        if len(rows) and k > 0:
+            worst = neighbor_scores[:, -1]
+            for start in range(0, len(rows), self.block_size):
+                block = vectors[rows[start:start + self.block_size]]
+                entering = (vectors @ block.T).max(axis=1) > worst
+                affected.update(np.flatnonzero(entering).tolist())
+
+        affected = np.array(sorted(affected), dtype=np.int64)
+        affected = affected[active[affected]] if len(affected) else affected
+        for start in range(0, len(affected), self.block_size):
+            block_rows = affected[start:start + self.block_size]
+            ids, scores = self._top_k(vectors[block_rows], k, block_rows, vectors, active)
+            neighbor_ids[block_rows] = ids
+            neighbor_scores[block_rows] = scores
+        neighbor_ids[deleted_rows] = -1
+        neighbor_scores[deleted_rows] = -np.inf
+
+        ann = None
+        if self.ann is not None:
+            ann = copy.copy(self.ann).reindex(vectors, active)
+
+        # Publicar: primero vectores y máscara, después las tablas
+        all_active = bool(active.all())
+        self.vectors = vectors
+        self.active = None if all_active else active
+        self.neighbor_ids = neighbor_ids
+        self.neighbor_scores = neighbor_scores
+        self.ann = ann
+        return affected
+
+    def similarities(self, row):
+        """Similitud coseno de una fila contra todo el catálogo (bajo demanda)"""
+        return self.vectors @ self.vectors[row]
+
+    def neighbors(self, row, k):
+        """Devuelve (ids, scores) de los k vecinos más cercanos de una fila"""
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        if k <= self.neighbor_ids.shape[1]:
+            return self.neighbor_ids[row, :k], self.neighbor_scores[row, :k]
+
+        # Más vecinos que los precalculados: búsqueda bajo demanda
+        ids, scores = self._search(self.vectors[row:row + 1], k, np.array([row]))
+        return ids[0], scores[0]
+
+    def neighbors_batch(self, rows, k):
+        """(ids, scores) de k vecinos para varias filas a la vez: matrices (len(rows), k)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        k = min(k, len(self) - 1)
+        if k <= 0 or len(rows) == 0:
+            return (np.empty((len(rows), 0), dtype=np.int32),
+                    np.empty((len(rows), 0), dtype=np.float32))
+
+        if k <= self.neighbor_ids.shape[1]:
+            return self.neighbor_ids[rows, :k], self.neighbor_scores[rows, :k]
+
+        # Un solo producto matricial para todas las semillas
+        return self._search(self.vectors[rows], k, rows)
+
+    def search_vector(self, vector, k, exclude_rows=()):
+        """Vecinos exactos de un vector arbitrario (p. ej. el centroide de varias canciones)"""
+        query = self.normalize(np.asarray(vector)[None, :])[0]
+        sims = self.vectors @ query
+        sims[np.asarray(exclude_rows, dtype=np.int64)] = -np.inf
+        if self.active is not None:
+            sims[~self.active] = -np.inf
+
+        k = min(k, len(self) - len(exclude_rows))
+        if k <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        top = top[~np.isneginf(sims[top])]
+        return top.astype(np.int32), sims[top]
+
+    def recall_report(self, k=10, sample_size=1000, seed=0):
+        """
+        Compara la tabla de vecinos contra el coseno exacto en una muestra de filas.
+        Devuelve recall@k y latencias por consulta (ANN vs exacto).
+        """
+        n_rows = len(self)
+        k = min(k, self.neighbor_ids.shape[1])
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(n_rows, min(sample_size, n_rows), replace=False)
+        queries = self.vectors[rows]
+
+        started = time.perf_counter()
+        approx_ids, _ = self._search(queries, k, rows)
+        approx_ms = (time.perf_counter() - started) * 1000 / len(rows)
+
+        started = time.perf_counter()
+        exact_ids, _ = self._top_k(queries, k, rows)
+        exact_ms = (time.perf_counter() - started) * 1000 / len(rows)
+
+        return {
+            'backend': self.active_backend,
+            'ann_options': dict(self.ann_options),
+            f'recall@{k}': recall_at_k(approx_ids, exact_ids),
+            'query_ms': approx_ms,
+            'exact_query_ms': exact_ms,
+            'build_seconds': self.build_seconds,
+        }
+
+    def to_arrays(self):
+        """Estado del índice como arrays NumPy (para snapshots en disco)"""
+        arrays = {
+            'vectors': self.vectors,
+            'neighbor_ids': self.neighbor_ids,
+            'neighbor_scores': self.neighbor_scores,
+        }
+        if self.active is not None:
+            # Filas borradas por update: sin la máscara volverían a salir
+            arrays['active'] = self.active
+        if self.ann is not None:
+            for name, values in self.ann.to_arrays().items():
+                arrays[f'ann_{name}'] = values
+        return arrays
+
+    def from_arrays(self, arrays, active_backend):
+        """Restaura el índice (los arrays pueden ser np.memmap de solo lectura)"""
+        self.vectors = arrays['vectors']
+        self.neighbor_ids = arrays['neighbor_ids']
+        self.neighbor_scores = arrays['neighbor_scores']
+        self.active = arrays.get('active')
+        self.active_backend = active_backend
+        self.ann = None
+        if active_backend != 'exact':
+            ann_arrays = {
+                name[len('ann_'):]: values
+                for name, values in arrays.items() if name.startswith('ann_')
+            }
+            self.ann = ANN_BACKENDS[active_backend](**self.ann_options).from_arrays(
+                self.vectors, ann_arrays, active=self.active
+            )
+        return self
+
+    @property
+    def nbytes(self):
+        """Memoria usada por el índice en bytes"""
+        if self.vectors is None:
+            return 0
+        return self.vectors.nbytes + self.neighbor_ids.nbytes + self.neighbor_scores.nbytes
@@ -0,0 +1,57 @@
+"""
+Métricas del pipeline de eventos
+Lag de la cola (tiempo desde add_event hasta procesado) y tamaño de micro-lotes
+"""
+
+import threading
+
+
+class PipelineMetrics:
+    """Contadores y lag de la cola de procesamiento, seguros entre threads"""
+
+    def __init__(self, ewma_alpha=0.1):
+        self.ewma_alpha = ewma_alpha
+        self.lock = threading.Lock()
+
+        self.events_processed = 0
+        self.batches_processed = 0
+        self.last_lag_ms = 0.0
+        self.avg_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.avg_batch_ms = 0.0
+
+    def record_batch(self, lags_ms, batch_ms):
+        """Registra un micro-lote procesado con el lag de cada evento"""
+        if not lags_ms:
+            return
+
+        with self.lock:
+            self.events_processed += len(lags_ms)
+            self.batches_processed += 1
+            self.last_lag_ms = max(lags_ms)
+            self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+
+            mean_lag = sum(lags_ms) / len(lags_ms)
+            if self.batches_processed == 1:
+                self.avg_lag_ms = mean_lag
+                self.avg_batch_ms = batch_ms
+            else:
+                a = self.ewma_alpha
+                self.avg_lag_ms = a * mean_lag + (1 - a) * self.avg_lag_ms
+                self.avg_batch_ms = a * batch_ms + (1 - a) * self.avg_batch_ms
+
+    def snapshot(self):
+        """Copia de las métricas actuales"""
+        with self.lock:
+            avg_batch_size = (
+                self.events_processed / self.batches_processed if self.batches_processed else 0.0
+            )
+            return {
+                'events_processed': self.events_processed,
+                'batches_processed': self.batches_processed,
+                'avg_batch_size': avg_batch_size,
+                'last_lag_ms': self.last_lag_ms,
+                'avg_lag_ms': self.avg_lag_ms,
+                'max_lag_ms': self.max_lag_ms,
+                'avg_batch_ms': self.avg_batch_ms,
+            }
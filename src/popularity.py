@@ -0,0 +1,127 @@
+"""
+Popularidad de canciones en memoria
+Contador por track_id, array alineado con las filas del catálogo (scoring
+vectorizado), versión por fila para validar la caché de resultados y deltas
+pendientes de sincronizar con el almacenamiento
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from mongo_resilience import failed_keys
+
+
+class PopularityState:
+    """
+    Estado de popularidad del procesador.
+
+    - by_track: popularidad por track_id (también de canciones fuera del catálogo)
+    - array / versions: popularidad y versión por fila del catálogo; los
+      lectores no toman el lock: apply escribe los valores antes de subir la
+      versión de cada fila, así que la caché descarta lo calculado con
+      valores anteriores
+    - deltas: cambios aún no sincronizados (solo tracks modificados)
+    """
+
+    def __init__(self):
+        # Lock de escritura (también protege los cambios de filas del catálogo)
+        self.lock = threading.Lock()
+        self.by_track = defaultdict(int)
+        self.array = np.zeros(0, dtype=np.int64)
+        self.versions = np.zeros(0, dtype=np.int64)
+        self.seq = 0
+        # Canciones con popularidad > 0
+        self.positive_count = 0
+        self.deltas = defaultdict(int)
+        self.last_sync = time.monotonic()
+
+    def reset_rows(self, n_rows):
+        """Arrays vacíos para un catálogo recién cargado de n_rows filas"""
+        self.array = np.zeros(n_rows, dtype=np.int64)
+        self.versions = np.zeros(n_rows, dtype=np.int64)
+
+    def grow(self, track_ids):
+        """Filas nuevas del catálogo (con self.lock): popularidad ya conocida, si la hay"""
+        n_rows = len(track_ids)
+        if n_rows <= len(self.array):
+            return
+        array = np.zeros(n_rows, dtype=np.int64)
+        array[:len(self.array)] = self.array
+        for row in range(len(self.array), n_rows):
+            array[row] = self.by_track.get(track_ids[row], 0)
+        versions = np.zeros(n_rows, dtype=np.int64)
+        versions[:len(self.versions)] = self.versions
+        self.array = array
+        self.versions = versions
+
+    def share(self, array, versions):
+        """Usa arrays externos (memoria compartida del procesador por shards)"""
+        array[:] = self.array[:len(array)]
+        versions[:] = 0
+        self.array = array
+        self.versions = versions
+
+    def unshare(self):
+        """Copia propia de los arrays antes de liberar la memoria compartida"""
+        self.array = np.array(self.array)
+        self.versions = np.array(self.versions)
+
+    def load_docs(self, docs, row_fn):
+        """Carga documentos {track_id, popularity}; row_fn(track_id) da la fila o None"""
+        for doc in docs:
+            self.by_track[doc['track_id']] = doc['popularity']
+            row = row_fn(doc['track_id'])
+            if row is not None:
+                self.array[row] = doc['popularity']
+        self.positive_count = sum(1 for p in self.by_track.values() if p > 0)
+
+    def apply(self, weights, rows, row_weights):
+        """
+        Suma los pesos de un micro-lote: weights por track_id y, para las
+        canciones del catálogo, sus filas y pesos. Solo se tocan las filas del
+        lote (sin copiar el catálogo)
+        """
+        with self.lock:
+            for track_id, weight in weights.items():
+                before = self.by_track[track_id]
+                self.by_track[track_id] = before + weight
+                self.positive_count += (before + weight > 0) - (before > 0)
+                self.deltas[track_id] += weight
+            np.add.at(self.array, rows, row_weights)
+            self.seq += 1
+            self.versions[rows] = self.seq
+
+    def unchanged_since(self, rows, seq):
+        """True si ninguna de las filas cambió después de la versión seq"""
+        return not len(rows) or self.versions[rows].max() <= seq
+
+    def take_deltas(self):
+        """Vacía los deltas pendientes y devuelve (track_ids con delta ≠ 0, deltas)"""
+        with self.lock:
+            deltas = self.deltas
+            self.deltas = defaultdict(int)
+            self.last_sync = time.monotonic()
+
+        track_ids = [track_id for track_id, delta in deltas.items() if delta != 0]
+        return track_ids, deltas
+
+    def restore_deltas(self, error, track_ids, deltas):
+        """
+        Devuelve a pendientes los deltas de take_deltas que no llegaron al
+        almacenamiento (solo las operaciones que fallaron)
+        """
+        failed = failed_keys(track_ids, error)
+        with self.lock:
+            for track_id in failed:
+                self.deltas[track_id] += deltas[track_id]
+        print(f"Error sincronizando popularidad: {len(failed)} tracks pendientes ({error})")
+
+    def sync_due(self, interval):
+        """True si pasaron interval segundos desde la última sincronización"""
+        return time.monotonic() - self.last_sync >= interval
+
+    def mark_synced(self):
+        self.last_sync = time.monotonic()
@@ -0,0 +1,180 @@
+"""
+Scoring de recomendaciones
+Candidatos del índice de vecinos (y del modelo colaborativo), boost de
+popularidad y de géneros, top N vectorizado y caché de resultados validada
+con versiones
+"""
+
+import numpy as np
+
+
+class Recommender:
+    """
+    Recomendaciones a partir de las filas del catálogo.
+
+    Lee sin locks el catálogo, el índice de vecinos y la popularidad en
+    memoria (PopularityState); un resultado en caché vale mientras no cambien
+    el catálogo, las preferencias del usuario, el modelo colaborativo ni la
+    popularidad de sus filas candidatas.
+    """
+
+    def __init__(self, catalog, neighbor_index, popularity, cache, collaborative=None,
+                 collaborative_weight=0.0):
+        self.catalog = catalog
+        self.neighbor_index = neighbor_index
+        self.popularity = popularity
+        self.cache = cache
+        self.collaborative = collaborative
+        self.collaborative_weight = collaborative_weight
+        self.catalog_version = 0
+
+    # --- Caché de resultados ---
+
+    def version(self, preference_version=0):
+        """Versión de los datos de los que depende una recomendación (salvo la popularidad)"""
+        return (
+            self.catalog_version,
+            preference_version,
+            self.collaborative.version if self.collaborative is not None else 0
+        )
+
+    def cached(self, key, version):
+        """Copia del resultado en caché, o None si no hay o ya no es válido"""
+        def popularity_unchanged(entry):
+            rows, popularity_seq, _ = entry
+            return self.popularity.unchanged_since(rows, popularity_seq)
+
+        entry = self.cache.get(key, version, popularity_unchanged)
+        if entry is None:
+            return None
+        return [dict(rec) for rec in entry[2]]
+
+    def store(self, key, version, track_idx, popularity_seq, recommendations):
+        """Guarda el resultado con las filas candidatas cuya popularidad lo invalida"""
+        top_n = key[2]
+        candidates, _ = self.neighbor_index.neighbors(track_idx, top_n*2 - 1)
+        if self.collaborative is not None:
+            candidates = np.concatenate([candidates, self.collaborative.neighbors(track_idx, top_n)[0]])
+        rows = np.asarray(candidates[candidates >= 0], dtype=np.int64)
+        self.cache.put(
+            key, (rows, popularity_seq, recommendations), version, size=len(recommendations)
+        )
+        return [dict(rec) for rec in recommendations]
+
+    def invalidate(self):
+        """El catálogo o el índice cambiaron: ninguna recomendación guardada sirve"""
+        self.catalog_version += 1
+        self.cache.clear()
+
+    # --- Scoring ---
+
+    def recommend(self, track_idx, top_n, liked_genres=()):
+        """Scoring vectorizado de candidatos para una fila del catálogo"""
+        if track_idx >= len(self.neighbor_index):
+            # Canción recién añadida cuyo índice de vecinos aún se está actualizando
+            return []
+
+        # Similitudes base desde la tabla de vecinos
+        candidates, scores = self.neighbor_index.neighbors(track_idx, top_n*2 - 1)
+        candidates, scores = self.blend_collaborative(track_idx, candidates, scores, top_n)
+        return self.score_candidates(candidates, scores, top_n, liked_genres)
+
+    def recommend_seeds(self, seed_rows, top_n, liked_genres=()):
+        """Recomendaciones de cada semilla (una lista por fila) en una sola pasada"""
+        all_candidates, all_scores = self.neighbor_index.neighbors_batch(seed_rows, top_n*2 - 1)
+        return [
+            self.score_candidates(
+                *self.blend_collaborative(row, candidates, scores, top_n), top_n, liked_genres
+            )
+            for row, candidates, scores in zip(seed_rows, all_candidates, all_scores)
+        ]
+
+    def recommend_blend(self, seed_rows, top_n, liked_genres=()):
+        """Recomendaciones desde el centroide de las semillas (playlist)"""
+        centroid = self.neighbor_index.vectors[seed_rows].mean(axis=0)
+        candidates, scores = self.neighbor_index.search_vector(
+            centroid, top_n*2, exclude_rows=seed_rows
+        )
+        # Co-ocurrencia media con las semillas que tienen historial
+        signal_rows = []
+        if self.collaborative is not None:
+            signal_rows = [row for row in seed_rows if self.collaborative.has_signal(row)]
+        if signal_rows:
+            collaborative_scores = np.mean(
+                [self.collaborative.similarities(row, candidates) for row in signal_rows], axis=0
+            )
+            alpha = self.collaborative_weight
+            scores = (1 - alpha) * scores + alpha * collaborative_scores
+        return self.score_candidates(candidates, scores, top_n, liked_genres)
+
+    def blend_collaborative(self, track_idx, candidates, scores, top_n):
+        """
+        Score híbrido: (1 - collaborative_weight)·coseno de audio +
+        collaborative_weight·coseno de co-ocurrencia. Agrega como candidatos
+        las canciones que más co-ocurren con la semilla. Si la semilla no
+        tiene co-ocurrencias, el score es solo por contenido
+        """
+        model = self.collaborative
+        if model is None or not model.has_signal(track_idx):
+            return candidates, scores
+
+        collaborative_rows, _ = model.neighbors(track_idx, top_n)
+        extra = collaborative_rows[
+            ~np.isin(collaborative_rows, candidates) & (collaborative_rows != track_idx)
+            & (collaborative_rows < len(self.neighbor_index))
+        ]
+        if len(extra):
+            vectors = self.neighbor_index.vectors
+            candidates = np.concatenate([candidates, extra])
+            scores = np.concatenate([scores, vectors[extra] @ vectors[track_idx]])
+
+        alpha = self.collaborative_weight
+        return candidates, (1 - alpha) * scores + alpha * model.similarities(track_idx, candidates)
+
+    def score_candidates(self, candidates, scores, top_n, liked_genres=()):
+        """Aplica popularidad y géneros a (candidatos, similitudes) y devuelve el top N"""
+        keep = candidates >= 0
+        if self.catalog.active is not None:
+            keep &= self.catalog.active[np.maximum(candidates, 0)]
+        candidates = candidates[keep]
+        scores = scores[keep]
+
+        # Aplicar boost de popularidad (snapshot actual, sin lock)
+        popularity = self.popularity.array[candidates]
+        scores = scores + popularity * 0.01
+
+        # Boost por géneros que le gustan al usuario
+        if liked_genres:
+            liked_codes = self.catalog.genre_codes_for(liked_genres)
+            scores = np.where(np.isin(self.catalog.genre_codes[candidates], liked_codes), scores * 1.2, scores)
+
+        # Top N final
+        if len(candidates) > top_n:
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        rows = candidates[top]
+
+        recommendations = self.catalog.records(rows)
+        for rec, score, track_popularity in zip(recommendations, scores[top].tolist(), popularity[top].tolist()):
+            rec['score'] = score
+            rec['popularity'] = track_popularity
+
+        return recommendations
+
+    def trending_records(self, rows, scores, top_n):
+        """Registros de las top_n filas activas con su puntuación y popularidad"""
+        active = self.catalog.active
+        if active is not None and len(rows):
+            keep = active[rows]
+            rows, scores = rows[keep], scores[keep]
+        rows, scores = rows[:top_n], scores[:top_n]
+
+        trending = self.catalog.records(rows)
+        popularity = self.popularity.array[rows].tolist()
+        for track, score, track_popularity in zip(trending, scores.tolist(), popularity):
+            track['trend_score'] = score
+            track['popularity'] = track_popularity
+
+        return trending
@@ -0,0 +1,97 @@
+"""
+Caché de resultados con TTL, versión y expulsión LRU
+Cada entrada guarda la versión de los datos con que se calculó; si la
+versión cambia o pasa el TTL, la entrada no se devuelve
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Resultados de consultas repetidas (p. ej. get_recommendations en cada
+    rerun de Streamlit).
+
+    - maxsize: número máximo de entradas
+    - max_items: tope de elementos sumando todas las entradas (memoria acotada)
+    - ttl: segundos que vive una entrada aunque su versión siga vigente
+    """
+
+    def __init__(self, maxsize=5000, max_items=100000, ttl=30.0):
+        self.maxsize = maxsize
+        self.max_items = max_items
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.items = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, version=None, is_valid=None):
+        """
+        Valor guardado o None si no existe, caducó o su versión es otra.
+        is_valid(value) permite validaciones más finas que la versión.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, entry_version, value, size = entry
+            if (expires_at <= now or entry_version != version
+                    or (is_valid is not None and not is_valid(value))):
+                if expires_at <= now:
+                    self.expired += 1
+                else:
+                    self.invalidated += 1
+                self.misses += 1
+                del self.data[key]
+                self.items -= size
+                return None
+
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version=None, size=1):
+        with self.lock:
+            previous = self.data.pop(key, None)
+            if previous is not None:
+                self.items -= previous[3]
+
+            self.data[key] = (time.monotonic() + self.ttl, version, value, size)
+            self.items += size
+            while self.data and (len(self.data) > self.maxsize or self.items > self.max_items):
+                _, (_, _, _, evicted_size) = self.data.popitem(last=False)
+                self.items -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.items = 0
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.data),
+                'items': self.items,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expired': self.expired,
+                'invalidated': self.invalidated,
+                'evictions': self.evictions,
+            }
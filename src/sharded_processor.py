@@ -0,0 +1,462 @@
+"""
+Procesador Kappa por shards (multiproceso)
+Los eventos se reparten por hash de track_id entre N procesos; cada shard es
+dueño de la popularidad y el trending de sus canciones, y el proceso principal
+responde combinando los shards
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+from pymongo.errors import BulkWriteError
+
+from kappa_processor_mongodb import KappaProcessorMongoDB
+from trending import TrendingEngine
+
+
+def shard_of(track_id, n_shards):
+    """Shard de una canción: crc32 (estable entre procesos, a diferencia de hash())"""
+    return zlib.crc32(str(track_id).encode('utf-8')) % n_shards
+
+
+def _attach(name, length):
+    """Array int64 sobre un bloque de memoria compartida existente"""
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray((length,), dtype=np.int64, buffer=block.buf)
+
+
+def _shard_main(shard, shared, n_rows, n_shards, owned_rows, genre_codes, windows, capacity,
+                inbox, outbox):
+    """
+    Bucle de un shard. Mensajes del inbox:
+
+    - ('events', filas, pesos, timestamps): popularidad + trending
+    - ('trending_events', filas, pesos, timestamps, ventanas): solo trending
+      (calentamiento de las ventanas con decaimiento al arrancar)
+    - ('top', request_id, ventana, k, género, ahora): responde en outbox
+    - None: termina
+    """
+    popularity_block, popularity = _attach(shared['popularity'], n_rows)
+    versions_block, versions = _attach(shared['versions'], n_rows)
+    counters_block, processed = _attach(shared['processed'], n_shards)
+    blocks = [popularity_block, versions_block, counters_block]
+
+    # Solo las filas propias tienen género: las listas por género son del shard
+    trending = TrendingEngine(windows, capacity)
+    trending.set_genres(genre_codes)
+    if 'all' in trending.windows:
+        owned = owned_rows[popularity[owned_rows] != 0]
+        trending.seed('all', owned, popularity[owned])
+
+    try:
+        while True:
+            message = inbox.get()
+            if message is None:
+                return
+            kind = message[0]
+            if kind == 'events':
+                _, rows, weights, timestamps = message
+                np.add.at(popularity, rows, weights)
+                # Versión después de la popularidad: una lectura anterior al
+                # cambio tiene una versión menor (ver get_recommendations)
+                versions[rows] = time.monotonic_ns()
+                trending.add(rows, weights, timestamps)
+                processed[shard] += len(rows)
+            elif kind == 'trending_events':
+                _, rows, weights, timestamps, trending_windows = message
+                trending.add(rows, weights, timestamps, windows=trending_windows)
+            elif kind == 'top':
+                _, request_id, window, k, genre_code, now = message
+                rows, scores = trending.top(window, k, genre_code, now)
+                outbox.put((request_id, shard, rows, scores))
+    finally:
+        del popularity, versions, processed
+        for block in blocks:
+            block.close()
+
+
+class ShardedKappaProcessor:
+    """
+    Procesador con la popularidad y el trending repartidos en n_shards procesos.
+
+    - el modelo en memoria (catálogo, índice de vecinos, scoring, perfiles,
+      escritura de interacciones) es el de KappaProcessorMongoDB, en el
+      proceso principal
+    - un thread enrutador toma micro-lotes de la cola, actualiza los perfiles
+      y envía a cada shard las filas de sus canciones (arrays numpy: un
+      mensaje por shard y micro-lote)
+    - la popularidad vive en memoria compartida: cada shard escribe solo sus
+      filas y el scoring la lee sin copias ni IPC; get_trending_tracks pide el
+      top a cada shard y los combina
+    - la sincronización con el almacenamiento compara la popularidad con la
+      última sincronizada (sin deltas que pasar entre procesos)
+
+    Solo cuentan las interacciones con canciones del catálogo cargado, y no
+    hay watcher del catálogo: las filas compartidas tienen tamaño fijo. Tampoco
+    usa el log local de eventos (event_log): los eventos van por la cola en
+    memoria y los pendientes se pierden si el proceso muere.
+    """
+
+    def __init__(self, mongodb_uri=None, database_name='spotify_kappa', n_shards=4,
+                 route_batch_size=2000, event_queue_size=10000, shard_queue_size=64,
+                 popularity_sync_interval=5.0, **model_options):
+        if model_options.get('event_log') is not None:
+            raise ValueError("El procesador por shards no usa el log de eventos (event_log)")
+        self.model = KappaProcessorMongoDB(
+            mongodb_uri, database_name, event_queue_size=event_queue_size,
+            popularity_sync_interval=popularity_sync_interval, **model_options
+        )
+        self.n_shards = n_shards
+        self.route_batch_size = route_batch_size
+        self.shard_queue_size = shard_queue_size
+        self.popularity_sync_interval = popularity_sync_interval
+
+        self.event_queue = queue.Queue(maxsize=event_queue_size)
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = []
+        self.inboxes = []
+        self.outbox = None
+        self.blocks = {}
+        self.shard_of_row = np.zeros(0, dtype=np.int64)
+        self.synced_popularity = np.zeros(0, dtype=np.int64)
+        self.processed = np.zeros(n_shards, dtype=np.int64)
+        self.routed = 0
+
+        self.query_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.request_id = 0
+        self.is_running = False
+        self.router_thread = None
+        self.sync_thread = None
+        self.stop_event = threading.Event()
+
+    # --- Carga y shards ---
+
+    def load_data_from_mongodb(self):
+        """Carga el modelo y arranca los shards con la popularidad guardada"""
+        if not self.model.load_data_from_mongodb():
+            return False
+        self._start_shards()
+        print(f"Popularidad y trending repartidos en {self.n_shards} shards")
+        return True
+
+    def _start_shards(self):
+        model = self.model
+        n_rows = len(model.catalog)
+        self.shard_of_row = np.array(
+            [shard_of(track_id, self.n_shards) for track_id in model.catalog.track_ids[:n_rows]],
+            dtype=np.int64
+        )
+
+        # Popularidad y versiones por fila compartidas; contadores de eventos por shard
+        for name, length in (('popularity', n_rows), ('versions', n_rows), ('processed', self.n_shards)):
+            block = shared_memory.SharedMemory(create=True, size=max(length, 1) * 8)
+            self.blocks[name] = block
+        popularity = np.ndarray((n_rows,), dtype=np.int64, buffer=self.blocks['popularity'].buf)
+        versions = np.ndarray((n_rows,), dtype=np.int64, buffer=self.blocks['versions'].buf)
+        model.popularity.share(popularity, versions)
+        self.processed = np.ndarray((self.n_shards,), dtype=np.int64, buffer=self.blocks['processed'].buf)
+        self.processed[:] = 0
+        self.synced_popularity = popularity.copy()
+
+        shared = {name: block.name for name, block in self.blocks.items()}
+        genre_codes = np.asarray(model.catalog.genre_codes[:n_rows], dtype=np.int32)
+        self.outbox = self.context.Queue()
+        for shard in range(self.n_shards):
+            owned = np.flatnonzero(self.shard_of_row == shard)
+            shard_genres = np.full(n_rows, -1, dtype=np.int32)
+            shard_genres[owned] = genre_codes[owned]
+            inbox = self.context.Queue(maxsize=self.shard_queue_size)
+            process = self.context.Process(
+                target=_shard_main,
+                args=(shard, shared, n_rows, self.n_shards, owned, shard_genres,
+                      model.trending.windows, model.trending.capacity, inbox, self.outbox),
+                name=f'kappa-shard-{shard}', daemon=True
+            )
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+
+        self._warm_up_trending()
+
+    def _warm_up_trending(self):
+        """Eventos recientes para las ventanas con decaimiento de cada shard"""
+        since = self.model.trending.warmup_since()
+        if since is None:
+            return
+        windows = self.model.trending.decaying_windows()
+        try:
+            events = self.model.storage.recent_interactions(since)
+            rows, weights, timestamps = self.model.event_arrays(events)
+        except Exception as e:
+            print(f"Advertencia: no se pudo cargar el trending reciente: {e}")
+            return
+        for shard, (shard_rows, shard_weights, shard_timestamps) in self._partition(rows, weights, timestamps):
+            self.inboxes[shard].put(('trending_events', shard_rows, shard_weights, shard_timestamps, windows))
+
+    def _partition(self, rows, weights, timestamps):
+        """(shard, (filas, pesos, timestamps)) por cada shard con eventos"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return []
+        weights = np.asarray(weights, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        shards = self.shard_of_row[rows]
+        order = np.argsort(shards, kind='stable')
+        bounds = np.searchsorted(shards[order], np.arange(self.n_shards + 1))
+        parts = []
+        for shard in range(self.n_shards):
+            part = order[bounds[shard]:bounds[shard + 1]]
+            if len(part):
+                parts.append((shard, (rows[part], weights[part], timestamps[part])))
+        return parts
+
+    # --- Procesamiento ---
+
+    def start_processing(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self.stop_event.clear()
+        self.router_thread = threading.Thread(target=self._route_loop, name='shard-router', daemon=True)
+        self.sync_thread = threading.Thread(target=self._sync_loop, name='shard-sync', daemon=True)
+        self.router_thread.start()
+        self.sync_thread.start()
+        print(f"Procesador de eventos iniciado ({self.n_shards} shards)")
+
+    def stop_processing(self):
+        """Enruta lo pendiente, espera a que los shards lo apliquen y sincroniza"""
+        if self.is_running:
+            self.is_running = False
+            self.event_queue.put(None)
+            self.router_thread.join()
+            self.wait_until_processed()
+            self.stop_event.set()
+            self.sync_thread.join(timeout=5)
+            stopped = True
+        else:
+            stopped = False
+        self._sync_popularity()
+        self.model.sync_user_profiles()
+        if stopped:
+            print("Procesador detenido")
+
+    def add_event(self, user_id, track_id, interaction_type='play'):
+        event = {
+            'user_id': user_id,
+            'track_id': track_id,
+            'interaction_type': interaction_type,
+            'timestamp': datetime.now()
+        }
+        if self.is_running:
+            self.event_queue.put((time.monotonic(), event))
+        else:
+            self._route_batch([event])
+        self.model.buffer_event(event)
+        return event
+
+    def _route_loop(self):
+        while True:
+            item = self.event_queue.get()
+            batch = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < self.route_batch_size:
+                try:
+                    item = self.event_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                started = time.monotonic()
+                self._route_batch([event for _, event in batch])
+                finished = time.monotonic()
+                self.model.pipeline_metrics.record_batch(
+                    [(finished - enqueued_at) * 1000 for enqueued_at, _ in batch],
+                    (finished - started) * 1000
+                )
+            if stop:
+                return
+
+    def _route_batch(self, events):
+        """Perfiles en este proceso; popularidad y trending a los shards"""
+        model = self.model
+        rows, weights, timestamps = model.event_arrays(events)
+        model.apply_user_events(events)
+        for shard, message in self._partition(rows, weights, timestamps):
+            # Bloquea si el shard va atrasado (backpressure hasta add_event)
+            self.inboxes[shard].put(('events', *message))
+        self.routed += len(rows)
+
+    def wait_until_processed(self, timeout=60.0):
+        """Espera a que los shards apliquen todo lo enrutado; True si lo hicieron"""
+        deadline = time.monotonic() + timeout
+        while int(self.processed.sum()) < self.routed:
+            if time.monotonic() > deadline or not all(p.is_alive() for p in self.processes):
+                return False
+            time.sleep(0.005)
+        return True
+
+    # --- Sincronización con el almacenamiento ---
+
+    def _sync_loop(self):
+        while not self.stop_event.wait(self.popularity_sync_interval):
+            self._sync_popularity()
+            self.model.sync_user_profiles()
+
+    def _sync_popularity(self):
+        """Escribe la diferencia entre la popularidad actual y la ya sincronizada"""
+        storage = self.model.storage
+        if storage is None or not len(self.synced_popularity):
+            return
+        with self.sync_lock:
+            current = self.model.popularity.array.copy()
+            changed = np.flatnonzero(current != self.synced_popularity)
+            if not len(changed):
+                return
+            track_ids = self.model.catalog.track_ids[changed].tolist()
+            deltas = dict(zip(track_ids, (current[changed] - self.synced_popularity[changed]).tolist()))
+            try:
+                storage.apply_popularity_deltas(track_ids, deltas)
+            except Exception as e:
+                if not isinstance(e, BulkWriteError):
+                    print(f"Error sincronizando popularidad: {e}")
+                    return
+                # Las que fallaron se vuelven a intentar en la próxima pasada
+                failed = [err['index'] for err in e.details.get('writeErrors', [])]
+                print(f"Error sincronizando popularidad: {len(failed)} tracks pendientes")
+                changed = np.delete(changed, failed)
+            self.synced_popularity[changed] = current[changed]
+
+    # --- Consultas ---
+
+    def get_recommendations(self, track_id, user_id=None, top_n=10):
+        """Recomendaciones con la popularidad compartida (sin IPC)"""
+        model = self.model
+        track_idx = model.catalog.row(track_id)
+        if track_idx is None or top_n <= 0:
+            return []
+
+        key = (track_id, user_id, top_n)
+        version = model.recommendation_version(user_id)
+        cached = model.recommender.cached(key, version)
+        if cached is not None:
+            return cached
+        # Las versiones por fila son monotonic_ns de cada shard tras escribir:
+        # cualquier cambio posterior a este instante invalida el resultado
+        popularity_seq = time.monotonic_ns()
+
+        liked_genres = set()
+        degraded = False
+        if user_id:
+            preferences, degraded = model.user_preferences(user_id)
+            if preferences:
+                liked_genres = preferences['liked_genres']
+
+        recommendations = model.recommender.recommend(track_idx, top_n, liked_genres)
+        if degraded:
+            return recommendations
+        return model.recommender.store(key, version, track_idx, popularity_seq, recommendations)
+
+    def get_recommendations_batch(self, track_ids=None, user_id=None, top_n=10, blend=False):
+        return self.model.get_recommendations_batch(track_ids, user_id, top_n, blend)
+
+    def get_track_popularity(self, track_id):
+        """Popularidad actual de una canción (memoria compartida de su shard)"""
+        row = self.model.catalog.row(track_id)
+        return None if row is None else int(self.model.popularity.array[row])
+
+    def get_trending_tracks(self, top_n=10, window='day', genre=None):
+        """Top de cada shard combinado por puntuación"""
+        model = self.model
+        if window not in model.trending.windows:
+            raise ValueError(f"Ventana desconocida: {window}")
+        genre_code = None
+        if genre is not None:
+            genre_code = model.catalog.genre_lookup.get(genre)
+            if genre_code is None:
+                return []
+
+        rows, scores = self._query_top(window, top_n + 10, genre_code)
+        order = np.argsort(-scores, kind='stable')
+        return model.recommender.trending_records(rows[order], scores[order], top_n)
+
+    def _query_top(self, window, k, genre_code, timeout=5.0):
+        now = time.time()
+        with self.query_lock:
+            self.request_id += 1
+            request_id = self.request_id
+            for inbox in self.inboxes:
+                inbox.put(('top', request_id, window, k, genre_code, now))
+            replies = {}
+            deadline = time.monotonic() + timeout
+            while len(replies) < len(self.inboxes):
+                try:
+                    reply_id, shard, rows, scores = self.outbox.get(
+                        timeout=max(deadline - time.monotonic(), 0.001)
+                    )
+                except queue.Empty:
+                    print(f"Advertencia: {len(self.inboxes) - len(replies)} shards sin responder")
+                    break
+                if reply_id == request_id:
+                    replies[shard] = (rows, scores)
+        if not replies:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return (np.concatenate([rows for rows, _ in replies.values()]),
+                np.concatenate([scores for _, scores in replies.values()]))
+
+    def get_user_profile(self, user_id):
+        return self.model.get_user_profile(user_id)
+
+    def get_stats(self):
+        stats = self.model.get_stats()
+        processed = int(self.processed.sum())
+        stats['events_in_queue'] = self.event_queue.qsize()
+        stats['shard_backlog'] = self.routed - processed
+        stats['trending_count'] = int(np.count_nonzero(self.model.popularity.array > 0))
+        stats['shards'] = self.n_shards
+        stats['events_per_shard'] = self.processed.tolist()
+        return stats
+
+    def get_pipeline_metrics(self):
+        metrics = self.model.pipeline_metrics.snapshot()
+        metrics['queue_depth'] = self.event_queue.qsize()
+        metrics['workers'] = sum(p.is_alive() for p in self.processes)
+        return metrics
+
+    @property
+    def tracks_df(self):
+        return self.model.tracks_df
+
+    def close(self):
+        """Detiene el enrutado y los shards, sincroniza y libera la memoria compartida"""
+        self.stop_processing()
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.inboxes = []
+
+        # El modelo deja de apuntar a la memoria compartida antes de liberarla
+        model = self.model
+        model.popularity.unshare()
+        self.processed = np.array(self.processed)
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+        model.close()
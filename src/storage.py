@@ -0,0 +1,325 @@
+"""
+Capa de almacenamiento del procesador
+Catálogo, interacciones, popularidad y perfiles detrás de una interfaz común:
+MongoStorage (MongoDB / Atlas) y LocalStorage (SQLite embebido, en memoria o
+en un archivo) para nodos sin red, benchmarks y pruebas offline
+"""
+
+import itertools
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import pandas as pd
+import pymongo
+from pymongo import ReadPreference, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError
+
+from catalog_loader import read_catalog
+from catalog_watcher import CatalogWatcher
+from derived_state import DEFAULT_DERIVED_STATE, read_derived_state
+from event_replay import read_daily_aggregates
+from interaction_store import InteractionStore
+from model_snapshot import catalog_fingerprint
+from mongo_resilience import CircuitBreaker, RetryPolicy
+from user_profiles import RECENT_SIZE, profile_update_operations
+
+
+PAIR_COUNT_COLUMNS = ['user_id', 'track_id', 'interaction_type', 'count']
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+# Timeout (s) de la lectura de un perfil en el camino de get_recommendations
+PROFILE_READ_TIMEOUT = 0.25
+
+
+def write_concern(w, wtimeout_ms=5000):
+    """WriteConcern a partir de w (0, 1, 'majority'...); wtimeout evita esperas sin límite"""
+    if isinstance(w, WriteConcern):
+        return w
+    return WriteConcern(w=w, wtimeout=wtimeout_ms if w not in (0, 1) else None)
+
+
+def popularity_update_operations(track_ids, deltas, log_offset=None):
+    """
+    $inc de popularidad por canción (un bulk_write desordenado). Con
+    log_offset solo se suma a canciones con un log_offset anterior (con el
+    índice único de track_id, una que ya lo tiene da clave duplicada)
+    """
+    now = datetime.now()
+    query = {}
+    fields = {'updated_at': now}
+    if log_offset is not None:
+        query['log_offset'] = {'$not': {'$gte': log_offset}}
+        fields['log_offset'] = log_offset
+    return [
+        UpdateOne(
+            {'track_id': track_id, **query},
+            {'$inc': {'popularity': deltas[track_id]}, '$set': fields},
+            upsert=True
+        )
+        for track_id in track_ids
+    ]
+
+
+def bulk_write_once(collection, operations, log_offset=None):
+    """
+    bulk_write desordenado; con log_offset, la clave duplicada de un upsert
+    es un documento que ya tenía ese offset aplicado y no cuenta como error
+    """
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        if log_offset is None:
+            raise
+        errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != 11000]
+        if errors or e.details.get('writeConcernErrors'):
+            raise BulkWriteError({**e.details, 'writeErrors': errors})
+
+
+class StorageBackend(ABC):
+    """
+    Interfaz de almacenamiento que usa KappaProcessorMongoDB.
+
+    Las escrituras por lotes (apply_popularity_deltas, apply_profile_updates)
+    lanzan una excepción si fallan; con pymongo.errors.BulkWriteError el
+    procesador reintenta solo las operaciones que fallaron y con cualquier
+    otra, el lote entero. Con log_offset (offset del log de eventos que
+    cubren los deltas) son idempotentes: cada documento guarda el último
+    offset aplicado y no vuelve a sumar uno igual o anterior.
+
+    Los métodos abstractos son obligatorios (un backend incompleto falla al
+    instanciarse); el resto tiene un comportamiento por defecto.
+    """
+
+    name = None
+
+    # --- Catálogo ---
+
+    @abstractmethod
+    def read_catalog(self, feature_columns, batch_size=5000):
+        """(DataFrame de canciones activas, estadísticas de carga)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def catalog_fingerprint(self, model_params):
+        """Hash del catálogo + parámetros del modelo (clave del snapshot)"""
+        raise NotImplementedError
+
+    def catalog_position(self):
+        """(posición, operationTime) de los cambios del catálogo antes de cargarlo"""
+        return None, None
+
+    def catalog_watcher(self, apply_fn, poll_interval=5.0, mode='auto', position=None,
+                        start_at_operation_time=None):
+        """Objeto con start()/stop() que llama a apply_fn(upserts, deleted_ids), o None"""
+        return None
+
+    # --- Interacciones ---
+
+    def ensure_interaction_indexes(self):
+        pass
+
+    @abstractmethod
+    def write_interactions(self, events):
+        """
+        Escribe un lote; devuelve cuántos eventos se insertaron. Un evento con
+        _id ya escrito no se duplica
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def recent_interactions(self, since):
+        """Eventos {track_id, interaction_type, timestamp} desde since"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_interactions(self):
+        """Número de interacciones guardadas, incluidas las archivadas"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_interaction_users(self):
+        """
+        user_id de las interacciones, incluidas las archivadas (para la
+        reconciliación de estadísticas; puede repetir usuarios)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_interaction_counts(self, batch_size=100000):
+        """
+        Lotes (DataFrames user_id, track_id, interaction_type, count) con el
+        número de interacciones por usuario, canción y tipo (modelo colaborativo)
+        """
+        raise NotImplementedError
+
+    # --- Estado derivado ---
+
+    def read_derived_state(self):
+        return dict(DEFAULT_DERIVED_STATE)
+
+    @abstractmethod
+    def load_popularity(self):
+        """Documentos {track_id, popularity}"""
+        raise NotImplementedError
+
+    def ensure_state_indexes(self):
+        """Índices que necesitan las escrituras con log_offset"""
+        pass
+
+    @abstractmethod
+    def apply_popularity_deltas(self, track_ids, deltas, log_offset=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_profile(self, user_id):
+        """Documento de user_profiles del usuario o None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def apply_profile_updates(self, user_ids, updates, recent_size=RECENT_SIZE, log_offset=None):
+        raise NotImplementedError
+
+    def get_stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class MongoStorage(StorageBackend):
+    """
+    Colecciones de MongoDB: tracks, user_interactions (o buckets), track_popularity, user_profiles.
+
+    - lecturas de perfiles y de estadísticas con read_preference
+      (secondaryPreferred: pueden ir algo por detrás del primario); catálogo,
+      popularidad y estado derivado siempre del primario
+    - eventos crudos con events_write_concern (w=1; w=0 si se tolera perderlos)
+      y popularidad/perfiles con state_write_concern (majority)
+    - todas las llamadas pasan por el circuit breaker; las idempotentes
+      (lecturas y escritura de eventos, que no se duplican al repetirse) se
+      reintentan con retry; los $inc no, los reintenta una vez el driver
+      (retryWrites)
+    - la lectura de un perfil (camino de get_recommendations) tiene un
+      timeout de profile_read_timeout segundos y ningún reintento
+    """
+
+    name = 'mongodb'
+
+    def __init__(self, db, interactions=None, read_preference='secondaryPreferred',
+                 events_write_concern=1, state_write_concern='majority',
+                 retry=None, breaker=None, profile_read_timeout=PROFILE_READ_TIMEOUT):
+        self.db = db
+        self.interactions = interactions or InteractionStore()
+        self.popularity_collection = DEFAULT_DERIVED_STATE['popularity_collection']
+        self.profiles_collection = DEFAULT_DERIVED_STATE['profiles_collection']
+        self.read_preference = READ_PREFERENCES[read_preference]
+        self.events_write_concern = write_concern(events_write_concern)
+        self.state_write_concern = write_concern(state_write_concern)
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.profile_read_timeout = profile_read_timeout
+
+    def _call(self, fn, *args, **kwargs):
+        return self.breaker.call(fn, *args, **kwargs)
+
+    def _call_with_retry(self, fn, *args, **kwargs):
+        return self.retry.call(self.breaker.call, fn, *args, **kwargs)
+
+    def _state_collection(self, name):
+        return self.db.get_collection(name, write_concern=self.state_write_concern)
+
+    def read_catalog(self, feature_columns, batch_size=5000):
+        return self._call_with_retry(read_catalog, self.db['tracks'], feature_columns, batch_size=batch_size)
+
+    def catalog_fingerprint(self, model_params):
+        return self._call_with_retry(catalog_fingerprint, self.db['tracks'], model_params)
+
+    def catalog_position(self):
+        position = self._call_with_retry(CatalogWatcher.latest_position, self.db['tracks'])
+        return position, self._call_with_retry(self.db.command, 'ping').get('operationTime')
+
+    def catalog_watcher(self, apply_fn, poll_interval=5.0, mode='auto', position=None,
+                        start_at_operation_time=None):
+        return CatalogWatcher(
+            self.db['tracks'], apply_fn, poll_interval=poll_interval, mode=mode,
+            position=position, start_at_operation_time=start_at_operation_time
+        )
+
+    def ensure_interaction_indexes(self):
+        self._call_with_retry(self.interactions.ensure_indexes, self.db)
+
+    def write_interactions(self, events):
+        # En un reintento los eventos ya llevan _id: no se duplican
+        return self._call_with_retry(
+            self.interactions.write, self.db, events, write_concern=self.events_write_concern
+        )
+
+    def recent_interactions(self, since):
+        return self._call(self.interactions.recent_events, self.db, since)
+
+    def count_interactions(self):
+        return self._call_with_retry(
+            self.interactions.count_events, self.db, read_preference=self.read_preference
+        )
+
+    def iter_interaction_users(self):
+        return self.interactions.iter_user_ids(self.db, read_preference=self.read_preference)
+
+    def iter_interaction_counts(self, batch_size=100000):
+        # Agregado en el servidor: llega un documento por (usuario, canción, tipo)
+        collection = self.interactions.collection(self.db, read_preference=self.read_preference)
+        cursor = self._call(
+            collection.aggregate, self.interactions.pair_counts_pipeline(),
+            allowDiskUse=True, batchSize=min(batch_size, 100000)
+        )
+        while True:
+            docs = list(itertools.islice(cursor, batch_size))
+            if not docs:
+                break
+            yield pd.DataFrame.from_records(docs, columns=PAIR_COUNT_COLUMNS)
+        # Interacciones ya archivadas en agregados diarios
+        yield from read_daily_aggregates(self.db, batch_size)
+
+    def read_derived_state(self):
+        """Estado publicado por el replay; las lecturas y escrituras usan sus colecciones"""
+        state = self._call_with_retry(read_derived_state, self.db)
+        self.popularity_collection = state['popularity_collection']
+        self.profiles_collection = state['profiles_collection']
+        return state
+
+    def load_popularity(self):
+        return self._call_with_retry(lambda: list(self.db[self.popularity_collection].find(
+            {}, {'_id': 0, 'track_id': 1, 'popularity': 1}
+        )))
+
+    def ensure_state_indexes(self):
+        self._call_with_retry(
+            self.db[self.popularity_collection].create_index, 'track_id', unique=True
+        )
+
+    def apply_popularity_deltas(self, track_ids, deltas, log_offset=None):
+        self._call(
+            bulk_write_once, self._state_collection(self.popularity_collection),
+            popularity_update_operations(track_ids, deltas, log_offset), log_offset
+        )
+
+    def load_profile(self, user_id):
+        collection = self.db.get_collection(self.profiles_collection, read_preference=self.read_preference)
+        with pymongo.timeout(self.profile_read_timeout):
+            return self._call(collection.find_one, {'_id': user_id})
+
+    def apply_profile_updates(self, user_ids, updates, recent_size=RECENT_SIZE, log_offset=None):
+        self._call(
+            bulk_write_once, self._state_collection(self.profiles_collection),
+            profile_update_operations(user_ids, updates, recent_size, log_offset), log_offset
+        )
+
+    def get_stats(self):
+        return {'breaker': self.breaker.get_stats(), 'retries': self.retry.retries}
@@ -0,0 +1,256 @@
+"""
+Trending con decaimiento exponencial
+Puntuaciones por ventana (última hora, último día, total) calculadas con los
+timestamps de los eventos, y top-K global y por género mantenidos de forma
+incremental: leer el top 20 es O(K)
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Ventana → constante de tiempo en segundos (None = sin decaimiento)
+TRENDING_WINDOWS = {'hour': 3600.0, 'day': 86400.0, 'all': None}
+
+# Reescalar cuando el factor exp((t - t0) / tau) supera e^50
+MAX_EXPONENT = 50.0
+
+
+class TrendingEngine:
+    """
+    Puntuación de cada canción por ventana: suma de pesos × exp(-(ahora - t) / tau).
+
+    Se guarda escalada respecto a una referencia t0, score · exp((t - t0) / tau),
+    así un evento nuevo solo suma en su fila y el orden entre canciones no
+    cambia con el paso del tiempo. El decaimiento se aplica al leer.
+
+    Para cada (ventana, género) hay una lista top de `capacity` filas ordenada,
+    con una cota superior de las puntuaciones que quedan fuera. Cada lote de
+    eventos solo mezcla las filas modificadas con la lista; si la cota deja de
+    garantizar que la lista es exacta (p. ej. skips en canciones del top) esa
+    lista se recalcula entera.
+    """
+
+    def __init__(self, windows=None, capacity=100):
+        self.windows = dict(TRENDING_WINDOWS if windows is None else windows)
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.full_rebuilds = 0
+        self.reset()
+
+    def reset(self):
+        """Sin puntuaciones ni géneros (el catálogo se volvió a cargar)"""
+        with self.lock:
+            self.reference = None
+            self.scores = {window: np.zeros(0) for window in self.windows}
+            self.genre_codes = np.zeros(0, dtype=np.int32)
+
+            # (ventana, código de género o None) → (filas, puntuaciones escaladas, t0)
+            self.tops = {}
+            self.bounds = {}
+
+    def decaying_windows(self):
+        """Ventanas con decaimiento (las que se calientan con eventos recientes)"""
+        return [window for window, tau in self.windows.items() if tau is not None]
+
+    def warmup_since(self):
+        """Desde cuándo las interacciones aún pesan en las ventanas con decaimiento (None = nunca)"""
+        taus = [tau for tau in self.windows.values() if tau is not None]
+        if not taus:
+            return None
+        return datetime.fromtimestamp(time.time() - 3 * max(taus))
+
+    def set_genres(self, genre_codes):
+        """Géneros por fila del catálogo (al cargar o tras cambios del catálogo)"""
+        with self.lock:
+            self.genre_codes = np.asarray(genre_codes, dtype=np.int32).copy()
+            self._grow(len(self.genre_codes))
+            for window in self.windows:
+                self._rebuild_all(window)
+
+    def seed(self, window, rows, values):
+        """Carga puntuaciones ya calculadas (p. ej. la popularidad total)"""
+        with self.lock:
+            rows = np.asarray(rows, dtype=np.int64)
+            if len(rows):
+                self._grow(int(rows.max()) + 1)
+            scale = self._scale(window, time.time()) if self.reference is not None else 1.0
+            self.scores[window][rows] = np.asarray(values, dtype=np.float64) * scale
+            self._rebuild_all(window)
+
+    def add(self, rows, weights, timestamps, windows=None):
+        """
+        Suma un micro-lote: filas, pesos y timestamps (segundos epoch) por evento.
+        windows limita las ventanas afectadas (por defecto todas).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        weights = np.asarray(weights, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+
+        with self.lock:
+            if self.reference is None:
+                self.reference = float(timestamps.min())
+            self._grow(int(rows.max()) + 1)
+            self._maybe_rescale(float(timestamps.max()))
+
+            changed = np.unique(rows)
+            for window, tau in self.windows.items():
+                if windows is not None and window not in windows:
+                    continue
+                if tau is None:
+                    contributions = weights
+                else:
+                    contributions = weights * np.exp((timestamps - self.reference) / tau)
+                np.add.at(self.scores[window], rows, contributions)
+
+                self._merge_top(window, None, changed)
+                genres = self.genre_codes[changed]
+                for genre in np.unique(genres[genres >= 0]).tolist():
+                    self._merge_top(window, genre, changed[genres == genre])
+
+    def top(self, window='day', k=10, genre_code=None, now=None):
+        """(filas, puntuaciones decaídas) de las k canciones con puntuación > 0"""
+        if window not in self.windows:
+            raise ValueError(f"Ventana desconocida: {window}")
+
+        entry = self.tops.get((window, genre_code))
+        if entry is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        rows, scaled, reference = entry
+
+        if k > self.capacity:
+            rows, scaled, reference = self._top_full(window, genre_code, k)
+
+        positive = scaled > 0
+        rows, scaled = rows[positive][:k], scaled[positive][:k]
+        return rows, scaled * self._decay(window, reference, now)
+
+    # --- Internos (con self.lock) ---
+
+    def _grow(self, n_rows):
+        if len(self.genre_codes) < n_rows:
+            self.genre_codes = np.concatenate([
+                self.genre_codes, np.full(n_rows - len(self.genre_codes), -1, dtype=np.int32)
+            ])
+        for window, scores in self.scores.items():
+            if len(scores) < n_rows:
+                grown = np.zeros(n_rows)
+                grown[:len(scores)] = scores
+                self.scores[window] = grown
+
+    def _scale(self, window, timestamp):
+        tau = self.windows[window]
+        return 1.0 if tau is None else float(np.exp((timestamp - self.reference) / tau))
+
+    def _decay(self, window, reference, now=None):
+        tau = self.windows[window]
+        if tau is None or reference is None:
+            return 1.0
+        now = time.time() if now is None else now
+        return float(np.exp(-(now - reference) / tau))
+
+    def _maybe_rescale(self, timestamp):
+        """Mueve la referencia a timestamp antes de que exp() se desborde"""
+        finite = [tau for tau in self.windows.values() if tau is not None]
+        if not finite or (timestamp - self.reference) / min(finite) < MAX_EXPONENT:
+            return
+
+        for window, tau in self.windows.items():
+            if tau is not None:
+                self.scores[window] = self.scores[window] * np.exp(-(timestamp - self.reference) / tau)
+        self.reference = timestamp
+        for window in self.windows:
+            self._rebuild_all(window)
+
+    def _rows_for(self, genre_code):
+        if genre_code is None:
+            return np.arange(len(self.scores[next(iter(self.scores))]))
+        return np.flatnonzero(self.genre_codes == genre_code)
+
+    def _select(self, rows, scores, k):
+        """Las k mejores filas de rows ordenadas, y la mejor puntuación que queda fuera"""
+        if len(rows) > k:
+            part = np.argpartition(-scores, k)
+            rest = part[k:]
+            keep = part[:k]
+            bound = float(scores[rest].max())
+        else:
+            keep = np.arange(len(rows))
+            bound = -np.inf
+        keep = keep[np.argsort(-scores[keep], kind='stable')]
+        return rows[keep], scores[keep], bound
+
+    def _top_full(self, window, genre_code, k):
+        with self.lock:
+            rows = self._rows_for(genre_code)
+            top_rows, top_scores, _ = self._select(rows, self.scores[window][rows], k)
+            return top_rows, top_scores, self.reference
+
+    def _rebuild(self, window, genre_code, rows=None):
+        if rows is None:
+            rows = self._rows_for(genre_code)
+        top_rows, top_scores, bound = self._select(rows, self.scores[window][rows], self.capacity)
+        self.tops[(window, genre_code)] = (top_rows, top_scores, self.reference)
+        self.bounds[(window, genre_code)] = bound
+
+    def _rebuild_all(self, window):
+        stale = {key for key in self.tops if key[0] == window}
+        self._rebuild(window, None)
+        stale.discard((window, None))
+
+        # Filas agrupadas por género con un solo argsort
+        order = np.argsort(self.genre_codes, kind='stable')
+        codes = self.genre_codes[order]
+        genres, starts = np.unique(codes, return_index=True)
+        ends = np.append(starts[1:], len(codes))
+        for genre, start, end in zip(genres.tolist(), starts.tolist(), ends.tolist()):
+            if genre >= 0:
+                self._rebuild(window, genre, order[start:end])
+                stale.discard((window, genre))
+
+        # Géneros que ya no existen (las lecturas no ven huecos durante el rebuild)
+        for key in stale:
+            self.tops.pop(key, None)
+            self.bounds.pop(key, None)
+
+    def _merge_top(self, window, genre_code, changed_rows):
+        key = (window, genre_code)
+        entry = self.tops.get(key)
+        if entry is None:
+            self._rebuild(window, genre_code)
+            return
+
+        scores = self.scores[window]
+        old_rows = entry[0]
+        candidates = np.union1d(old_rows, changed_rows)
+        top_rows, top_scores, dropped_bound = self._select(
+            candidates, scores[candidates], self.capacity
+        )
+
+        # Cota de lo que queda fuera: la anterior, lo que salió de la lista
+        # y las filas modificadas que no entraron
+        bound = max(self.bounds[key], dropped_bound)
+        if len(top_rows) < self.capacity and bound > -np.inf:
+            self.full_rebuilds += 1
+            self._rebuild(window, genre_code)
+            return
+        if len(top_rows) and top_scores[-1] < bound:
+            # Una fila del top bajó por debajo de alguna de fuera
+            self.full_rebuilds += 1
+            self._rebuild(window, genre_code)
+            return
+
+        self.tops[key] = (top_rows, top_scores, self.reference)
+        self.bounds[key] = bound
+
+    def get_stats(self):
+        return {
+            'windows': list(self.windows),
+            'lists': len(self.tops),
+            'capacity': self.capacity,
+            'full_rebuilds': self.full_rebuilds,
+        }
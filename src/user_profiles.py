@@ -0,0 +1,370 @@
+"""
+Perfiles de usuario materializados
+El procesador de eventos mantiene la colección user_profiles de forma
+incremental (contadores por tipo, géneros con like y últimas interacciones);
+las lecturas son una caché LRU o una búsqueda por _id
+"""
+
+import threading
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from lru_cache import LRUCache
+from mongo_resilience import failed_keys
+
+RECENT_SIZE = 20
+
+
+def empty_profile(user_id):
+    return {
+        'user_id': user_id,
+        'total_interactions': 0,
+        'counts': {},
+        'liked_genres': {},
+        'recent': [],
+    }
+
+
+def profile_from_doc(user_id, doc):
+    """Perfil en memoria a partir del documento de user_profiles (o vacío)"""
+    profile = empty_profile(user_id)
+    if doc:
+        profile['total_interactions'] = doc.get('total_interactions', 0)
+        profile['counts'] = dict(doc.get('counts', {}))
+        profile['liked_genres'] = dict(doc.get('liked_genres', {}))
+        profile['recent'] = list(doc.get('recent', []))
+    return profile
+
+
+def merge_profile(profile, delta, recent_size=RECENT_SIZE):
+    """Nuevo perfil = profile + delta (el delta es más reciente)"""
+    counts = dict(profile['counts'])
+    for interaction_type, count in delta['counts'].items():
+        counts[interaction_type] = counts.get(interaction_type, 0) + count
+
+    liked_genres = dict(profile['liked_genres'])
+    for genre, count in delta['liked_genres'].items():
+        liked_genres[genre] = liked_genres.get(genre, 0) + count
+
+    return {
+        'user_id': profile['user_id'],
+        'total_interactions': profile['total_interactions'] + delta['total_interactions'],
+        'counts': counts,
+        'liked_genres': liked_genres,
+        'recent': (delta['recent'] + profile['recent'])[:recent_size],
+    }
+
+
+def deltas_from_events(events, genre_fn, recent_size=RECENT_SIZE):
+    """
+    Agrega eventos (en orden de llegada) en un delta por usuario.
+    genre_fn(track_id) devuelve el género de la canción o None.
+    """
+    deltas = {}
+    for event in events:
+        user_id = event['user_id']
+        delta = deltas.get(user_id)
+        if delta is None:
+            delta = deltas[user_id] = empty_profile(user_id)
+
+        interaction_type = event['interaction_type']
+        delta['counts'][interaction_type] = delta['counts'].get(interaction_type, 0) + 1
+        delta['total_interactions'] += 1
+        if interaction_type == 'like':
+            genre = genre_fn(event['track_id'])
+            if genre is not None:
+                delta['liked_genres'][genre] = delta['liked_genres'].get(genre, 0) + 1
+        delta['recent'].append({
+            'track_id': event['track_id'],
+            'interaction_type': interaction_type,
+            'timestamp': event.get('timestamp'),
+        })
+
+    for delta in deltas.values():
+        # Más recientes primero, como en user_profiles
+        delta['recent'] = delta['recent'][::-1][:recent_size]
+    return deltas
+
+
+def profile_preferences(profile):
+    """Preferencias (géneros con like, canciones recientes) a partir del perfil"""
+    if not profile or not profile['total_interactions']:
+        return None
+
+    liked_genres = {genre for genre, count in profile['liked_genres'].items() if count > 0}
+
+    # Canciones recientes escuchadas o con like (para el modo blend)
+    recent_tracks = list(dict.fromkeys(
+        i['track_id'] for i in profile['recent'] if i['interaction_type'] != 'skip'
+    ))
+
+    return {
+        'liked_genres': liked_genres,
+        'recent_tracks': recent_tracks,
+        'total_interactions': profile['total_interactions']
+    }
+
+
+def profile_summary(profile):
+    """Resumen del perfil para la interfaz"""
+    if not profile or not profile['total_interactions']:
+        return None
+
+    counts = profile['counts']
+    return {
+        'user_id': profile['user_id'],
+        'total_interactions': profile['total_interactions'],
+        'likes': counts.get('like', 0),
+        'plays': counts.get('play', 0),
+        'skips': counts.get('skip', 0),
+        'recent_tracks': profile['recent'][:5]
+    }
+
+
+def profile_update_operations(user_ids, updates, recent_size=RECENT_SIZE, log_offset=None):
+    """
+    Deltas → UpdateOne con $inc + $push con $slice (ring buffer de recientes).
+    Con log_offset solo se aplican a perfiles con un log_offset anterior (un
+    perfil que ya lo tiene da clave duplicada en el upsert: ya estaba aplicado)
+    """
+    now = datetime.now()
+    operations = []
+    for user_id in user_ids:
+        delta = updates[user_id]
+        increments = {'total_interactions': delta['total_interactions']}
+        increments.update({f'counts.{t}': n for t, n in delta['counts'].items()})
+        increments.update({f'liked_genres.{g}': n for g, n in delta['liked_genres'].items()})
+        query = {'_id': user_id}
+        fields = {'user_id': user_id, 'updated_at': now}
+        if log_offset is not None:
+            query['log_offset'] = {'$not': {'$gte': log_offset}}
+            fields['log_offset'] = log_offset
+        operations.append(UpdateOne(
+            query,
+            {
+                '$inc': increments,
+                '$push': {'recent': {
+                    '$each': delta['recent'], '$position': 0, '$slice': recent_size
+                }},
+                '$set': fields,
+            },
+            upsert=True
+        ))
+    return operations
+
+
+class UserProfileStore:
+    """
+    Perfiles con caché LRU delante de la colección user_profiles.
+
+    - apply_events actualiza los perfiles en caché y acumula deltas pendientes
+    - take_updates / begin_write / finish_flush: deltas → escritura del
+      backend de almacenamiento (en MongoDB, profile_update_operations en un
+      bulk_write)
+    - las lecturas que fallan en caché leen el documento y le suman los
+      deltas que aún no llegaron a MongoDB; una lectura que se solapa con una
+      escritura se repite (el documento puede llevar ya esos deltas o no)
+    """
+
+    def __init__(self, cache_size=10000, recent_size=RECENT_SIZE):
+        self.recent_size = recent_size
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.in_flight = []
+        # Cambia al empezar y al terminar cada escritura: invalida lecturas concurrentes
+        self.generation = 0
+        self.writing = 0
+        # Versión de las preferencias de los usuarios con likes recientes
+        # (acotada como la caché); los expulsados pasan a preference_floor,
+        # que nunca es menor que una versión expulsada
+        self.preference_versions = LRUCache(cache_size)
+        self.preference_seq = 0
+        self.preference_floor = 0
+
+    def apply_events(self, events, genre_fn):
+        """Aplica un micro-lote de eventos a los perfiles"""
+        deltas = deltas_from_events(events, genre_fn, self.recent_size)
+
+        with self.lock:
+            for user_id, delta in deltas.items():
+                pending = self.pending.get(user_id)
+                self.pending[user_id] = (
+                    delta if pending is None else merge_profile(pending, delta, self.recent_size)
+                )
+                cached = self.cache.peek(user_id)
+                if cached is not None:
+                    self.cache.put(user_id, merge_profile(cached, delta, self.recent_size))
+                if delta['liked_genres']:
+                    self.preference_seq += 1
+                    evictions = self.preference_versions.evictions
+                    self.preference_versions.put(user_id, self.preference_seq)
+                    if self.preference_versions.evictions != evictions:
+                        self.preference_floor = self.preference_seq
+
+    def preference_version(self, user_id):
+        """Contador que cambia cuando cambian los géneros con like del usuario"""
+        return self.preference_versions.peek(user_id, self.preference_floor)
+
+    def get(self, user_id, load_fn, retries=3):
+        """Perfil de un usuario; load_fn(user_id) lee su documento guardado"""
+        profile = self.cache.get(user_id)
+        if profile is not None:
+            return profile
+
+        for _ in range(retries):
+            generation = self.read_generation()
+            doc = load_fn(user_id)
+            if generation is not None:
+                profile = self.finish_load(user_id, doc, generation)
+                if profile is not None:
+                    return profile
+        # Siempre solapada con escrituras: el último documento, sin caché
+        return self.finish_load(user_id, doc, None)
+
+    async def get_async(self, user_id, load_fn, retries=3):
+        """get() con una load_fn asíncrona (AsyncKappaProcessor)"""
+        profile = self.cache.get(user_id)
+        if profile is not None:
+            return profile
+
+        for _ in range(retries):
+            generation = self.read_generation()
+            doc = await load_fn(user_id)
+            if generation is not None:
+                profile = self.finish_load(user_id, doc, generation)
+                if profile is not None:
+                    return profile
+        return self.finish_load(user_id, doc, None)
+
+    def read_generation(self):
+        """Generación para finish_load, o None si hay una escritura en curso"""
+        with self.lock:
+            return None if self.writing else self.generation
+
+    def finish_load(self, user_id, doc, generation):
+        """
+        Perfil = documento + deltas no sincronizados, y lo guarda en caché.
+        Devuelve None si una escritura empezó o terminó durante la lectura
+        (hay que releer). Con generation None (lectura solapada con una
+        escritura) no suma los deltas en vuelo ni guarda en caché: puede ir
+        por detrás, pero no cuenta dos veces.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return None
+
+            profile = profile_from_doc(user_id, doc)
+            if generation is not None:
+                for updates in self.in_flight:
+                    if user_id in updates:
+                        profile = merge_profile(profile, updates[user_id], self.recent_size)
+            if user_id in self.pending:
+                profile = merge_profile(profile, self.pending[user_id], self.recent_size)
+
+            if generation is not None:
+                self.cache.put(user_id, profile)
+            return profile
+
+    def take_updates(self):
+        """Vacía los deltas pendientes y devuelve (user_ids, deltas)"""
+        with self.lock:
+            updates = self.pending
+            self.pending = {}
+            if updates:
+                self.in_flight.append(updates)
+        return list(updates), updates
+
+    def begin_write(self):
+        """
+        Marca una escritura en curso antes de llamar al almacenamiento: desde
+        aquí el documento puede llevar ya los deltas en vuelo
+        """
+        with self.lock:
+            self.writing += 1
+            self.generation += 1
+
+    def finish_flush(self, user_ids, updates, error=None):
+        """
+        Cierra un flush empezado con begin_write; los deltas que fallaron
+        vuelven a pendientes
+        """
+        failed = failed_keys(user_ids, error) if error is not None else []
+
+        with self.lock:
+            self.in_flight = [u for u in self.in_flight if u is not updates]
+            for user_id in failed:
+                # Lo que llegó después es más reciente que lo que falló
+                pending = self.pending.get(user_id)
+                self.pending[user_id] = (
+                    updates[user_id] if pending is None
+                    else merge_profile(updates[user_id], pending, self.recent_size)
+                )
+            self.writing -= 1
+            self.generation += 1
+
+        if error is not None:
+            print(f"Error sincronizando perfiles: {len(failed)} usuarios pendientes")
+
+    def flush(self, write_fn):
+        """
+        Sincroniza los deltas pendientes; write_fn(user_ids, deltas, recent_size)
+        los escribe (StorageBackend.apply_profile_updates)
+        """
+        user_ids, updates = self.take_updates()
+        if not user_ids:
+            return True
+
+        self.begin_write()
+        try:
+            write_fn(user_ids, updates, self.recent_size)
+        except Exception as e:
+            self.finish_flush(user_ids, updates, e)
+            return False
+        self.finish_flush(user_ids, updates)
+        return True
+
+    async def flush_async(self, write_fn):
+        """flush() con una write_fn asíncrona (AsyncKappaProcessor)"""
+        user_ids, updates = self.take_updates()
+        if not user_ids:
+            return True
+
+        self.begin_write()
+        try:
+            await write_fn(user_ids, updates, self.recent_size)
+        except Exception as e:
+            self.finish_flush(user_ids, updates, e)
+            return False
+        self.finish_flush(user_ids, updates)
+        return True
+
+    def write_updates(self, write_fn, user_ids, updates, **options):
+        """
+        Escribe deltas tomados con take_updates sin devolverlos a pendientes:
+        los que fallan siguen en vuelo (las lecturas los ven) y se devuelven
+        para reintentarlos tal cual (p. ej. con el mismo offset del log)
+        """
+        self.begin_write()
+        try:
+            write_fn(user_ids, updates, self.recent_size, **options)
+            failed = []
+        except Exception as e:
+            failed = failed_keys(user_ids, e)
+            print(f"Error sincronizando perfiles: {len(failed)} usuarios pendientes ({e})")
+
+        with self.lock:
+            for user_id in set(user_ids) - set(failed):
+                del updates[user_id]
+            if not updates:
+                self.in_flight = [u for u in self.in_flight if u is not updates]
+            self.writing -= 1
+            self.generation += 1
+        return failed
+
+    def get_stats(self):
+        stats = self.cache.get_stats()
+        with self.lock:
+            stats['pending_users'] = len(self.pending)
+        return stats
@@ -0,0 +1,69 @@
+"""
+Fixtures comunes: catálogo sintético y procesador sobre LocalStorage
+(SQLite en memoria), sin MongoDB ni red
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from content_model import AUDIO_FEATURES
+from interaction_stats import InteractionStats
+from kappa_processor_mongodb import KappaProcessorMongoDB
+from local_storage import LocalStorage
+
+GENRES = ['pop', 'rock', 'jazz', 'metal', 'folk']
+
+
+def quiet_options():
+    """Sin sincronizaciones ni reconciliaciones en segundo plano durante los tests"""
+    return {
+        'popularity_sync_interval': 3600,
+        'interaction_stats': InteractionStats(reconcile_interval=3600),
+    }
+
+
+def make_tracks(n_tracks, seed=0):
+    """Documentos de canciones con features aleatorias y 5 géneros"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.standard_normal((n_tracks, len(AUDIO_FEATURES))), columns=AUDIO_FEATURES)
+    df['track_id'] = [f"t{i}" for i in range(n_tracks)]
+    df['track_name'] = [f"Canción {i}" for i in range(n_tracks)]
+    df['artists'] = [f"Artista {i % 20}" for i in range(n_tracks)]
+    df['track_genre'] = [GENRES[i % len(GENRES)] for i in range(n_tracks)]
+    return df.to_dict('records')
+
+
+def make_events(n_events, n_tracks, n_users=20, seed=0):
+    """(user_id, track_id, interaction_type) con algo más de plays que likes y skips"""
+    rng = np.random.default_rng(seed)
+    types = rng.choice(['play', 'like', 'skip'], n_events, p=[0.6, 0.25, 0.15])
+    users = rng.integers(0, n_users, n_events)
+    tracks = rng.integers(0, n_tracks, n_events)
+    return [(f"u{u}", f"t{t}", str(kind)) for u, t, kind in zip(users, tracks, types)]
+
+
+def make_processor(storage, **options):
+    processor = KappaProcessorMongoDB(None, storage=storage, **{**quiet_options(), **options})
+    assert processor.load_data_from_mongodb()
+    return processor
+
+
+@pytest.fixture
+def storage():
+    storage = LocalStorage()
+    storage.upsert_tracks(make_tracks(200))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def processor(storage):
+    processor = make_processor(storage, collaborative_weight=0)
+    yield processor
+    processor.close()
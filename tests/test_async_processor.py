@@ -0,0 +1,67 @@
+"""AsyncKappaProcessor: escrituras a través del circuit breaker, sin perder eventos"""
+
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from conftest import make_tracks
+from async_kappa_processor import AsyncKappaProcessor, ThreadedAsyncDatabase
+from mongo_resilience import CircuitBreaker, RetryPolicy
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class FlakyDatabase(ThreadedAsyncDatabase):
+    """insert_many de user_interactions falla con un error de red mientras failing sea True"""
+
+    def __init__(self, database):
+        super().__init__(database)
+        self.failing = True
+        self.insert_calls = 0
+        self.interactions = super().__getitem__('user_interactions')
+        insert_many = self.interactions.insert_many
+
+        async def flaky_insert_many(documents, ordered=True):
+            self.insert_calls += 1
+            if self.failing:
+                raise AutoReconnect("sin conexión")
+            return await insert_many(documents, ordered=ordered)
+
+        self.interactions.insert_many = flaky_insert_many
+
+    def __getitem__(self, name):
+        return self.interactions if name == 'user_interactions' else super().__getitem__(name)
+
+
+def test_failed_writes_are_kept_and_retried():
+    db = mongomock.MongoClient()['spotify_kappa']
+    db['tracks'].insert_many(make_tracks(50))
+    flaky = FlakyDatabase(db)
+    processor = AsyncKappaProcessor(
+        database=flaky, popularity_sync_interval=3600, collaborative_weight=0,
+        breaker=CircuitBreaker(failure_threshold=3), retry_policy=RetryPolicy(attempts=2)
+    )
+
+    async def run():
+        assert await processor.load_data_from_mongodb()
+        for i in range(6):
+            await processor.add_event(f"u{i}", f"t{i}", 'play')
+        stats = await processor.get_stats()
+        assert stats['events_pending_write'] == 6
+        assert stats['storage_breaker'] == 'open'
+
+        # Con el circuito abierto ni se intenta
+        calls = flaky.insert_calls
+        assert not await processor._retry_unwritten()
+        assert flaky.insert_calls == calls
+
+        flaky.failing = False
+        processor.model.breaker.reset_timeout = 0
+        await processor.close()
+
+    asyncio.run(run())
+    assert processor.unwritten == []
+    assert processor.model.retry_policy.retries > 0
+    # Cada evento una sola vez, en orden de llegada
+    assert [doc['user_id'] for doc in db['user_interactions'].find()] == [f"u{i}" for i in range(6)]
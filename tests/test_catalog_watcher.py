@@ -0,0 +1,63 @@
+"""Polling de CatalogWatcher: escrituras con el mismo updated_at y reintentos"""
+
+from datetime import datetime
+
+import pytest
+
+from catalog_watcher import CatalogWatcher
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def tracks():
+    return mongomock.MongoClient()['spotify_kappa']['tracks']
+
+
+class Recorder:
+    """apply_fn que guarda los cambios y puede fallar las primeras veces"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.upserts = []
+        self.deletes = []
+
+    def __call__(self, upserts, deleted_ids):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("fallo simulado")
+        self.upserts.extend(doc['track_id'] for doc in upserts)
+        self.deletes.extend(deleted_ids)
+        return len(upserts) + len(deleted_ids)
+
+
+def test_polling_applies_writes_sharing_updated_at_once(tracks):
+    stamp = datetime(2024, 1, 1)
+    tracks.insert_many([{'track_id': f"t{i:02d}", 'updated_at': stamp} for i in range(5)])
+    recorder = Recorder()
+    watcher = CatalogWatcher(tracks, recorder, batch_size=3, position=CatalogWatcher.latest_position(tracks))
+
+    # Más escrituras con el mismo updated_at, después de tomar la posición
+    tracks.insert_many([{'track_id': f"t{i:02d}", 'updated_at': stamp} for i in range(5, 12)])
+    tracks.update_one({'track_id': 't00'}, {'$set': {'deleted': True, 'updated_at': datetime(2024, 1, 2)}})
+    watcher._poll_once()
+    watcher._poll_once()
+
+    assert recorder.upserts == [f"t{i:02d}" for i in range(5, 12)]
+    assert recorder.deletes == ['t00']
+    assert watcher.since == datetime(2024, 1, 2)
+
+
+def test_failed_apply_is_retried_on_next_poll(tracks):
+    recorder = Recorder(failures=2)
+    watcher = CatalogWatcher(tracks, recorder, position=(None, set()))
+    tracks.insert_many([{'track_id': f"t{i}", 'updated_at': datetime(2024, 1, 1, 0, i)} for i in range(4)])
+
+    watcher._poll_once()
+    watcher._poll_once()
+    assert recorder.upserts == [] and watcher.since is None
+    assert watcher.get_stats()['failed_applies'] == 2
+
+    watcher._poll_once()
+    assert recorder.upserts == ['t0', 't1', 't2', 't3']
+    assert watcher.since == datetime(2024, 1, 1, 0, 3)
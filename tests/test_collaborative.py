@@ -0,0 +1,48 @@
+"""La actualización incremental de CooccurrenceModel contra build con todas las interacciones"""
+
+import numpy as np
+
+from collaborative import CooccurrenceModel
+
+N_ITEMS = 300
+
+
+def interactions(n_events, seed=1):
+    rng = np.random.default_rng(seed)
+    users = [f"u{u}" for u in rng.integers(0, 400, n_events)]
+    rows = rng.integers(0, N_ITEMS, n_events)
+    weights = rng.choice(np.array([1, 3, -1], dtype=np.float32), n_events)
+    return users, rows, weights
+
+
+def model():
+    # Topes bajos para que los recortes por usuario y por canción actúen
+    return CooccurrenceModel(max_neighbors=10, max_user_items=8)
+
+
+def test_incremental_matches_build():
+    users, rows, weights = interactions(20000)
+    incremental = model().build([(users[:5000], rows[:5000], weights[:5000])], N_ITEMS)
+    for start in range(5000, len(rows), 700):
+        end = start + 700
+        incremental.add_events(users[start:end], rows[start:end], weights[start:end])
+    full = model().build([(users, rows, weights)], N_ITEMS)
+
+    # Pesos enteros: las sumas en float32 son exactas, la tolerancia solo
+    # cubre el orden de las operaciones
+    assert abs(incremental.cooccurrence - full.cooccurrence).max() <= 1e-4
+    assert abs(incremental.state[0] - full.state[0]).max() <= 1e-4
+    np.testing.assert_allclose(incremental.state[1], full.state[1], atol=1e-4)
+    for row in range(0, N_ITEMS, 7):
+        candidates = np.arange(N_ITEMS)
+        np.testing.assert_allclose(
+            incremental.similarities(row, candidates), full.similarities(row, candidates), atol=1e-5
+        )
+
+
+def test_served_view_keeps_max_neighbors():
+    users, rows, weights = interactions(5000)
+    collaborative = model().build([(users, rows, weights)], N_ITEMS)
+    served, _ = collaborative.state
+    assert np.diff(served.indptr).max() <= 10
+    assert collaborative.cooccurrence.nnz > served.nnz
@@ -0,0 +1,88 @@
+"""EventWriteBuffer: flush por tamaño y al cerrar, reintento de lotes y backpressure"""
+
+import threading
+import time
+
+import pytest
+
+from event_buffer import BufferFullError, EventWriteBuffer
+
+
+def test_flush_by_size_and_on_close():
+    written = []
+    buffer = EventWriteBuffer(written.append, batch_size=3, flush_interval=60)
+    for i in range(7):
+        buffer.put(i)
+
+    deadline = time.monotonic() + 5
+    while len(written) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert written[:2] == [[0, 1, 2], [3, 4, 5]]
+
+    assert buffer.close()
+    assert written[2:] == [[6]]
+    assert buffer.get_stats()['flushed'] == 7
+
+
+def test_failed_batch_is_retried_in_order():
+    written = []
+    calls = []
+
+    def flaky(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            raise ConnectionError("almacenamiento caído")
+        written.extend(batch)
+
+    buffer = EventWriteBuffer(flaky, batch_size=2)
+    buffer.pending = [1, 2, 3]
+    assert not buffer.flush()
+    assert buffer.pending == [1, 2, 3]
+    assert buffer.flush()
+    assert written == [1, 2, 3]
+    assert buffer.get_stats()['failed_flushes'] == 1
+
+
+def test_put_blocks_until_the_writer_frees_room():
+    release = threading.Event()
+    written = []
+
+    def slow(batch):
+        release.wait(5)
+        written.extend(batch)
+
+    buffer = EventWriteBuffer(slow, batch_size=2, max_pending=2, put_timeout=5)
+    buffer.put(0)
+    buffer.put(1)
+    threading.Timer(0.1, release.set).start()
+    # El writer tiene el primer lote en vuelo: hay sitio en cuanto lo saca de pending
+    buffer.put(2)
+    buffer.put(3)
+    buffer.put(4)
+    assert buffer.close()
+    assert written == [0, 1, 2, 3, 4]
+    assert buffer.get_stats()['blocked_puts'] >= 1
+
+
+def test_put_gives_up_after_timeout():
+    buffer = EventWriteBuffer(lambda batch: None, max_pending=2, put_timeout=0.05)
+    buffer.is_running = True  # sin thread de escritura: nadie vacía el buffer
+    buffer.put(0)
+    buffer.put(1)
+    with pytest.raises(BufferFullError):
+        buffer.put(2)
+    assert buffer.get_stats()['dropped'] == 1
+
+
+def test_add_event_survives_a_full_buffer(processor, capsys):
+    processor.event_writer.is_running = True
+    processor.event_writer.max_pending = 0
+    processor.event_writer.put_timeout = 0.01
+
+    event = processor.add_event('u1', 't5', 'like')
+    assert event['track_id'] == 't5'
+    # La popularidad se actualiza aunque el evento no se pueda guardar
+    assert processor.track_popularity['t5'] > 0
+    assert processor.event_writer.get_stats()['dropped'] == 1
+    assert "Error guardando evento" in capsys.readouterr().out
+    processor.event_writer.is_running = False
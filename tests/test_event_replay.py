@@ -0,0 +1,39 @@
+"""El replay (ReplayAggregator) llega al mismo estado que el procesador en vivo"""
+
+import pandas as pd
+
+from conftest import make_events
+from event_replay import ReplayAggregator
+
+
+def test_replay_matches_live_processor(processor, storage):
+    for user_id, track_id, interaction_type in make_events(2000, n_tracks=200):
+        processor.add_event(user_id, track_id, interaction_type)
+    processor.sync_to_storage()
+    processor.event_writer.flush()
+
+    genres = dict(zip(processor.tracks_df['track_id'], processor.tracks_df['track_genre']))
+    aggregator = ReplayAggregator(processor.interaction_weights, genres)
+    with storage.lock:
+        rows = storage.conn.execute(
+            'SELECT user_id, track_id, interaction_type, timestamp FROM interactions ORDER BY id'
+        ).fetchall()
+    events = pd.DataFrame(rows, columns=['user_id', 'track_id', 'interaction_type', 'timestamp'])
+    events['timestamp'] = pd.to_datetime(events['timestamp'], unit='s')
+    aggregator.add_events(events)
+
+    # Canciones con suma 0 pueden no tener documento
+    def nonzero(docs):
+        return {doc['track_id']: doc['popularity'] for doc in docs if doc['popularity']}
+
+    replayed = nonzero(aggregator.popularity_docs())
+    assert nonzero({'track_id': t, 'popularity': v} for t, v in processor.track_popularity.items()) == replayed
+    assert nonzero(storage.load_popularity()) == replayed
+
+    for doc in aggregator.profile_docs():
+        stored = storage.load_profile(doc['_id'])
+        assert stored['total_interactions'] == doc['total_interactions']
+        assert stored['counts'] == doc['counts']
+        assert stored['liked_genres'] == doc['liked_genres']
+        assert ([r['track_id'] for r in stored['recent']]
+                == [r['track_id'] for r in doc['recent']])
@@ -0,0 +1,104 @@
+"""InteractionStore: layout por buckets, TTL, archivado diario y reconciliación de estadísticas"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from interaction_stats import InteractionStats
+from interaction_store import (ARCHIVE_LOG_COLLECTION, DAILY_COLLECTION, InteractionStore,
+                               bucket_id)
+from storage import MongoStorage
+
+mongomock = pytest.importorskip('mongomock')
+
+START = datetime(2024, 1, 1, 10, 0)
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['spotify_kappa']
+
+
+def make_events(n_events, days=3):
+    """Eventos repartidos en `days` días, 4 usuarios y 5 canciones"""
+    return [
+        {'user_id': f"u{i % 4}", 'track_id': f"t{i % 5}",
+         'interaction_type': ('play', 'like', 'skip')[i % 3],
+         'timestamp': START + timedelta(days=i % days, minutes=i)}
+        for i in range(n_events)
+    ]
+
+
+def flat(events):
+    return sorted((e['user_id'], e['track_id'], e['interaction_type'], e['timestamp']) for e in events)
+
+
+@pytest.mark.parametrize('layout', ['raw', 'bucketed'])
+def test_layouts_read_back_the_same_events(db, layout):
+    store = InteractionStore(layout)
+    events = make_events(60)
+    assert store.write(db, [dict(e) for e in events]) == 60
+    assert flat(store.recent_events(db, since=START)) == flat(events)
+    assert store.count_events(db) == 60
+    assert sorted(set(store.iter_user_ids(db))) == ['u0', 'u1', 'u2', 'u3']
+
+
+def test_buckets_group_by_user_and_hour_and_ignore_retries(db):
+    store = InteractionStore('bucketed')
+    events = make_events(30, days=1)
+    store.write(db, events)
+    # Reintento del mismo lote: los eventos ya tienen _id y $addToSet no los duplica
+    store.write(db, events)
+
+    buckets = list(db[store.collection_name].find())
+    hours = {(e['user_id'], e['timestamp'].replace(minute=0)) for e in events}
+    assert {doc['_id'] for doc in buckets} == {bucket_id(u, h) for u, h in hours}
+    assert sum(len(doc['events']) for doc in buckets) == 30
+    assert store.count_events(db) == 30
+
+
+@pytest.mark.parametrize('layout', ['raw', 'bucketed'])
+def test_ttl_index_follows_ttl_days(db, layout):
+    store = InteractionStore(layout, ttl_days=30)
+    store.ensure_indexes(db)
+    time_index = db[store.collection_name].index_information()[f'{store.time_field}_1']
+    assert time_index['expireAfterSeconds'] == 30 * 86400
+    assert 'expireAfterSeconds' not in InteractionStore(layout).index_models()[1].document
+
+
+@pytest.mark.parametrize('layout', ['raw', 'bucketed'])
+def test_archive_compacts_old_days_once(db, layout):
+    store = InteractionStore(layout)
+    events = make_events(90)
+    store.write(db, [dict(e) for e in events])
+
+    cutoff = START + timedelta(days=2)
+    assert store.archive_before(db, cutoff, verbose=False) == 60
+    # Repetirlo no vuelve a contar los días ya archivados
+    assert store.archive_before(db, cutoff, verbose=False) == 0
+
+    assert db[ARCHIVE_LOG_COLLECTION].count_documents({}) == 2
+    assert sum(doc['total'] for doc in db[DAILY_COLLECTION].find()) == 60
+    remaining = list(store.recent_events(db, since=START))
+    assert len(remaining) == 30 and all(e['timestamp'] >= cutoff for e in remaining)
+
+
+def test_reconcile_keeps_archived_interactions(db):
+    store = InteractionStore()
+    storage = MongoStorage(db, interactions=store)
+    events = make_events(90)
+    store.write(db, [dict(e) for e in events])
+
+    stats = InteractionStats()
+    stats.reconcile(storage)
+    assert stats.snapshot()['total_interactions'] == 90
+
+    # Todos los eventos de u3 son de días archivados: sigue contando como usuario
+    db[store.collection_name].delete_many({'user_id': 'u3', 'timestamp': {'$gte': START + timedelta(days=2)}})
+    store.archive_before(db, START + timedelta(days=2), verbose=False)
+    remaining = db[store.collection_name].count_documents({})
+    assert remaining < 30
+    stats.reconcile(storage)
+    snapshot = stats.snapshot()
+    assert snapshot['total_interactions'] == 60 + remaining
+    assert snapshot['total_users'] == 4
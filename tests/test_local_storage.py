@@ -0,0 +1,179 @@
+"""Contrato de StorageBackend con LocalStorage: lo que se escribe se vuelve a leer igual"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from conftest import AUDIO_FEATURES, make_tracks
+from local_storage import LocalStorage
+from storage import StorageBackend
+from user_profiles import deltas_from_events
+
+
+def test_catalog_round_trip(storage):
+    tracks_df, stats = storage.read_catalog(AUDIO_FEATURES)
+    assert stats['documents'] == 200
+    expected = pd.DataFrame(make_tracks(200))
+    pd.testing.assert_frame_equal(
+        tracks_df[['track_id'] + AUDIO_FEATURES].reset_index(drop=True),
+        expected[['track_id'] + AUDIO_FEATURES],
+        check_dtype=False
+    )
+
+
+def test_deleted_tracks_are_not_read(storage):
+    storage.delete_tracks(['t0', 't1'])
+    tracks_df, _ = storage.read_catalog(AUDIO_FEATURES)
+    assert len(tracks_df) == 198
+    assert not {'t0', 't1'} & set(tracks_df['track_id'])
+
+
+def test_catalog_feed_replays_changes_after_position(storage):
+    position, _ = storage.catalog_position()
+    storage.upsert_tracks([{**make_tracks(1)[0], 'track_id': 'nueva'}])
+    storage.delete_tracks(['t5'])
+
+    received = []
+    feed = storage.catalog_watcher(lambda upserts, deleted: received.append((upserts, deleted)) or 1,
+                                   position=position)
+    feed.start()
+    storage.delete_tracks(['t6'])
+    feed.stop()
+
+    upserts = [doc['track_id'] for batch, _ in received for doc in batch]
+    deleted = [track_id for _, batch in received for track_id in batch]
+    assert upserts == ['nueva']
+    assert deleted == ['t5', 't6']
+
+
+def test_interactions_round_trip(storage):
+    now = datetime.now()
+    events = [
+        {'user_id': 'u1', 'track_id': 't1', 'interaction_type': 'play', 'timestamp': now - timedelta(hours=2)},
+        {'user_id': 'u1', 'track_id': 't1', 'interaction_type': 'play', 'timestamp': now},
+        {'user_id': 'u2', 'track_id': 't2', 'interaction_type': 'like', 'timestamp': now},
+    ]
+    assert storage.write_interactions(events) == 3
+    assert storage.count_interactions() == 3
+    assert sorted(storage.iter_interaction_users()) == ['u1', 'u2']
+
+    recent = storage.recent_interactions(now - timedelta(hours=1))
+    assert [(e['track_id'], e['interaction_type']) for e in recent] == [('t1', 'play'), ('t2', 'like')]
+
+    batches = list(storage.iter_interaction_counts(batch_size=1))
+    assert [len(batch) for batch in batches] == [1, 1]
+    counts = pd.concat(batches, ignore_index=True)
+    assert sorted(counts.itertuples(index=False, name=None)) == [
+        ('u1', 't1', 'play', 2), ('u2', 't2', 'like', 1)
+    ]
+
+
+def test_popularity_deltas_accumulate(storage):
+    storage.apply_popularity_deltas(['t1', 't2'], {'t1': 3, 't2': -1})
+    storage.apply_popularity_deltas(['t1'], {'t1': 2})
+    popularity = {doc['track_id']: doc['popularity'] for doc in storage.load_popularity()}
+    assert popularity == {'t1': 5, 't2': -1}
+
+
+def test_interactions_with_id_are_not_duplicated(storage):
+    now = datetime.now()
+    events = [
+        {'_id': 'e1', 'user_id': 'u1', 'track_id': 't1', 'interaction_type': 'play', 'timestamp': now},
+        {'_id': 'e2', 'user_id': 'u1', 'track_id': 't2', 'interaction_type': 'play', 'timestamp': now},
+    ]
+    assert storage.write_interactions(events) == 2
+    assert storage.write_interactions(events + [{**events[0], '_id': 'e3'}]) == 1
+    assert storage.count_interactions() == 3
+
+
+def test_popularity_deltas_with_log_offset_apply_once(storage):
+    storage.apply_popularity_deltas(['t1', 't2'], {'t1': 3, 't2': 1}, log_offset=100)
+    # Repetición del mismo offset (caída antes del commit) u offset anterior: no suman
+    storage.apply_popularity_deltas(['t1', 't2', 't3'], {'t1': 3, 't2': 1, 't3': 2}, log_offset=100)
+    storage.apply_popularity_deltas(['t1'], {'t1': 5}, log_offset=50)
+    storage.apply_popularity_deltas(['t1'], {'t1': 1}, log_offset=200)
+    storage.apply_popularity_deltas(['t1'], {'t1': 1})
+    popularity = {doc['track_id']: doc['popularity'] for doc in storage.load_popularity()}
+    assert popularity == {'t1': 5, 't2': 1, 't3': 2}
+
+
+def test_profile_updates_merge(storage):
+    now = datetime.now()
+    genres = {'t1': 'pop', 't2': 'rock'}.get
+    first = deltas_from_events([
+        {'user_id': 'u1', 'track_id': 't1', 'interaction_type': 'like', 'timestamp': now},
+    ], genres)
+    second = deltas_from_events([
+        {'user_id': 'u1', 'track_id': 't2', 'interaction_type': 'play', 'timestamp': now},
+        {'user_id': 'u1', 'track_id': 't1', 'interaction_type': 'like', 'timestamp': now},
+    ], genres)
+    storage.apply_profile_updates(['u1'], first)
+    storage.apply_profile_updates(['u1'], second)
+
+    profile = storage.load_profile('u1')
+    assert profile['total_interactions'] == 3
+    assert profile['counts'] == {'like': 2, 'play': 1}
+    assert profile['liked_genres'] == {'pop': 2}
+    assert [r['track_id'] for r in profile['recent']] == ['t1', 't2', 't1']
+    assert storage.load_profile('u2') is None
+
+
+def test_profile_updates_with_log_offset_apply_once(storage):
+    delta = deltas_from_events([
+        {'user_id': 'u1', 'track_id': 't1', 'interaction_type': 'like', 'timestamp': datetime.now()},
+    ], {'t1': 'pop'}.get)
+    storage.apply_profile_updates(['u1'], delta, log_offset=100)
+    storage.apply_profile_updates(['u1'], delta, log_offset=100)
+    assert storage.load_profile('u1')['total_interactions'] == 1
+    storage.apply_profile_updates(['u1'], delta, log_offset=150)
+    storage.apply_profile_updates(['u1'], delta)
+    profile = storage.load_profile('u1')
+    assert profile['total_interactions'] == 3
+    assert profile['log_offset'] == 150
+
+
+def test_file_storage_survives_reopen(tmp_path):
+    path = str(tmp_path / 'kappa.db')
+    storage = LocalStorage(path)
+    storage.upsert_tracks(make_tracks(10))
+    storage.apply_popularity_deltas(['t3'], {'t3': 7})
+    storage.close()
+
+    storage = LocalStorage(path)
+    tracks_df, _ = storage.read_catalog(AUDIO_FEATURES)
+    assert len(tracks_df) == 10
+    assert list(storage.load_popularity()) == [{'track_id': 't3', 'popularity': 7}]
+    storage.close()
+
+
+def test_old_schema_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE interactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL,
+            track_id TEXT NOT NULL, interaction_type TEXT NOT NULL, timestamp REAL NOT NULL);
+        CREATE TABLE popularity (track_id TEXT PRIMARY KEY, popularity INTEGER NOT NULL,
+            updated_at REAL NOT NULL);
+        INSERT INTO popularity VALUES ('t1', 4, 0);
+    """)
+    conn.close()
+
+    storage = LocalStorage(path)
+    storage.apply_popularity_deltas(['t1'], {'t1': 1}, log_offset=10)
+    storage.apply_popularity_deltas(['t1'], {'t1': 1}, log_offset=10)
+    assert list(storage.load_popularity()) == [{'track_id': 't1', 'popularity': 5}]
+    event = {'_id': 'e1', 'user_id': 'u1', 'track_id': 't1', 'interaction_type': 'play',
+             'timestamp': datetime.now()}
+    assert storage.write_interactions([event, event]) == 1
+    storage.close()
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class PopularityOnly(StorageBackend):
+        def load_popularity(self):
+            return []
+
+    with pytest.raises(TypeError, match='abstract'):
+        PopularityOnly()
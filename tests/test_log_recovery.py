@@ -0,0 +1,152 @@
+"""
+Caída del proceso entre la escritura del estado y el commit del log: tras
+reiniciar, popularidad, perfiles e interacciones cuentan cada evento una vez
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import make_events, make_processor
+from event_log import EventLog
+from event_log_consumer import PROCESSOR_CONSUMER
+from local_storage import LocalStorage
+
+TESTS_DIR = os.path.dirname(__file__)
+SRC_DIR = os.path.join(TESTS_DIR, '..', 'src')
+
+# Proceso hijo: procesa 500 eventos con el log y muere (os._exit) en el punto
+# indicado; con 'restart' vuelve a abrir el mismo log y almacenamiento
+CHILD = r'''
+import json
+import os
+import sys
+
+sys.path[:0] = sys.argv[1:3]
+from conftest import make_events, make_processor, make_tracks
+from event_log import EventLog
+from event_log_consumer import INTERACTIONS_CONSUMER, PROCESSOR_CONSUMER
+from local_storage import LocalStorage
+
+db_path, log_dir, mode, state_path = sys.argv[3:7]
+storage = LocalStorage(db_path)
+if mode != 'restart':
+    storage.upsert_tracks(make_tracks(200))
+processor = make_processor(storage, collaborative_weight=0, event_log=EventLog(log_dir), write_batch_size=100)
+
+if mode == 'restart':
+    processor.start_processing()
+    processor.close()
+    with open(state_path, 'w') as f:
+        json.dump({t: p for t, p in processor.track_popularity.items() if p}, f)
+    sys.exit(0)
+
+commit = processor.event_log.commit
+crash_consumer = {'processor': PROCESSOR_CONSUMER, 'sink': INTERACTIONS_CONSUMER}.get(mode)
+
+def commit_or_crash(name, offset):
+    if name == crash_consumer:
+        os._exit(3)
+    commit(name, offset)
+
+processor.event_log.commit = commit_or_crash
+if mode == 'profiles':
+    # La popularidad ya se escribió; los perfiles no
+    processor.storage.apply_profile_updates = lambda *args, **kwargs: os._exit(3)
+
+for user_id, track_id, kind in make_events(500, n_tracks=200):
+    processor.add_event(user_id, track_id, kind)
+processor.sync_to_storage()
+processor.event_writer.flush()
+processor.close()
+'''
+
+
+def run_child(directory, mode):
+    return subprocess.run(
+        [sys.executable, '-c', CHILD, SRC_DIR, TESTS_DIR, str(directory / 'kappa.db'),
+         str(directory / 'log'), mode, str(directory / 'state.json')],
+        capture_output=True, text=True, timeout=120
+    )
+
+
+def stored_state(directory):
+    storage = LocalStorage(str(directory / 'kappa.db'))
+    popularity = {doc['track_id']: doc['popularity'] for doc in storage.load_popularity() if doc['popularity']}
+    with storage.lock:
+        users = [row[0] for row in storage.conn.execute('SELECT user_id FROM profiles')]
+        interactions = sorted(storage.conn.execute(
+            'SELECT user_id, track_id, interaction_type FROM interactions'
+        ).fetchall())
+    profiles = {}
+    for user_id in users:
+        doc = storage.load_profile(user_id)
+        profiles[user_id] = (doc['total_interactions'], doc['counts'], doc['liked_genres'])
+    storage.close()
+    return popularity, profiles, interactions
+
+
+@pytest.fixture(scope='module')
+def expected(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('clean')
+    result = run_child(directory, 'clean')
+    assert result.returncode == 0, result.stderr
+    return stored_state(directory)
+
+
+@pytest.mark.parametrize('mode', ['processor', 'profiles', 'sink'])
+def test_restart_after_crash_counts_each_event_once(tmp_path, expected, mode):
+    crashed = run_child(tmp_path, mode)
+    assert crashed.returncode == 3, crashed.stderr
+
+    restarted = run_child(tmp_path, 'restart')
+    assert restarted.returncode == 0, restarted.stderr
+
+    popularity, profiles, interactions = stored_state(tmp_path)
+    assert popularity == expected[0]
+    assert profiles == expected[1]
+    assert interactions == expected[2] and len(interactions) == 500
+    # Estado en memoria tras el reinicio = estado guardado
+    with open(tmp_path / 'state.json') as f:
+        assert json.load(f) == popularity
+
+
+def test_failed_part_is_retried_with_the_same_offset(tmp_path, storage):
+    processor = make_processor(storage, collaborative_weight=0, event_log=EventLog(str(tmp_path / 'log')))
+    write = storage.apply_profile_updates
+    offsets = []
+
+    def flaky_write(*args, **kwargs):
+        offsets.append(kwargs['log_offset'])
+        if len(offsets) == 1:
+            raise ConnectionError("almacenamiento caído")
+        return write(*args, **kwargs)
+
+    storage.apply_profile_updates = flaky_write
+    events = make_events(300, n_tracks=200)
+    for event in events[:150]:
+        processor.add_event(*event)
+    first = processor.log_consumer.offset
+    processor.sync_to_storage()
+    assert processor.event_log.committed(PROCESSOR_CONSUMER) < first
+
+    # El reintento lleva solo los perfiles que fallaron y el mismo offset;
+    # los eventos nuevos esperan a la siguiente sincronización
+    for event in events[150:]:
+        processor.add_event(*event)
+    processor.sync_to_storage()
+    assert offsets == [first, first]
+    assert processor.event_log.committed(PROCESSOR_CONSUMER) == first
+
+    processor.sync_to_storage()
+    assert offsets[-1] == processor.log_consumer.offset
+    assert processor.event_log.committed(PROCESSOR_CONSUMER) == processor.log_consumer.offset
+
+    users = {user_id for user_id, _, _ in events}
+    assert sum(storage.load_profile(user_id)['total_interactions'] for user_id in users) == 300
+    assert ({doc['track_id']: doc['popularity'] for doc in storage.load_popularity() if doc['popularity']}
+            == {t: p for t, p in processor.track_popularity.items() if p})
+    processor.close()
@@ -0,0 +1,115 @@
+"""NeighborIndex.update debe dejar la misma tabla de vecinos que reconstruir el índice"""
+
+import numpy as np
+import pytest
+
+from neighbor_index import NeighborIndex
+
+
+def assert_same_neighbors(updated, rebuilt, rows):
+    np.testing.assert_array_equal(updated.neighbor_ids[rows], rebuilt.neighbor_ids)
+    np.testing.assert_allclose(updated.neighbor_scores[rows], rebuilt.neighbor_scores, rtol=1e-5, atol=1e-6)
+
+
+@pytest.fixture
+def features():
+    return np.random.default_rng(0).standard_normal((300, 8))
+
+
+def test_update_matches_rebuild(features):
+    index = NeighborIndex(n_neighbors=10, block_size=64, backend='exact').build(features)
+
+    rng = np.random.default_rng(1)
+    changed = rng.choice(len(features), 20, replace=False)
+    features = features.copy()
+    features[changed] = rng.standard_normal((20, features.shape[1]))
+    added = np.arange(len(features), len(features) + 5)
+    features = np.vstack([features, rng.standard_normal((5, features.shape[1]))])
+
+    rows = np.concatenate([changed, added])
+    index.update(rows, features[rows])
+    rebuilt = NeighborIndex(n_neighbors=10, backend='exact').build(features)
+    assert_same_neighbors(index, rebuilt, np.arange(len(features)))
+
+
+def test_deleted_rows_leave_every_neighbor_list(features):
+    index = NeighborIndex(n_neighbors=10, backend='exact').build(features)
+    deleted = np.array([3, 50, 120])
+    index.update([], np.empty((0, features.shape[1])), deleted_rows=deleted)
+
+    kept = np.setdiff1d(np.arange(len(features)), deleted)
+    rebuilt = NeighborIndex(n_neighbors=10, backend='exact').build(features[kept])
+    # Ids del índice reconstruido (filas compactadas) → filas originales
+    np.testing.assert_array_equal(index.neighbor_ids[kept], kept[rebuilt.neighbor_ids])
+    assert not np.isin(index.neighbor_ids, deleted).any()
+    assert (index.neighbor_ids[deleted] == -1).all()
+
+
+def test_ann_backend_must_implement_interface():
+    from ann_index import _ANNBase
+
+    class SearchOnly(_ANNBase):
+        def fit(self, vectors):
+            return self
+
+    with pytest.raises(TypeError, match='abstract'):
+        SearchOnly()
+
+
+@pytest.mark.parametrize('backend', ['ivf', 'lsh'])
+def test_ann_backends_find_most_exact_neighbors(features, backend):
+    index = NeighborIndex(n_neighbors=10, backend=backend).build(features)
+    assert index.recall_report(k=10, sample_size=100)['recall@10'] > 0.5
+
+
+@pytest.mark.parametrize('backend, options', [
+    ('ivf', {'n_probe': 2}), ('ivf', {'n_lists': 100, 'n_probe': 1}), ('lsh', {'n_tables': 3}),
+])
+def test_batched_ann_search_matches_per_query_scoring(features, backend, options):
+    from ann_index import ANN_BACKENDS
+
+    vectors = NeighborIndex.normalize(features)
+    active = np.ones(len(vectors), dtype=bool)
+    active[::7] = False
+    ann = ANN_BACKENDS[backend](**options).fit(vectors).reindex(vectors, active)
+    rows = np.arange(0, len(vectors), 3)
+    k = 10
+    ids, scores = ann.search(vectors[rows], k, rows)
+
+    # Referencia: cada consulta por separado sobre su matriz de candidatos
+    candidates = ann._candidates(vectors[rows])
+    for i, row in enumerate(rows):
+        cands = np.unique(candidates[i][(candidates[i] >= 0) & (candidates[i] != row)])
+        if len(cands) < k:
+            cands = np.flatnonzero(active)
+            cands = cands[cands != row]
+        sims = vectors[cands] @ vectors[row]
+        expected = np.sort(sims)[::-1][:k]
+        np.testing.assert_allclose(scores[i], expected, rtol=1e-5, atol=1e-6)
+        assert row not in ids[i] and active[ids[i]].all()
+
+
+@pytest.mark.parametrize('backend', ['exact', 'ivf'])
+def test_snapshot_round_trip_keeps_deleted_rows_out(tmp_path, features, backend):
+    from model_snapshot import load_snapshot, save_snapshot
+
+    index = NeighborIndex(n_neighbors=10, backend=backend, ann_options={'n_probe': 64}).build(features)
+    deleted = np.array([3, 50, 120])
+    index.update([], np.empty((0, features.shape[1])), deleted_rows=deleted)
+    save_snapshot(str(tmp_path), 'borrados', {'index': index.to_arrays()}, {})
+    complete = NeighborIndex(n_neighbors=10).build(features[:100])
+    save_snapshot(str(tmp_path), 'completo', {'index': complete.to_arrays()}, {})
+
+    restored = NeighborIndex(n_neighbors=10, backend=backend, ann_options={'n_probe': 64})
+    groups, _ = load_snapshot(str(tmp_path), 'borrados')
+    restored.from_arrays(groups['index'], index.active_backend)
+    ids, _ = restored.search_vector(features[3], 20)
+    assert not np.isin(ids, deleted).any()
+    ids, _ = restored.neighbors_batch(np.arange(10), 20)
+    assert not np.isin(ids, deleted).any()
+
+    # Un snapshot sin borrados no hereda la máscara anterior (de otra longitud)
+    groups, _ = load_snapshot(str(tmp_path), 'completo')
+    restored.from_arrays(groups['index'], 'exact')
+    assert restored.active is None
+    assert len(restored.search_vector(features[3], 5)[0]) == 5
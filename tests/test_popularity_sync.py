@@ -0,0 +1,85 @@
+"""Sincronización de popularidad: solo los deltas, con $inc, y reintento de lo que falla"""
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from conftest import make_processor, make_tracks
+from storage import MongoStorage
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()['spotify_kappa']
+    db['tracks'].insert_many(make_tracks(50))
+    return db
+
+
+@pytest.fixture
+def processor(db):
+    processor = make_processor(MongoStorage(db), collaborative_weight=0)
+    yield processor
+    processor.close()
+
+
+def stored(db):
+    return {doc['track_id']: doc['popularity'] for doc in db['track_popularity'].find()}
+
+
+def fail_popularity_writes(monkeypatch, error, written=0):
+    """La siguiente escritura de track_popularity aplica solo `written` operaciones y falla"""
+    bulk_write = mongomock.collection.Collection.bulk_write
+    failures = [error]
+
+    def failing_bulk_write(collection, operations, **kwargs):
+        if collection.name != 'track_popularity' or not failures:
+            return bulk_write(collection, operations, **kwargs)
+        if written:
+            bulk_write(collection, operations[:written], **kwargs)
+        raise failures.pop()
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'bulk_write', failing_bulk_write)
+
+
+def test_sync_adds_deltas_to_counters_written_by_others(processor, db):
+    for track_id, kind in [('t1', 'like'), ('t2', 'play'), ('t3', 'skip'), ('t4', 'play'), ('t4', 'skip')]:
+        processor.add_event('u1', track_id, kind)
+    # Otra instancia sumó popularidad a t1 después de la carga
+    db['track_popularity'].insert_one({'track_id': 't1', 'popularity': 10})
+    processor.sync_to_storage()
+    # t4 suma 0: no se escribe
+    assert stored(db) == {'t1': 13, 't2': 1, 't3': -1}
+
+    untouched = db['track_popularity'].find_one({'track_id': 't2'})['updated_at']
+    processor.add_event('u1', 't1', 'play')
+    processor.sync_to_storage()
+    assert stored(db) == {'t1': 14, 't2': 1, 't3': -1}
+    # Solo se escriben las canciones con delta
+    assert db['track_popularity'].find_one({'track_id': 't2'})['updated_at'] == untouched
+
+
+def test_only_failed_operations_are_retried(processor, db, monkeypatch):
+    fail_popularity_writes(monkeypatch, BulkWriteError({
+        'writeErrors': [{'index': 1, 'code': 2, 'errmsg': 'fallo simulado'}],
+        'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 1, 'nMatched': 0,
+        'nModified': 0, 'nRemoved': 0, 'upserted': [],
+    }), written=1)
+    processor.add_event('u1', 't1', 'like')
+    processor.add_event('u1', 't2', 'play')
+    processor.sync_to_storage()
+    assert stored(db) == {'t1': 3}
+
+    processor.sync_to_storage()
+    assert stored(db) == {'t1': 3, 't2': 1}
+
+
+def test_failed_sync_keeps_every_delta(processor, db, monkeypatch):
+    fail_popularity_writes(monkeypatch, AutoReconnect('sin conexión'))
+    processor.add_event('u1', 't1', 'like')
+    processor.sync_to_storage()
+    assert stored(db) == {}
+
+    processor.add_event('u1', 't1', 'play')
+    processor.sync_to_storage()
+    assert stored(db) == {'t1': 4}
@@ -0,0 +1,80 @@
+"""Invalidación de ResultCache y de la caché de recomendaciones del procesador"""
+
+import result_cache
+from result_cache import ResultCache
+
+
+def test_version_change_invalidates():
+    cache = ResultCache(ttl=60)
+    cache.put('k', 'valor', version=1)
+    assert cache.get('k', version=1) == 'valor'
+    assert cache.get('k', version=2) is None
+    # La entrada inválida se borra: tampoco sirve con la versión original
+    assert cache.get('k', version=1) is None
+    assert cache.get_stats()['invalidated'] == 1
+
+
+def test_ttl_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache = ResultCache(ttl=30)
+    cache.put('k', 'valor')
+    now[0] += 29
+    assert cache.get('k') == 'valor'
+    now[0] += 1
+    assert cache.get('k') is None
+    assert cache.get_stats()['expired'] == 1
+
+
+def test_is_valid_rejects_entry():
+    cache = ResultCache()
+    cache.put('k', [1, 2, 3])
+    assert cache.get('k', is_valid=lambda value: len(value) == 2) is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_by_entries_and_items():
+    cache = ResultCache(maxsize=2, max_items=10)
+    cache.put('a', 'a', size=4)
+    cache.put('b', 'b', size=4)
+    cache.get('a')
+    cache.put('c', 'c', size=4)
+    # 'b' era la menos usada; 'a' y 'c' suman 8 ≤ 10
+    assert cache.get('b') is None and cache.get('a') == 'a' and cache.get('c') == 'c'
+    cache.put('d', 'd', size=9)
+    assert len(cache) == 1 and cache.get('d') == 'd'
+
+
+def test_recommendations_invalidated_by_candidate_popularity(processor):
+    first = processor.get_recommendations('t0', top_n=5)
+    assert processor.get_recommendations('t0', top_n=5) == first
+    assert processor.get_stats()['cache_hits'] == 1
+
+    # Un like en una canción recomendada cambia su popularidad
+    processor.add_event('u1', first[0]['track_id'], 'like')
+    processor.get_recommendations('t0', top_n=5)
+    assert processor.get_stats()['cache_hits'] == 1
+
+
+def test_recommendations_invalidated_by_catalog_change(processor, storage):
+    processor.get_recommendations('t0', top_n=5)
+    processor.apply_catalog_changes(deleted_ids=['t199'])
+    processor.get_recommendations('t0', top_n=5)
+    stats = processor.get_stats()
+    assert stats['cache_hits'] == 0 and stats['cache_misses'] == 2
+
+
+def test_recommendations_invalidated_by_collaborative_update(storage):
+    from conftest import make_processor
+
+    processor = make_processor(storage)
+    try:
+        processor.get_recommendations('t0', top_n=5)
+        # El snapshot colaborativo nuevo cambia la parte híbrida del score
+        processor.collaborative.add_events(['u1', 'u1'], [0, 1], [3.0, 3.0])
+        processor.collaborative.update()
+        processor.get_recommendations('t0', top_n=5)
+        stats = processor.get_stats()
+        assert stats['cache_hits'] == 0 and stats['cache_misses'] == 2
+    finally:
+        processor.close()
@@ -0,0 +1,26 @@
+"""Cierre del procesador por shards y opciones que no admite"""
+
+import pytest
+
+from conftest import make_events, quiet_options
+from event_log import EventLog
+from local_storage import LocalStorage
+from sharded_processor import ShardedKappaProcessor
+
+
+def test_close_prints_stop_once(storage, capsys):
+    processor = ShardedKappaProcessor(storage=storage, n_shards=2, collaborative_weight=0, **quiet_options())
+    assert processor.load_data_from_mongodb()
+    processor.start_processing()
+    for user_id, track_id, kind in make_events(50, n_tracks=200):
+        processor.add_event(user_id, track_id, kind)
+    processor.close()
+
+    assert capsys.readouterr().out.count("Procesador detenido") == 1
+
+
+def test_event_log_is_rejected(tmp_path):
+    event_log = EventLog(str(tmp_path))
+    with pytest.raises(ValueError):
+        ShardedKappaProcessor(storage=LocalStorage(), event_log=event_log)
+    event_log.close()
@@ -0,0 +1,127 @@
+"""UserProfileStore: deltas en vuelo, lecturas solapadas con escrituras y versiones de preferencias"""
+
+import asyncio
+import threading
+
+from user_profiles import UserProfileStore, merge_profile, profile_from_doc
+
+GENRES = {'t1': 'rock', 't2': 'jazz'}
+
+
+def event(user_id, track_id, kind='play'):
+    return {'user_id': user_id, 'track_id': track_id, 'interaction_type': kind}
+
+
+class FakeStorage:
+    """Documentos de user_profiles en un dict; write_fn aplica los deltas"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def load(self, user_id):
+        return self.docs.get(user_id)
+
+    def write(self, user_ids, updates, recent_size, **options):
+        for user_id in user_ids:
+            profile = profile_from_doc(user_id, self.docs.get(user_id))
+            self.docs[user_id] = merge_profile(profile, updates[user_id], recent_size)
+
+
+def test_read_during_flush_counts_deltas_once():
+    store = UserProfileStore()
+    storage = FakeStorage()
+    store.apply_events([event('u1', 't1')] * 3, GENRES.get)
+
+    written = threading.Event()
+    release = threading.Event()
+
+    def slow_write(*args):
+        # El documento ya lleva los deltas; finish_flush todavía no ha corrido
+        storage.write(*args)
+        written.set()
+        release.wait(5)
+
+    flusher = threading.Thread(target=store.flush, args=(slow_write,))
+    flusher.start()
+    written.wait(5)
+    profile = store.get('u1', storage.load)
+    release.set()
+    flusher.join()
+
+    assert profile['total_interactions'] == 3
+    # La lectura solapada no se guarda en caché: la siguiente lee el documento
+    assert store.get('u1', storage.load)['total_interactions'] == 3
+
+
+def test_read_finishing_after_write_started_is_retried():
+    store = UserProfileStore()
+    storage = FakeStorage()
+    store.apply_events([event('u1', 't1')] * 2, GENRES.get)
+    loads = []
+
+    def load_then_flush(user_id):
+        doc = storage.load(user_id)
+        if not loads:
+            # El flush empieza y termina mientras esta lectura está en curso
+            store.flush(storage.write)
+        loads.append(doc)
+        return doc
+
+    assert store.get('u1', load_then_flush)['total_interactions'] == 2
+    assert len(loads) == 2
+
+
+def test_failed_flush_returns_deltas_to_pending():
+    store = UserProfileStore()
+    storage = FakeStorage()
+    store.apply_events([event('u1', 't1'), event('u2', 't2')], GENRES.get)
+
+    def failing_write(*args):
+        raise ConnectionError("almacenamiento caído")
+
+    assert not store.flush(failing_write)
+    assert store.get('u1', storage.load)['total_interactions'] == 1
+    assert store.flush(storage.write)
+    assert storage.docs['u1']['total_interactions'] == 1
+    assert store.writing == 0 and not store.in_flight
+
+
+def test_preference_versions_are_bounded_and_never_go_back():
+    store = UserProfileStore(cache_size=2)
+    seen = {}
+    for user_id in ['u1', 'u2', 'u3', 'u4']:
+        store.apply_events([event(user_id, 't1', 'like')], GENRES.get)
+        seen[user_id] = store.preference_version(user_id)
+
+    assert len(store.preference_versions) == 2
+    # u1 y u2 se expulsaron: su versión no vuelve a un valor ya usado con ellos
+    for user_id in ['u1', 'u2']:
+        assert store.preference_version(user_id) >= seen[user_id]
+    before = store.preference_version('u1')
+    store.apply_events([event('u1', 't2', 'like')], GENRES.get)
+    assert store.preference_version('u1') > before
+    # Sin likes, la versión no cambia
+    store.apply_events([event('u4', 't1')], GENRES.get)
+    assert store.preference_version('u4') == seen['u4']
+
+
+def test_async_flush_and_read_match_the_sync_path():
+    store = UserProfileStore()
+    storage = FakeStorage()
+    store.apply_events([event('u1', 't1', 'like'), event('u1', 't2')], GENRES.get)
+
+    async def write(*args):
+        storage.write(*args)
+
+    async def load(user_id):
+        return storage.load(user_id)
+
+    async def run():
+        assert await store.flush_async(write)
+        store.cache.clear()
+        return await store.get_async('u1', load)
+
+    profile = asyncio.run(run())
+    assert profile['total_interactions'] == 2
+    assert profile['liked_genres'] == {'rock': 1}
+    assert store.writing == 0 and not store.in_flight